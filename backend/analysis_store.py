@@ -0,0 +1,72 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+# Maximum number of analyses kept; the least recently used one is evicted first.
+DEFAULT_MAX_ANALYSES = 100
+
+# Analyses older than this many seconds are discarded.
+DEFAULT_ANALYSIS_TTL_SECONDS = 24 * 3600
+
+
+class AnalysisStore:
+    """
+    An in-memory store of finished analyses, keyed by analysis ID, with LRU and
+    TTL eviction. Lets follow-up requests (like action plans) reference an
+    analysis by ID instead of re-uploading its context.
+    """
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        """
+        Args:
+            max_entries: (Optional) The capacity. Defaults to ANALYSIS_STORE_MAX_ENTRIES.
+            ttl_seconds: (Optional) The lifetime of an entry. Defaults to ANALYSIS_STORE_TTL_SECONDS.
+        """
+        self.max_entries = max_entries or int(os.getenv("ANALYSIS_STORE_MAX_ENTRIES", DEFAULT_MAX_ANALYSES))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("ANALYSIS_STORE_TTL_SECONDS", DEFAULT_ANALYSIS_TTL_SECONDS))
+        # analysis_id -> (created_at, analysis), least recently used first.
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> None:
+        for analysis_id in [k for k, (created_at, _) in self._entries.items() if now - created_at > self.ttl_seconds]:
+            del self._entries[analysis_id]
+
+    def put(self, analysis: Dict[str, Any]) -> str:
+        """
+        Stores an analysis.
+
+        Args:
+            analysis: The analysis results, e.g. its project ID and compacted context.
+
+        Returns:
+            The new analysis ID.
+        """
+        analysis_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._entries[analysis_id] = (now, analysis)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return analysis_id
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the stored analysis, or None if it is unknown or has expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(analysis_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(analysis_id)
+            return entry[1]
+
+    def update(self, analysis_id: str, **fields: Any) -> None:
+        """Adds fields (e.g. the final report) to a stored analysis, if it still exists."""
+        with self._lock:
+            entry = self._entries.get(analysis_id)
+            if entry is not None:
+                entry[1].update(fields)
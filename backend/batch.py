@@ -0,0 +1,373 @@
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from contextlib import aclosing
+from typing import Optional, Dict, Any, List, Callable, AsyncIterator
+
+from google.cloud import resourcemanager_v3
+
+# Default number of projects analyzed at the same time in a batch.
+DEFAULT_MAX_PARALLEL_PROJECTS = 4
+
+# Per-project checkpoints and fleet reports are kept here, one directory per batch.
+DEFAULT_BATCH_DIR = os.path.join(os.path.dirname(__file__), "..", ".cache", "batches")
+
+# Number of projects listed in the fleet report's ranking of the least healthy projects.
+FLEET_REPORT_WORST_PROJECTS = 20
+
+# Analysis options that don't affect a project's result, so a batch may resume with
+# different values. All other options must match the ones the checkpoints were made with.
+RESUMABLE_OPTIONS = ("max_parallel",)
+
+
+def list_projects_under(parent: str) -> List[str]:
+    """
+    Lists the IDs of all active projects under an organization or folder, including
+    projects in nested folders.
+
+    Args:
+        parent: "organizations/<id>" or "folders/<id>".
+
+    Returns:
+        The sorted project IDs.
+    """
+    if not re.fullmatch(r"(organizations|folders)/\d+", parent):
+        raise ValueError(f"Invalid parent '{parent}'. Expected 'organizations/<id>' or 'folders/<id>'.")
+
+    projects_client = resourcemanager_v3.ProjectsClient()
+    folders_client = resourcemanager_v3.FoldersClient()
+    project_ids = []
+    parents = [parent]
+    while parents:
+        current = parents.pop()
+        for project in projects_client.list_projects(parent=current):
+            if project.state == resourcemanager_v3.Project.State.ACTIVE:
+                project_ids.append(project.project_id)
+        for folder in folders_client.list_folders(parent=current):
+            if folder.state == resourcemanager_v3.Folder.State.ACTIVE:
+                parents.append(folder.name)
+    return sorted(project_ids)
+
+
+class BatchCheckpoint:
+    """
+    Per-project results of a batch, one JSON file per project, so an interrupted
+    batch can resume with only the projects that haven't been scanned yet. The
+    analysis options the results were produced with are stored alongside them.
+    """
+    def __init__(self, batch_id: str, directory: str = None):
+        """
+        Args:
+            batch_id: Identifies the batch, e.g. the scanned organization or folder.
+            directory: (Optional) The base directory. Defaults to BATCH_DIR, then to
+                       .cache/batches in the project root.
+        """
+        base = directory or os.getenv("BATCH_DIR") or DEFAULT_BATCH_DIR
+        self.path = os.path.join(base, re.sub(r"[^A-Za-z0-9_.-]", "_", batch_id))
+        os.makedirs(os.path.join(self.path, "projects"), exist_ok=True)
+
+    def _project_path(self, project_id: str) -> str:
+        return os.path.join(self.path, "projects", f"{project_id}.json")
+
+    def _options_path(self) -> str:
+        return os.path.join(self.path, "options.json")
+
+    def _write(self, path: str, value: Any) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def load_completed(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the results of all successfully scanned projects, by project ID."""
+        completed = {}
+        projects_dir = os.path.join(self.path, "projects")
+        for file_name in os.listdir(projects_dir):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(projects_dir, file_name), encoding="utf-8") as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                continue  # A partially written checkpoint; the project is scanned again.
+            if result.get("status") == "complete":
+                completed[result["project_id"]] = result
+        return completed
+
+    def load_options(self) -> Optional[Dict[str, Any]]:
+        """Returns the analysis options the checkpoints were made with, or None if unknown."""
+        try:
+            with open(self._options_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_options(self, options: Dict[str, Any]) -> None:
+        """Records the analysis options the checkpoints are made with."""
+        self._write(self._options_path(), options)
+
+    def save(self, result: Dict[str, Any]) -> None:
+        """Stores a project's result. Failed projects are stored too, but retried on resume."""
+        self._write(self._project_path(result["project_id"]), result)
+
+    def save_fleet_report(self, fleet_report: Dict[str, Any]) -> str:
+        """Stores the aggregated fleet report and returns its path."""
+        path = os.path.join(self.path, "fleet_report.json")
+        self._write(path, fleet_report)
+        return path
+
+    def clear(self) -> None:
+        """Removes all project checkpoints and their options, so the next run starts from scratch."""
+        projects_dir = os.path.join(self.path, "projects")
+        for file_name in os.listdir(projects_dir):
+            os.remove(os.path.join(projects_dir, file_name))
+        if os.path.exists(self._options_path()):
+            os.remove(self._options_path())
+
+
+def checkpoint_options(analysis_options: Dict[str, Any]) -> Dict[str, Any]:
+    """The analysis options that a batch's checkpoints must have been made with to be reused."""
+    return {key: value for key, value in sorted(analysis_options.items()) if key not in RESUMABLE_OPTIONS}
+
+
+async def analyze_project(analyze: Callable[..., AsyncIterator[Dict[str, Any]]], project_id: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs a single project's analysis to completion and condenses its events into a result.
+
+    Args:
+        analyze: The analysis pipeline (run_analysis), an async generator of SSE events.
+        project_id: The project to analyze.
+        options: The remaining keyword arguments for `analyze`.
+
+    Returns:
+        A dict with "project_id", "status" ("complete" or "error") and, if scoring finished,
+        "score", "rule_penalties", "totals" and "report" (or "error").
+    """
+    result = {"project_id": project_id, "status": "error", "started_at": time.time()}
+    try:
+        async with aclosing(analyze(project_id=project_id, **options)) as events:
+            async for event in events:
+                data = json.loads(event["data"])
+                if event.get("event") == "score":
+                    result.update(score=data["score"], rule_penalties=data["rule_penalties"], totals=data.get("totals", {}))
+                elif event.get("event") == "update" and data.get("status") == "Complete":
+                    result.update(status="complete", analysis_id=data.get("analysis_id"), report=data.get("report"))
+                elif event.get("event") == "error":
+                    result["error"] = data.get("details")
+    except Exception as e:
+        result["error"] = str(e)
+    result["finished_at"] = time.time()
+    return result
+
+
+def build_fleet_report(parent: str, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Aggregates per-project results into a fleet-wide report.
+
+    Args:
+        parent: The scanned organization or folder.
+        results: The per-project results (output of analyze_project).
+
+    Returns:
+        A JSON-serializable dict with fleet totals, the average score, points deducted per
+        rule across the fleet, the least healthy projects and the projects that failed.
+    """
+    completed = [r for r in results if r.get("status") == "complete"]
+    failed = [{"project_id": r["project_id"], "error": r.get("error")} for r in results if r.get("status") != "complete"]
+
+    totals: Dict[str, float] = {}
+    rule_penalties: Dict[str, int] = {}
+    projects_affected: Dict[str, int] = {}
+    for result in completed:
+        for field, value in result.get("totals", {}).items():
+            totals[field] = round(totals.get(field, 0) + value, 2)
+        for rule, penalty in result.get("rule_penalties", {}).items():
+            rule_penalties[rule] = rule_penalties.get(rule, 0) + penalty
+            if penalty:
+                projects_affected[rule] = projects_affected.get(rule, 0) + 1
+
+    ranked = sorted(completed, key=lambda r: r["score"])
+    worst_projects = []
+    for result in ranked[:FLEET_REPORT_WORST_PROJECTS]:
+        report = result.get("report") or {}
+        worst_projects.append({
+            "project_id": result["project_id"],
+            "score": result["score"],
+            "health_score": report.get("health_score"),
+            "top_rules": sorted((r for r, p in result["rule_penalties"].items() if p), key=lambda r: -result["rule_penalties"][r])[:3],
+            "high_importance_findings": [f.get("title") for f in report.get("key_findings", []) if f.get("importance") == "High"],
+        })
+
+    scores = [r["score"] for r in completed]
+    return {
+        "parent": parent,
+        "generated_at": time.time(),
+        "projects_scanned": len(completed),
+        "projects_failed": len(failed),
+        "average_score": round(sum(scores) / len(scores), 1) if scores else None,
+        "min_score": min(scores) if scores else None,
+        "totals": totals,
+        "rule_penalties": rule_penalties,
+        "projects_affected_per_rule": projects_affected,
+        "worst_projects": worst_projects,
+        "failed_projects": failed,
+    }
+
+
+def get_max_parallel_projects(requested: Optional[int] = None) -> int:
+    """
+    Resolves how many projects a batch analyzes at the same time. Falls back to
+    the BATCH_MAX_PARALLEL_PROJECTS environment variable.
+    """
+    if requested is None:
+        requested = int(os.getenv("BATCH_MAX_PARALLEL_PROJECTS", DEFAULT_MAX_PARALLEL_PROJECTS))
+    return max(1, requested)
+
+
+async def run_batch(
+    analyze: Callable[..., AsyncIterator[Dict[str, Any]]],
+    parent: str,
+    analysis_options: Dict[str, Any],
+    max_parallel_projects: Optional[int] = None,
+    project_ids: Optional[List[str]] = None,
+    batch_id: Optional[str] = None,
+    restart: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Analyzes every project under an organization or folder and yields progress as SSE events.
+
+    Projects are analyzed concurrently, up to `max_parallel_projects` at a time. BigQuery
+    queries and LLM calls are additionally bounded process-wide (see backend/limits.py).
+    Each project's result is checkpointed as soon as it finishes; a batch with the same
+    ID skips projects that were already scanned successfully, unless `restart` is set.
+    Resuming with different analysis options (e.g. another collection mode) is an error,
+    since the checkpointed results wouldn't be comparable; pass `restart` to start over.
+
+    Args:
+        analyze: The analysis pipeline (run_analysis).
+        parent: "organizations/<id>" or "folders/<id>".
+        analysis_options: Keyword arguments for `analyze` besides the project ID.
+        max_parallel_projects: (Optional) Defaults to BATCH_MAX_PARALLEL_PROJECTS.
+        project_ids: (Optional) The projects to scan, instead of listing those under `parent`.
+        batch_id: (Optional) Identifies the checkpoints to resume from. Defaults to `parent`.
+        restart: Discard existing checkpoints and scan every project again.
+
+    Yields:
+        "update", "checkpoint" and "project" events; the final update carries the fleet report.
+    """
+    try:
+        yield {"event": "update", "data": json.dumps({'status': 'Starting', 'progress': 0, 'details': f'Listing projects under {parent}...'})}
+        if project_ids is None:
+            project_ids = await asyncio.to_thread(list_projects_under, parent)
+
+        checkpoint = BatchCheckpoint(batch_id or parent)
+        options = checkpoint_options(analysis_options)
+        if restart:
+            checkpoint.clear()
+        else:
+            previous_options = checkpoint.load_options()
+            if previous_options is not None and previous_options != options:
+                changed = ", ".join(
+                    f"{key}: {previous_options.get(key)!r} -> {options.get(key)!r}"
+                    for key in sorted(set(previous_options) | set(options)) if previous_options.get(key) != options.get(key)
+                )
+                raise ValueError(f"Batch '{batch_id or parent}' was checkpointed with different analysis options ({changed}). Restart it or use another batch ID.")
+        checkpoint.save_options(options)
+        results = {p: r for p, r in checkpoint.load_completed().items() if p in project_ids}
+        pending = [p for p in project_ids if p not in results]
+        yield {"event": "checkpoint", "data": json.dumps({'text': f'Found {len(project_ids)} projects; {len(results)} already scanned, {len(pending)} to go.'})}
+
+        semaphore = asyncio.Semaphore(get_max_parallel_projects(max_parallel_projects))
+
+        async def scan(project_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                result = await analyze_project(analyze, project_id, analysis_options)
+            await asyncio.to_thread(checkpoint.save, result)
+            return result
+
+        tasks = [asyncio.create_task(scan(p)) for p in pending]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                results[result["project_id"]] = result
+                progress = int(len(results) / len(project_ids) * 100) if project_ids else 100
+                yield {"event": "project", "data": json.dumps({k: v for k, v in result.items() if k != "report"})}
+                yield {"event": "update", "data": json.dumps({'status': 'Scanning', 'progress': progress, 'details': f'Scanned {result["project_id"]} ({len(results)}/{len(project_ids)})'})}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        fleet_report = build_fleet_report(parent, [results[p] for p in project_ids])
+        report_path = await asyncio.to_thread(checkpoint.save_fleet_report, fleet_report)
+        yield {"event": "checkpoint", "data": json.dumps({'text': f'Fleet report written to {report_path}.'})}
+        yield {"event": "update", "data": json.dumps({'status': 'Complete', 'progress': 100, 'fleet_report': fleet_report})}
+
+    except Exception as e:
+        yield {"event": "error", "data": json.dumps({'status': 'Error', 'details': f"An error occurred during the batch scan: {e}"})}
+
+
+def main():
+    """Command-line entry point: scans all projects under an organization or folder."""
+    parser = argparse.ArgumentParser(description="Scan every BigQuery project under an organization or folder.")
+    parser.add_argument("parent", help="'organizations/<id>' or 'folders/<id>'")
+    parser.add_argument("--projects", help="Comma-separated project IDs to scan instead of listing them under the parent.")
+    parser.add_argument("--parallel-projects", type=int, help="Projects analyzed at the same time (default: BATCH_MAX_PARALLEL_PROJECTS).")
+    parser.add_argument("--parallelism", type=int, help="Datasets fetched at the same time per project (default: BQ_MAX_PARALLEL_DATASETS).")
+    parser.add_argument("--collection-mode", help="'dataset' or 'bulk' (default: BQ_COLLECTION_MODE).")
+    parser.add_argument("--column-source", help="'ddl' or 'column_field_paths' (default: BQ_COLUMN_METADATA_SOURCE).")
+    parser.add_argument("--workload-days", type=int, help="Days of query history to analyze, 0 to skip (default: BQ_WORKLOAD_WINDOW_DAYS).")
+    parser.add_argument("--discovery-mode", help="'direct' or 'agent' (default: DISCOVERY_MODE).")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached metadata snapshots.")
+    parser.add_argument("--no-reports", action="store_true", help="Only score projects; skip the AI report and reading list.")
+    parser.add_argument("--batch-id", help="Checkpoint ID to resume from (default: the parent).")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and scan every project again.")
+    parser.add_argument("--output", help="Write the fleet report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    # Imported here so that importing this module doesn't create the API app.
+    from backend.main import run_analysis, get_discovery_mode
+    from backend.collector import get_max_parallel_datasets, get_collection_mode, get_column_metadata_source
+    from backend.workload import get_workload_window_days
+
+    analysis_options = {
+        "max_parallel": get_max_parallel_datasets(args.parallelism),
+        "collection_mode": get_collection_mode(args.collection_mode),
+        "column_source": get_column_metadata_source(args.column_source),
+        "workload_days": get_workload_window_days(args.workload_days),
+        "discovery_mode": get_discovery_mode(args.discovery_mode),
+        "force_refresh": args.refresh,
+        "generate_reports": not args.no_reports,
+    }
+    project_ids = [p.strip() for p in args.projects.split(",") if p.strip()] if args.projects else None
+
+    async def consume() -> Optional[Dict[str, Any]]:
+        async for event in run_batch(run_analysis, args.parent, analysis_options, args.parallel_projects, project_ids, args.batch_id, args.restart):
+            data = json.loads(event["data"])
+            if event["event"] == "error":
+                print(data["details"], file=sys.stderr)
+                return None
+            if event["event"] == "checkpoint":
+                print(data["text"], file=sys.stderr)
+            elif event["event"] == "project":
+                outcome = f"score {data['score']}" if data["status"] == "complete" else f"failed: {data.get('error')}"
+                print(f"{data['project_id']}: {outcome}", file=sys.stderr)
+            elif event["event"] == "update" and data.get("status") == "Complete":
+                return data["fleet_report"]
+        return None
+
+    fleet_report = asyncio.run(consume())
+    if fleet_report is None:
+        sys.exit(1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(fleet_report, f, indent=2)
+    else:
+        print(json.dumps(fleet_report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
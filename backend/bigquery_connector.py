@@ -1,9 +1,96 @@
 import os
+import time
+import threading
+from typing import Dict, Any, Callable
 from google.cloud import bigquery
 from dotenv import load_dotenv
+import re
+from backend.limits import bigquery_query_slots, bigquery_scheduler
+from backend.metrics import span, Span
+
+# The Arrow fetch path is optional: install the "arrow" extra (pyarrow and
+# google-cloud-bigquery-storage) to read large results through the Storage Read API.
+try:
+    import pyarrow  # noqa: F401
+    from google.cloud import bigquery_storage
+    ARROW_AVAILABLE = True
+except ImportError:
+    bigquery_storage = None
+    ARROW_AVAILABLE = False
 
 load_dotenv()
 
+def get_bigquery_backend() -> str:
+    """Returns the BigQuery backend from BQ_BACKEND: "bigquery" (the default) or "fake"."""
+    return (os.getenv("BQ_BACKEND") or "bigquery").lower()
+
+
+# Pooled clients unused for longer than this many seconds are evicted.
+DEFAULT_CLIENT_IDLE_SECONDS = 600
+
+# Process-wide pool of clients keyed by (project, location). Each entry is
+# [client, last_used_monotonic_time]. Guarded by _client_pool_lock.
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+
+
+def get_pooled_client(project_id: str, location: str) -> bigquery.Client:
+    """
+    Returns a shared BigQuery client for the given project and location,
+    creating it on first use.
+
+    Reusing clients keeps their credentials, HTTP session and connections alive
+    across datasets, regions and concurrent analyses. Clients that have been idle
+    for longer than BQ_CLIENT_IDLE_SECONDS are dropped from the pool.
+
+    Args:
+        project_id: The GCP project ID.
+        location: The BigQuery location (region) the client routes queries to.
+
+    Returns:
+        A bigquery.Client, safe to share between threads.
+    """
+    idle_seconds = float(os.getenv("BQ_CLIENT_IDLE_SECONDS", DEFAULT_CLIENT_IDLE_SECONDS))
+    key = (project_id, location)
+    now = time.monotonic()
+    with _client_pool_lock:
+        # Evict idle clients. They are only dropped from the pool, not closed, since a
+        # connector created earlier may still be using one for a long-running query.
+        for idle_key in [k for k, (_, last_used) in _client_pool.items() if now - last_used > idle_seconds]:
+            del _client_pool[idle_key]
+
+        entry = _client_pool.get(key)
+        if entry is None:
+            # BQ_BACKEND=fake serves synthetic metadata offline, e.g. for benchmarks.
+            if get_bigquery_backend() == "fake":
+                from backend.fake_backend import FakeBigQueryClient
+                client = FakeBigQueryClient(project=project_id, location=location)
+            else:
+                client = bigquery.Client(project=project_id, location=location)
+            entry = [client, now]
+            _client_pool[key] = entry
+        entry[1] = now
+        return entry[0]
+
+
+_storage_client = None
+_storage_client_lock = threading.Lock()
+
+
+def get_storage_client():
+    """
+    Returns the shared BigQuery Storage Read API client, or None if the Arrow fetch
+    path is unavailable or disabled with BQ_USE_STORAGE_API=false.
+    """
+    global _storage_client
+    if not ARROW_AVAILABLE or get_bigquery_backend() == "fake" or os.getenv("BQ_USE_STORAGE_API", "true").lower() not in ("1", "true", "yes"):
+        return None
+    with _storage_client_lock:
+        if _storage_client is None:
+            _storage_client = bigquery_storage.BigQueryReadClient()
+        return _storage_client
+
+
 class BigQueryConnector:
     """
     A class to handle the connection to Google BigQuery and execute queries.
@@ -25,7 +112,36 @@ class BigQueryConnector:
         if not self.project_id or not self.region:
             raise ValueError("GOOGLE_CLOUD_PROJECT and GOOGLE_CLOUD_REGION must be set.")
         
-        self.client = bigquery.Client(project=self.project_id, location=self.region)
+        self.client = get_pooled_client(self.project_id, self.region)
+
+    def _run_query(self, query: str, fetch: Callable[[Any, Any, Span], Any]) -> Any:
+        """
+        Runs a query job and returns what `fetch(query_job, results, query_span)` makes of it.
+
+        Every attempt is paced by the shared BigQuery scheduler and may take at most
+        BQ_TIMEOUT_SECONDS; a job that runs longer is cancelled. Attempts that fail with
+        a rate-limit, per-minute quota or backend error are retried with backoff. The query is
+        recorded as one span, with the number of retries.
+        """
+        with span("bigquery.query", _query_target(query), region=self.region) as query_span:
+            def attempt():
+                # Queries from all analyses share a global limit (BQ_MAX_CONCURRENT_QUERIES).
+                with bigquery_query_slots:
+                    query_span.set(queued_ms=query_span.elapsed_ms())
+                    # The client is initialized with the correct location (region),
+                    # so BigQuery will route the query to the appropriate endpoint.
+                    # No need to specify the region in the SQL string itself.
+                    query_job = self.client.query(query)  # API request.
+                    try:
+                        results = query_job.result(timeout=bigquery_scheduler.timeout)  # Waits for the job to complete.
+                    except TimeoutError:
+                        # Don't leave the abandoned job running in BigQuery.
+                        query_job.cancel()
+                        raise TimeoutError(f"Query job {query_job.job_id} did not finish within {bigquery_scheduler.timeout:g} seconds.")
+                    _record_job(query_span, query_job)
+                    return fetch(query_job, results, query_span)
+
+            return bigquery_scheduler.call(attempt, on_retry=lambda retries: query_span.set(retries=retries))
 
     def execute_query(self, query: str):
         """
@@ -38,19 +154,94 @@ class BigQueryConnector:
             A list of rows, where each row is a dictionary-like object.
             Returns an empty list if the query fails or returns no results.
         """
+        def fetch_rows(query_job, results, query_span: Span) -> list:
+            rows = [dict(row) for row in results]
+            query_span.set(rows=len(rows))
+            return rows
+
         try:
-            # The client is initialized with the correct location (region),
-            # so BigQuery will route the query to the appropriate endpoint.
-            # No need to specify the region in the SQL string itself.
-            query_job = self.client.query(query)  # API request.
-            results = query_job.result()  # Waits for the job to complete.
-            return [dict(row) for row in results]
+            return self._run_query(query, fetch_rows)
         except Exception as e:
             # Log the error for server-side debugging, but also raise it so the
             # calling tool can handle it and report it to the agent.
             print(f"An error occurred while executing the query: {e}")
             raise e
 
+    def execute_query_columns(self, query: str) -> Dict[str, list]:
+        """
+        Executes a SQL query in BigQuery and returns the results column by column,
+        without building a dict per row.
+
+        With the "arrow" extra installed, results are downloaded as Arrow record batches,
+        through the Storage Read API for large results. Otherwise (or if the Arrow
+        download fails) the result pages are transposed into columns one at a time.
+
+        Args:
+            query: The SQL query string to execute.
+
+        Returns:
+            A dict mapping each result column name to the list of its values.
+        """
+        def fetch_columns(query_job, results, query_span: Span) -> Dict[str, list]:
+            storage_client = get_storage_client()
+            if storage_client is not None:
+                try:
+                    columns = results.to_arrow(bqstorage_client=storage_client).to_pydict()
+                    query_span.set(rows=results.total_rows, fetch="arrow")
+                    return columns
+                except Exception as e:
+                    # E.g. missing bigquery.readsessions.create permission. Re-read the
+                    # (cached) results page by page instead.
+                    print(f"Arrow fetch failed, falling back to paged results: {e}")
+                    results = query_job.result()
+            query_span.set(rows=results.total_rows, fetch="pages")
+            return _columns_from_pages(results)
+
+        try:
+            return self._run_query(query, fetch_columns)
+        except Exception as e:
+            print(f"An error occurred while executing the query: {e}")
+            raise e
+
+    def list_dataset_ids(self) -> list:
+        """
+        Lists the IDs of all datasets in the project, using the (global) dataset-list
+        API rather than a regional INFORMATION_SCHEMA query.
+        """
+        return [dataset.dataset_id for dataset in self.client.list_datasets(project=self.project_id)]
+
+    def get_dataset_location(self, dataset_id: str) -> str:
+        """Returns the location of one dataset in the project (e.g. "US", "europe-west1")."""
+        return self.client.get_dataset(f"{self.project_id}.{dataset_id}").location
+
+_VIEW_RE = re.compile(r"INFORMATION_SCHEMA\.(\w+)", re.IGNORECASE)
+
+
+def _query_target(query: str) -> str:
+    """Names a query for metrics after the first INFORMATION_SCHEMA view it reads."""
+    match = _VIEW_RE.search(query)
+    return match.group(1).upper() if match else "query"
+
+
+def _record_job(query_span: Span, query_job) -> None:
+    """Copies a finished job's statistics onto its span."""
+    query_span.set(
+        job_id=getattr(query_job, "job_id", None),
+        bytes_processed=getattr(query_job, "total_bytes_processed", None),
+        slot_ms=getattr(query_job, "slot_millis", None),
+        cache_hit=getattr(query_job, "cache_hit", None),
+    )
+
+
+def _columns_from_pages(results) -> Dict[str, list]:
+    """Transposes a RowIterator's pages into columns, one page at a time."""
+    names = [field.name for field in results.schema]
+    columns = {name: [] for name in names}
+    for page in results.pages:
+        for name, values in zip(names, zip(*(row.values() for row in page))):
+            columns[name].extend(values)
+    return columns
+
 if __name__ == '__main__':
     # Example usage:
     # Ensure you have a .env file with GOOGLE_CLOUD_PROJECT set
@@ -0,0 +1,158 @@
+import os
+import json
+import asyncio
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+from backend.tools import get_dataset_and_table_details, get_region_dataset_details, COLUMN_METADATA_SOURCES
+
+# Default number of datasets whose metadata is fetched at the same time.
+DEFAULT_MAX_PARALLEL_DATASETS = 8
+
+# "dataset" runs four queries per dataset; "bulk" runs one region-wide query per view.
+COLLECTION_MODES = ("dataset", "bulk")
+
+
+def get_max_parallel_datasets(requested: Optional[int] = None) -> int:
+    """
+    Resolves the parallelism limit for metadata collection.
+
+    Args:
+        requested: (Optional) A limit requested by the caller, e.g. from a query parameter.
+                   If None, falls back to the BQ_MAX_PARALLEL_DATASETS environment variable.
+
+    Returns:
+        A positive integer limit.
+    """
+    if requested is None:
+        requested = int(os.getenv("BQ_MAX_PARALLEL_DATASETS", DEFAULT_MAX_PARALLEL_DATASETS))
+    return max(1, requested)
+
+
+def get_collection_mode(requested: Optional[str] = None) -> str:
+    """
+    Resolves the metadata collection mode.
+
+    Args:
+        requested: (Optional) A mode requested by the caller. If None, falls back to
+                   the BQ_COLLECTION_MODE environment variable, then to "dataset".
+
+    Returns:
+        One of COLLECTION_MODES.
+    """
+    mode = (requested or os.getenv("BQ_COLLECTION_MODE") or "dataset").lower()
+    if mode not in COLLECTION_MODES:
+        raise ValueError(f"Unknown collection mode '{mode}'. Expected one of: {', '.join(COLLECTION_MODES)}.")
+    return mode
+
+
+def get_column_metadata_source(requested: Optional[str] = None) -> str:
+    """
+    Resolves where column descriptions are collected from.
+
+    Args:
+        requested: (Optional) A source requested by the caller. If None, falls back to
+                   the BQ_COLUMN_METADATA_SOURCE environment variable, then to "ddl".
+
+    Returns:
+        One of COLUMN_METADATA_SOURCES.
+    """
+    source = (requested or os.getenv("BQ_COLUMN_METADATA_SOURCE") or "ddl").lower()
+    if source not in COLUMN_METADATA_SOURCES:
+        raise ValueError(f"Unknown column metadata source '{source}'. Expected one of: {', '.join(COLUMN_METADATA_SOURCES)}.")
+    return source
+
+
+async def collect_dataset_details(
+    project_id: str,
+    datasets: List[Dict[str, Any]],
+    default_region: str,
+    max_parallel: int,
+    mode: str = "dataset",
+    column_source: str = "ddl",
+) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Fetches the details of many datasets with bounded concurrency.
+
+    The blocking BigQuery calls run in worker threads so the event loop stays
+    free for other requests. Results are yielded as soon as each dataset
+    finishes, not in the order of `datasets`.
+
+    Args:
+        project_id: The GCP project ID.
+        datasets: The discovered datasets, each a dict with "schema_name" and optionally "region".
+        default_region: The region used for datasets without a discovered region.
+        max_parallel: The maximum number of datasets (or regions, in bulk mode) fetched at the same time.
+        mode: "dataset" to query each dataset separately, or "bulk" to query each region once
+              and split the results by dataset.
+        column_source: "ddl" or "column_field_paths"; see get_column_metadata_source.
+
+    Yields:
+        (dataset_info, dataset_details) tuples. `dataset_details` is the parsed output of
+        get_dataset_and_table_details and may contain an "error" key.
+    """
+    if mode == "bulk":
+        async for result in _collect_by_region(project_id, datasets, default_region, max_parallel, column_source):
+            yield result
+        return
+
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def fetch(dataset_info: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        async with semaphore:
+            details_json_str = await asyncio.to_thread(
+                get_dataset_and_table_details,
+                project_id=project_id,
+                dataset_name=dataset_info["schema_name"],
+                region=dataset_info.get("region", default_region),
+                column_source=column_source,
+            )
+        return dataset_info, json.loads(details_json_str)
+
+    tasks = [asyncio.create_task(fetch(d)) for d in datasets if d.get("schema_name")]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # If the consumer stops early (e.g. the client disconnected), don't start
+        # any of the remaining fetches.
+        for task in tasks:
+            task.cancel()
+
+
+async def _collect_by_region(
+    project_id: str,
+    datasets: List[Dict[str, Any]],
+    default_region: str,
+    max_parallel: int,
+    column_source: str = "ddl",
+) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Bulk variant of collect_dataset_details: one set of region-wide queries per region."""
+    datasets_by_region: Dict[str, List[Dict[str, Any]]] = {}
+    for dataset_info in datasets:
+        if dataset_info.get("schema_name"):
+            datasets_by_region.setdefault(dataset_info.get("region", default_region), []).append(dataset_info)
+
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def fetch(region: str, region_datasets: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        async with semaphore:
+            details_json_str = await asyncio.to_thread(
+                get_region_dataset_details,
+                project_id=project_id,
+                region=region,
+                dataset_names=[d["schema_name"] for d in region_datasets],
+                column_source=column_source,
+            )
+        region_details = json.loads(details_json_str)
+        if isinstance(region_details.get("error"), str):
+            # Report the region's failure against each of its datasets.
+            return [(d, region_details) for d in region_datasets]
+        return [(d, region_details[d["schema_name"]]) for d in region_datasets]
+
+    tasks = [asyncio.create_task(fetch(r, ds)) for r, ds in datasets_by_region.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for result in await next_done:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
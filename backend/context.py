@@ -0,0 +1,228 @@
+import os
+import json
+import heapq
+from typing import Optional, Dict, Any, List
+from backend.scoring import ScoringEngine
+from backend.cost_model import dataset_storage_costs, rank_billing_savings, get_savings_limit
+
+# How many of the most penalized tables are kept with their full metadata.
+DEFAULT_TOP_K_TABLES = 25
+
+# Detailed tables kept before datasets start being dropped to meet the budget.
+MIN_TOP_TABLES = 5
+
+# Upper bound on the size of the compacted context, in (estimated) tokens.
+DEFAULT_CONTEXT_TOKEN_BUDGET = 30000
+
+# Rough characters-per-token ratio used to estimate prompt size from JSON length.
+CHARS_PER_TOKEN = 4
+
+# Number of tables listed by the query workload they caused (most GB processed first).
+DEFAULT_HOTTEST_TABLES = 10
+
+# Table fields kept for the top offending tables. Raw DDL is always dropped.
+TABLE_FIELDS = (
+    "table_name", "table_type", "rows", "logical_gb", "billable_gb", "partitioning_info",
+    "clustering_info", "last_modified", "has_table_description", "column_description_completeness",
+    "query_count", "gb_processed", "slot_hours", "full_scans",
+)
+
+
+def estimate_tokens(value: Any) -> int:
+    """Estimates the number of tokens `value` takes up when embedded in a prompt as compact JSON."""
+    return len(json.dumps(value, separators=(",", ":"), default=str)) // CHARS_PER_TOKEN
+
+
+def _dataset_stats(dataset: Dict[str, Any], penalty: int) -> Dict[str, Any]:
+    """Aggregates a dataset's tables into a handful of statistics."""
+    tables = dataset.get("tables", [])
+    completeness = [t.get("column_description_completeness", 0) for t in tables]
+    stats = {
+        "schema_name": dataset.get("schema_name"),
+        "has_dataset_description": bool(dataset.get("has_dataset_description")),
+        "table_count": len(tables),
+        "view_count": sum(1 for t in tables if t.get("table_type") == "VIEW"),
+        "total_rows": sum(t.get("rows") or 0 for t in tables),
+        "logical_gb": round(sum(t.get("logical_gb") or 0 for t in tables), 2),
+        "billable_gb": round(sum(t.get("billable_gb") or 0 for t in tables), 2),
+        "partitioned_tables": sum(1 for t in tables if t.get("partitioning_info")),
+        "clustered_tables": sum(1 for t in tables if t.get("clustering_info")),
+        "described_tables": sum(1 for t in tables if t.get("has_table_description")),
+        "avg_column_description_completeness": round(sum(completeness) / len(completeness), 2) if completeness else None,
+        "penalty": penalty,
+        # Monthly storage cost under the dataset's billing model and under both models.
+        **dataset_storage_costs(dataset),
+    }
+    if dataset.get("collection_errors"):
+        # The statistics (and rules) that depend on these views are incomplete.
+        stats["unavailable_views"] = [error["view"] for error in dataset["collection_errors"]]
+    return stats
+
+
+class ContextBuilder:
+    """
+    Builds the compacted LLM context incrementally, one dataset at a time.
+
+    Only aggregate statistics per dataset and the current top tables are kept, so
+    each dataset's full metadata can be discarded once it has been added.
+    """
+    def __init__(self, top_k: Optional[int] = None, token_budget: Optional[int] = None):
+        """
+        Args:
+            top_k: (Optional) How many tables to keep in detail. Defaults to CONTEXT_TOP_K_TABLES.
+            token_budget: (Optional) The maximum estimated size in tokens. Defaults to CONTEXT_TOKEN_BUDGET.
+        """
+        self.top_k = top_k if top_k is not None else int(os.getenv("CONTEXT_TOP_K_TABLES", DEFAULT_TOP_K_TABLES))
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_TOKEN_BUDGET))
+        self.datasets: List[Dict[str, Any]] = []
+        # Min-heaps of (sort key, -position, entry), so the earliest table wins ties.
+        self._top_tables: List[tuple] = []
+        self._hottest_tables: List[tuple] = []
+        self._position = 0
+        self._tables_with_issues = 0
+        self._queried_tables = 0
+        self._gb_processed = 0
+        self._slot_hours = 0
+
+    def _offer(self, heap: List[tuple], limit: int, key: float, make_entry) -> None:
+        """Keeps the `limit` entries with the highest keys. `make_entry` is only called if the table makes the cut."""
+        item = (key, -self._position)
+        if len(heap) < limit:
+            heapq.heappush(heap, item + (make_entry(),))
+        elif limit and item > heap[0][:2]:
+            heapq.heapreplace(heap, item + (make_entry(),))
+
+    def add(self, dataset: Dict[str, Any], penalty: int, table_penalties: List[Dict[str, int]]) -> None:
+        """
+        Adds one dataset.
+
+        Args:
+            dataset: The collected details of the dataset.
+            penalty: The points deducted for the dataset (all its rule matches).
+            table_penalties: The matched rules and penalties of each of its tables, in order.
+        """
+        dataset_name = dataset.get("schema_name")
+        self.datasets.append(_dataset_stats(dataset, penalty))
+        for table, matched in zip(dataset.get("tables", []), table_penalties):
+            self._position += 1
+            gb_processed = table.get("gb_processed")
+            if gb_processed:
+                self._queried_tables += 1
+                self._gb_processed += gb_processed
+                self._slot_hours += table.get("slot_hours") or 0
+                self._offer(self._hottest_tables, DEFAULT_HOTTEST_TABLES, gb_processed, lambda: {
+                    "dataset": dataset_name, **{field: table[field] for field in TABLE_FIELDS if field in table}
+                })
+            if matched:
+                self._tables_with_issues += 1
+
+                def make_entry():
+                    entry = {"dataset": dataset_name}
+                    entry.update({field: table[field] for field in TABLE_FIELDS if field in table})
+                    entry["penalty"] = sum(matched.values())
+                    entry["rules"] = sorted(matched)
+                    return entry
+                self._offer(self._top_tables, self.top_k, sum(matched.values()), make_entry)
+
+    def build(self, breakdown: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Assembles the context from the datasets added so far and enforces the token budget.
+
+        Args:
+            breakdown: The score breakdown of the same datasets (see ScoringEngine.score).
+
+        Returns:
+            The compacted context; see compact_environment.
+        """
+        datasets = sorted(self.datasets, key=lambda d: d["penalty"], reverse=True)
+
+        totals = {
+            "datasets": len(datasets),
+            "tables": sum(d["table_count"] for d in datasets),
+            "views": sum(d["view_count"] for d in datasets),
+            "logical_gb": round(sum(d["logical_gb"] for d in datasets), 2),
+            "billable_gb": round(sum(d["billable_gb"] for d in datasets), 2),
+            "partitioned_tables": sum(d["partitioned_tables"] for d in datasets),
+            "tables_with_issues": self._tables_with_issues,
+        }
+        degraded = sum(1 for d in datasets if d.get("unavailable_views"))
+        if degraded:
+            totals["datasets_with_missing_metadata"] = degraded
+        # Datasets with an unknown billing model have no current cost.
+        totals["monthly_storage_cost"] = round(sum(d["monthly_cost"] for d in datasets if d["monthly_cost"] is not None), 2)
+        # Ranked before datasets are cut to the token budget, so no saving is missed.
+        all_savings = rank_billing_savings(datasets, limit=len(datasets))
+        billing_savings = all_savings[:get_savings_limit()]
+        if all_savings:
+            totals["potential_monthly_storage_savings"] = round(sum(entry["monthly_savings"] for entry in all_savings), 2)
+        if self._queried_tables:
+            totals["gb_processed"] = round(self._gb_processed, 2)
+            totals["slot_hours"] = round(self._slot_hours, 2)
+
+        context = {
+            "totals": totals,
+            "rule_penalties": breakdown["rule_penalties"],
+            "datasets": datasets,
+            "top_offending_tables": [entry for _, _, entry in sorted(self._top_tables, reverse=True)],
+        }
+
+        # The datasets whose storage would be cheaper under the other billing model.
+        if billing_savings:
+            context["billing_model_savings"] = billing_savings
+
+        # The tables that cost the most to query, whether or not any rule matched them.
+        if self._hottest_tables:
+            context["hottest_tables"] = [entry for _, _, entry in sorted(self._hottest_tables, reverse=True)]
+
+        # Enforce the token budget: first fewer detailed tables (down to a handful),
+        # then fewer datasets, then no detailed tables at all.
+        while estimate_tokens(context) > self.token_budget and len(context["top_offending_tables"]) > MIN_TOP_TABLES:
+            context["top_offending_tables"] = context["top_offending_tables"][:max(MIN_TOP_TABLES, len(context["top_offending_tables"]) // 2)]
+        while estimate_tokens(context) > self.token_budget and context["datasets"]:
+            keep = len(context["datasets"]) // 2
+            context["omitted_datasets"] = len(datasets) - keep
+            context["datasets"] = context["datasets"][:keep]
+        if estimate_tokens(context) > self.token_budget:
+            context["top_offending_tables"] = []
+
+        return context
+
+
+def compact_environment(
+    all_data: List[Dict[str, Any]],
+    engine: Optional[ScoringEngine] = None,
+    top_k: Optional[int] = None,
+    token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Condenses the collected metadata into a bounded context for the LLM agents.
+
+    Raw DDL is dropped, every dataset is reduced to aggregate statistics, and only
+    the `top_k` tables with the highest rule penalties are kept in detail. If the
+    result is still larger than `token_budget`, the number of detailed tables and
+    then the number of listed datasets (least penalized first) are cut until it fits.
+    To compact datasets as they are collected, use ContextBuilder directly.
+
+    Args:
+        all_data: The collected dataset details (output of get_dataset_and_table_details).
+        engine: (Optional) A ScoringEngine over `all_data`, to reuse its cached rule matches.
+        top_k: (Optional) How many tables to keep in detail. Defaults to CONTEXT_TOP_K_TABLES.
+        token_budget: (Optional) The maximum estimated size in tokens. Defaults to CONTEXT_TOKEN_BUDGET.
+
+    Returns:
+        A JSON-serializable dict with "totals", "rule_penalties", "datasets" and
+        "top_offending_tables" (plus "omitted_datasets" if any datasets had to be cut,
+        and "hottest_tables" if query workload was collected).
+    """
+    engine = engine or ScoringEngine(all_data)
+    breakdown = engine.score()
+    table_penalties = engine.table_penalties()
+
+    builder = ContextBuilder(top_k, token_budget)
+    position = 0
+    for dataset in all_data:
+        table_count = len(dataset.get("tables", []))
+        penalty = sum(breakdown["dataset_penalties"].get(dataset.get("schema_name"), {}).values())
+        builder.add(dataset, penalty, table_penalties[position:position + table_count])
+        position += table_count
+    return builder.build(breakdown)
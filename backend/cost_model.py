@@ -0,0 +1,158 @@
+import os
+import re
+from typing import Optional, Dict, Any, List
+
+# On-demand storage list prices in USD per GiB and month (US multi-region). Long-term
+# storage is data not modified for 90 days. Override per region with STORAGE_PRICE_*.
+DEFAULT_STORAGE_PRICES = {
+    "logical_active": 0.02,
+    "logical_long_term": 0.01,
+    "physical_active": 0.04,
+    "physical_long_term": 0.02,
+}
+
+# The storage billing models a dataset can use. Datasets without the option are billed logically.
+BILLING_MODELS = ("LOGICAL", "PHYSICAL")
+
+# Datasets whose storage would cost less than this (in USD per month) under the other
+# billing model aren't listed as savings.
+DEFAULT_MIN_MONTHLY_SAVINGS = 1
+
+# Number of datasets listed with their savings from switching billing model.
+DEFAULT_SAVINGS_LIMIT = 10
+
+# TABLE_STORAGE columns the cost model reads.
+STORAGE_BYTE_COLUMNS = (
+    "active_logical_bytes", "long_term_logical_bytes", "active_physical_bytes",
+    "long_term_physical_bytes", "time_travel_physical_bytes", "fail_safe_physical_bytes",
+)
+
+# The storage_billing_model option in a dataset's DDL.
+_BILLING_MODEL_RE = re.compile(r"""\bstorage_billing_model\s*=\s*["']?(\w+)""", re.IGNORECASE)
+
+_GIB = 1024 ** 3
+
+
+def get_storage_prices() -> Dict[str, float]:
+    """
+    Returns the storage prices, from STORAGE_PRICE_LOGICAL_ACTIVE, STORAGE_PRICE_LOGICAL_LONG_TERM,
+    STORAGE_PRICE_PHYSICAL_ACTIVE and STORAGE_PRICE_PHYSICAL_LONG_TERM, falling back to
+    the US multi-region list prices.
+    """
+    return {key: float(os.getenv(f"STORAGE_PRICE_{key.upper()}", price)) for key, price in DEFAULT_STORAGE_PRICES.items()}
+
+
+def get_savings_limit() -> int:
+    """Returns how many datasets are listed with their billing model savings, from STORAGE_SAVINGS_LIMIT."""
+    return int(os.getenv("STORAGE_SAVINGS_LIMIT", DEFAULT_SAVINGS_LIMIT))
+
+
+def normalize_billing_model(value: Optional[str]) -> str:
+    """Maps a storage_billing_model option value (possibly quoted, or missing) to one of BILLING_MODELS."""
+    model = (value or "").strip("\"' ").upper()
+    return model if model in BILLING_MODELS else "LOGICAL"
+
+
+def billing_model_from_ddl(ddl: Optional[str]) -> str:
+    """Reads a dataset's storage billing model from its CREATE SCHEMA DDL."""
+    match = _BILLING_MODEL_RE.search(ddl or "")
+    return normalize_billing_model(match.group(1) if match else None)
+
+
+def storage_cost_columns(columns: Dict[str, list], prices: Optional[Dict[str, float]] = None) -> Dict[str, list]:
+    """
+    Computes the monthly storage cost of every table under both billing models from
+    INFORMATION_SCHEMA.TABLE_STORAGE results, as returned by execute_query_columns.
+    This is plain Python over lists, one comprehension per output column.
+
+    Logical billing charges the uncompressed active and long-term bytes. Physical billing
+    charges the compressed bytes, including time travel (part of the active bytes) and
+    fail-safe storage, which is charged at the active rate.
+
+    Args:
+        columns: TABLE_STORAGE columns, including STORAGE_BYTE_COLUMNS.
+        prices: (Optional) Prices as returned by get_storage_prices. Defaults to get_storage_prices().
+
+    Returns:
+        Columns "monthly_cost_logical" and "monthly_cost_physical" (USD) and
+        "time_travel_gb" and "fail_safe_gb", aligned with the input rows.
+    """
+    prices = prices or get_storage_prices()
+    active_logical, long_term_logical, active_physical, long_term_physical, time_travel, fail_safe = (
+        [(value or 0) / _GIB for value in columns[name]] for name in STORAGE_BYTE_COLUMNS
+    )
+    return {
+        "monthly_cost_logical": [
+            round(active * prices["logical_active"] + long_term * prices["logical_long_term"], 4)
+            for active, long_term in zip(active_logical, long_term_logical)
+        ],
+        "monthly_cost_physical": [
+            round((active + safe) * prices["physical_active"] + long_term * prices["physical_long_term"], 4)
+            for active, long_term, safe in zip(active_physical, long_term_physical, fail_safe)
+        ],
+        "time_travel_gb": [round(gb, 2) for gb in time_travel],
+        "fail_safe_gb": [round(gb, 2) for gb in fail_safe],
+    }
+
+
+def dataset_storage_costs(dataset: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Sums a dataset's table costs under both billing models.
+
+    Returns:
+        A dict with the dataset's "billing_model", "monthly_cost" under that model,
+        "monthly_cost_logical", "monthly_cost_physical", and the "time_travel_gb" and
+        "fail_safe_gb" that physical billing charges for. If the billing model could not
+        be collected (it is listed in the dataset's "collection_errors"), "billing_model"
+        and "monthly_cost" are None.
+    """
+    tables = dataset.get("tables", [])
+    costs = {
+        field: round(sum(t.get(field) or 0 for t in tables), 2)
+        for field in ("monthly_cost_logical", "monthly_cost_physical", "time_travel_gb", "fail_safe_gb")
+    }
+    if any("storage_billing_model" in error.get("fields", []) for error in dataset.get("collection_errors", [])):
+        # A missing option would otherwise read as the default, logical billing.
+        return {"billing_model": None, "monthly_cost": None, **costs}
+    billing_model = normalize_billing_model(dataset.get("storage_billing_model"))
+    current = costs["monthly_cost_physical"] if billing_model == "PHYSICAL" else costs["monthly_cost_logical"]
+    return {"billing_model": billing_model, "monthly_cost": current, **costs}
+
+
+def rank_billing_savings(datasets: List[Dict[str, Any]], limit: Optional[int] = None, min_savings: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Ranks the datasets whose storage would be cheaper under the other billing model.
+
+    Datasets whose billing model is unknown are left out.
+
+    Args:
+        datasets: Per-dataset costs, each with "schema_name" and the fields of dataset_storage_costs.
+        limit: (Optional) How many datasets to return. Defaults to get_savings_limit().
+        min_savings: (Optional) The smallest monthly saving (USD) listed. Defaults to STORAGE_MIN_MONTHLY_SAVINGS.
+
+    Returns:
+        Up to `limit` dicts with "schema_name", "current_model", "recommended_model",
+        "current_monthly_cost", "recommended_monthly_cost", "monthly_savings" and
+        "time_travel_gb", largest savings first.
+    """
+    limit = limit if limit is not None else get_savings_limit()
+    min_savings = min_savings if min_savings is not None else float(os.getenv("STORAGE_MIN_MONTHLY_SAVINGS", DEFAULT_MIN_MONTHLY_SAVINGS))
+    savings = []
+    for dataset in datasets:
+        if dataset.get("billing_model") is None:
+            continue
+        recommended = "LOGICAL" if dataset["billing_model"] == "PHYSICAL" else "PHYSICAL"
+        recommended_cost = dataset[f"monthly_cost_{recommended.lower()}"]
+        saved = round(dataset["monthly_cost"] - recommended_cost, 2)
+        if saved >= min_savings:
+            savings.append({
+                "schema_name": dataset.get("schema_name"),
+                "current_model": dataset["billing_model"],
+                "recommended_model": recommended,
+                "current_monthly_cost": dataset["monthly_cost"],
+                "recommended_monthly_cost": recommended_cost,
+                "monthly_savings": saved,
+                "time_travel_gb": dataset.get("time_travel_gb", 0),
+            })
+    savings.sort(key=lambda entry: entry["monthly_savings"], reverse=True)
+    return savings[:limit]
@@ -0,0 +1,324 @@
+import re
+from typing import Optional, List, Tuple
+
+# Quoted strings are matched as runs of plain characters between escapes, which is
+# much faster than trying an escape and a plain character at every position.
+_STRING = r"""[rRbB]{0,2}(?:'''.*?(?<!\\)'''|\"\"\".*?(?<!\\)\"\"\"|'[^'\\]*+(?:\\.[^'\\]*+)*+'|"[^"\\]*+(?:\\.[^"\\]*+)*+")"""
+
+# A scalar or ARRAY<scalar> type, which has no nested fields, and a description literal.
+_SCALAR_TYPE = r"[A-Za-z]\w*(?:<[A-Za-z]\w*(?:\([\d, ]*\))?>)?(?:\([\d, ]*\))?"
+_DESCRIPTION = r'''"[^"\\\n]*+(?:\\.[^"\\\n]*+)*+"'''
+
+# One precompiled scanner for the whole DDL. Whitespace and comments are skipped
+# and every match is one token. Prefixes are possessive so a comment is never
+# re-scanned as tokens. The groups are:
+#
+#   1. a punctuation character, by far the most common token;
+#   2-5. a field as BigQuery writes it: its name (unquoted or quoted) followed by
+#      either a STRUCT< or ARRAY<STRUCT< opener (4), or a scalar type, NOT NULL and
+#      a description literal (5) up to a separator or closing bracket, which makes
+#      the whole field a single token;
+#   6. any other token: a description-only OPTIONS(...) clause, a string literal,
+#      a `quoted` identifier, a word or number, or an unclosed quote.
+_TOKEN_RE = re.compile(r"""
+    (?:\s+|--[^\n]*+|\#[^\n]*+|/\*.*?\*/)*+
+    (?:
+        ([^\w\s'"`])
+      | (?:(\w+)|`(\w+)`)\ (?:
+            (STRUCT<|ARRAY<STRUCT<)
+          | """ + _SCALAR_TYPE + r"""(?:\ NOT\ NULL)?(?:\ OPTIONS\(description=(""" + _DESCRIPTION + r""")\))?(?=\s*[,)>])
+        )
+      | (
+            (?i:OPTIONS\s*\(\s*description\s*=\s*)""" + _STRING + r"""\s*\)
+          | """ + _STRING + r"""
+          | `(?:\\.|[^`\\])*`
+          | \w+
+          | \S
+        )
+    )?
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize(ddl: str) -> List[str]:
+    """
+    Splits a DDL statement into tokens in a single pass.
+
+    A field token is a NUL character, its detail (STRUCT opener, description literal
+    or nothing), another NUL character and its name; see _field_parts.
+    """
+    if "\0" in ddl:
+        # NUL characters mark field tokens, and never occur in a real DDL.
+        ddl = ddl.replace("\0", " ")
+    matches = _TOKEN_RE.findall(ddl)
+    # Trailing whitespace and comments produce an empty match at the end.
+    if matches and not any(matches[-1]):
+        matches.pop()
+    return [punctuation or token or "\0" + (opener or description) + "\0" + (name or quoted_name)
+            for punctuation, name, quoted_name, opener, description, token in matches]
+
+
+def _is_field(token: str) -> bool:
+    # Field tokens end in their name, so they never look like strings or options either.
+    return token[0] == "\0"
+
+
+def _field_parts(token: str) -> Tuple[str, str]:
+    """Returns the name and the detail (STRUCT opener, description literal or "") of a field token."""
+    _, detail, name = token.split("\0")
+    return name, detail
+
+
+def _is_string(token: str) -> bool:
+    # Words and punctuation never end in a quote, so this only matches string literals.
+    return token[-1] in "'\"" and len(token) > 1
+
+
+def _is_description_options(token: str) -> bool:
+    # Words never end in a parenthesis, so this only matches OPTIONS(description=...) tokens.
+    return token[-1] == ")" and len(token) > 1
+
+
+def _description_options_value(token: str) -> str:
+    """Returns the description of an OPTIONS(description=...) token."""
+    return _string_value(token[token.index("=") + 1:-1].strip())
+
+
+def _string_value(literal: str) -> str:
+    """Returns the contents of a string literal, without its prefix and quotes."""
+    body = literal.lstrip("rRbB")
+    quote_len = 3 if body[:3] in ("'''", '"""') else 1
+    return body[quote_len:-quote_len]
+
+
+def _is_options(tokens: List[str], i: int) -> bool:
+    token = tokens[i]
+    return (token == "OPTIONS" or (len(token) == 7 and token.upper() == "OPTIONS")) and i + 1 < len(tokens) and tokens[i + 1] == "("
+
+
+class ParsedDDL:
+    """
+    The description coverage of a table, as parsed from its DDL.
+
+    `columns` lists every column, including nested STRUCT fields (as dotted paths
+    like "address.city"), with whether it has a non-empty description.
+    """
+    def __init__(self, table_description: Optional[str], columns: List[Tuple[str, bool]]):
+        self.table_description = table_description
+        self.columns = columns
+
+    @property
+    def has_table_description(self) -> bool:
+        return bool(self.table_description)
+
+    @property
+    def column_count(self) -> int:
+        return len(self.columns)
+
+    @property
+    def described_column_count(self) -> int:
+        return sum(1 for _, described in self.columns if described)
+
+    @property
+    def column_description_completeness(self) -> float:
+        """The share of (nested) columns with a description, rounded to two decimals."""
+        return round(self.described_column_count / self.column_count, 2) if self.columns else 0
+
+
+def _is_constraint(tokens: List[str], i: int) -> bool:
+    """Whether the column list entry at index i declares a table constraint rather than a column."""
+    keyword = tokens[i].upper()
+    if keyword == "CONSTRAINT":
+        # CONSTRAINT name PRIMARY KEY (...) or CONSTRAINT name FOREIGN KEY (...)
+        return i + 2 < len(tokens) and tokens[i + 2].upper() in ("PRIMARY", "FOREIGN")
+    return keyword in ("PRIMARY", "FOREIGN") and i + 1 < len(tokens) and tokens[i + 1].upper() == "KEY"
+
+
+def _skip_group(tokens: List[str], i: int) -> int:
+    """Skips a balanced (...) or [...] group starting at index i. Returns the index after it."""
+    depth = 0
+    n = len(tokens)
+    while i < n:
+        token = tokens[i]
+        i += 1
+        if token == "(" or token == "[":
+            depth += 1
+        elif token == ")" or token == "]":
+            depth -= 1
+            if depth == 0:
+                break
+    return i
+
+
+def _skip_until(tokens: List[str], i: int, terminators: Tuple[str, ...]) -> int:
+    """Returns the index of the next terminator outside of any brackets."""
+    n = len(tokens)
+    while i < n and tokens[i] not in terminators:
+        if tokens[i] == "(" or tokens[i] == "[":
+            i = _skip_group(tokens, i)
+        else:
+            i += 1
+    return i
+
+
+def _identifier(token: str) -> str:
+    return token[1:-1] if token[0] == "`" else token
+
+
+def _parse_options(tokens: List[str], i: int) -> Tuple[Optional[str], int]:
+    """
+    Parses OPTIONS(key=value, ...) starting at the OPTIONS keyword.
+
+    Returns:
+        The description (None if absent or not a plain string) and the index after the closing parenthesis.
+    """
+    i += 2
+    n = len(tokens)
+    description = None
+    while i < n and tokens[i] != ")":
+        key = tokens[i].lower()
+        i += 1
+        if i < n and tokens[i] == "=":
+            i += 1
+        if key == "description" and i + 1 < n and _is_string(tokens[i]) and tokens[i + 1] in (",", ")"):
+            description = _string_value(tokens[i])
+            i += 1
+        else:
+            i = _skip_until(tokens, i, (",", ")"))
+        if i < n and tokens[i] == ",":
+            i += 1
+    return description, i + 1
+
+
+def _parse_type(tokens: List[str], i: int, path: str, columns: List[list]) -> int:
+    """Parses a column type starting at index i, registering nested STRUCT fields. Returns the index after it."""
+    n = len(tokens)
+    type_name = tokens[i].upper()
+    i += 1
+    if i < n and tokens[i] == "<":
+        if type_name == "STRUCT":
+            i = _parse_fields(tokens, i + 1, path + ".", ">", columns)
+        else:
+            # ARRAY<...>, RANGE<...>: the element type's fields belong to this column.
+            i = _parse_type(tokens, i + 1, path, columns) + 1
+    if i < n and tokens[i] == "(":
+        # Parameterized types like NUMERIC(10, 2) or STRING(100).
+        i = _skip_group(tokens, i)
+    return i
+
+
+def _parse_fields(tokens: List[str], i: int, prefix: str, closer: str, columns: List[list]) -> int:
+    """
+    Parses a column list (closed by ")") or the fields of a STRUCT (closed by ">"),
+    starting after the opening bracket. Returns the index after the closing bracket.
+    """
+    n = len(tokens)
+    terminators = (",", closer)
+    while i < n and tokens[i] != closer:
+        if _is_field(tokens[i]):
+            name, detail = _field_parts(tokens[i])
+            # An empty description literal is just the two quotes.
+            entry = [prefix + name, detail[:1] == '"' and len(detail) > 2]
+            # The parent is listed before its nested fields.
+            columns.append(entry)
+            i += 1
+            if detail[-1:] == "<":
+                # STRUCT< or ARRAY<STRUCT<, whose closing ">" follows the fields.
+                i = _parse_fields(tokens, i, entry[0] + ".", ">", columns) + (detail[0] == "A")
+        elif closer == ")" and _is_constraint(tokens, i):
+            i = _skip_until(tokens, i, terminators)
+            entry = None
+        else:
+            entry = [prefix + _identifier(tokens[i]), False]
+            columns.append(entry)
+            i += 1
+            # View column lists have no types.
+            if i < n and (tokens[i][0].isalpha() or tokens[i][0] == "`") and not _is_options(tokens, i) and not _is_description_options(tokens[i]):
+                i = _parse_type(tokens, i, entry[0], columns)
+        while entry and i < n and tokens[i] not in terminators:
+            if _is_field(tokens[i]):
+                # Words the scanner took for a field, e.g. DEFAULT x OPTIONS(description="..."):
+                # only the description belongs to this column.
+                _, detail = _field_parts(tokens[i])
+                if detail[:1] == '"':
+                    entry[1] = len(detail) > 2
+                i += 1
+            elif _is_description_options(tokens[i]):
+                entry[1] = bool(_description_options_value(tokens[i]))
+                i += 1
+            elif _is_options(tokens, i):
+                description, i = _parse_options(tokens, i)
+                entry[1] = bool(description)
+            elif tokens[i] == "(" or tokens[i] == "[":
+                i = _skip_group(tokens, i)
+            else:
+                i += 1
+        if i < n and tokens[i] == ",":
+            i += 1
+    return i + 1
+
+
+def _parse_table_clauses(tokens: List[str], i: int) -> Optional[str]:
+    """Reads the table-level clauses from index i up to the query of a view. Returns the table description."""
+    n = len(tokens)
+    table_description = None
+    while i < n and tokens[i].upper() != "AS":
+        if _is_field(tokens[i]):
+            _, detail = _field_parts(tokens[i])
+            if detail[:1] == '"' and table_description is None:
+                table_description = _string_value(detail)
+            i += 1
+        elif _is_description_options(tokens[i]):
+            if table_description is None:
+                table_description = _description_options_value(tokens[i])
+            i += 1
+        elif _is_options(tokens, i):
+            description, i = _parse_options(tokens, i)
+            if table_description is None:
+                table_description = description
+        elif tokens[i] == "(" or tokens[i] == "[":
+            i = _skip_group(tokens, i)
+        else:
+            i += 1
+    return table_description
+
+
+def parse_ddl(ddl: str) -> ParsedDDL:
+    """
+    Parses the description coverage of a table or view from its DDL.
+
+    The DDL is tokenized in a single pass; string literals, comments and bracketed
+    expressions are skipped as a whole, so text inside them is never mistaken for
+    columns or options. Fields written the way BigQuery writes them are single tokens,
+    which keeps the parser within a few times the cost of the old regex estimate
+    (see benchmarks/bench_ddl_parser.py), not faster than it.
+
+    Args:
+        ddl: The DDL statement from INFORMATION_SCHEMA.TABLES.
+
+    Returns:
+        A ParsedDDL with the table description and every (nested) column.
+    """
+    if not ddl:
+        return ParsedDDL(None, [])
+
+    tokens = tokenize(ddl)
+    n = len(tokens)
+
+    # Header: CREATE [OR REPLACE] [...] TABLE|VIEW [IF NOT EXISTS] name
+    i = 0
+    while i < n and tokens[i].upper() not in ("TABLE", "VIEW"):
+        i += 1
+    i += 1
+    if i < n and tokens[i].upper() == "IF":
+        i += 3
+    i += 1
+    while i < n and tokens[i] == ".":
+        i += 2
+
+    columns: List[list] = []
+    if i < n and tokens[i] == "(":
+        i = _parse_fields(tokens, i + 1, "", ")", columns)
+
+    # Table-level clauses, up to the query of a view.
+    table_description = _parse_table_clauses(tokens, i)
+    return ParsedDDL(table_description, [(path, described) for path, described in columns])
@@ -0,0 +1,434 @@
+import os
+import re
+import json
+import time
+import random
+import uuid
+import asyncio
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+from backend.cost_model import STORAGE_BYTE_COLUMNS
+
+# Size of the synthetic environment served by the fake BigQuery backend.
+DEFAULT_FAKE_DATASETS = 10
+DEFAULT_FAKE_TABLES_PER_DATASET = 10
+DEFAULT_FAKE_COLUMNS_PER_TABLE = 20
+
+# Rows per result page, as returned by the fake RowIterator.
+FAKE_PAGE_SIZE = 10000
+
+# Counters for benchmarks, reset with reset_stats(). Guarded by _stats_lock.
+stats = {"jobs": 0, "llm_calls": 0, "prompt_bytes": 0}
+_stats_lock = threading.Lock()
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        for key in stats:
+            stats[key] = 0
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        stats[key] += amount
+
+
+class FakeEnvironment:
+    """
+    A deterministic, synthetic BigQuery project.
+
+    Nothing is stored: every table's metadata is derived from the seed and its
+    position whenever a query needs it, so the environment itself takes no memory
+    no matter how many tables it has.
+    """
+    def __init__(self, project_id: str, datasets: int, tables_per_dataset: int, columns_per_table: int, regions: List[str], seed: int = 0):
+        self.project_id = project_id
+        self.dataset_count = datasets
+        self.tables_per_dataset = tables_per_dataset
+        self.columns_per_table = columns_per_table
+        self.regions = regions
+        self.seed = seed
+        # A fixed reference time within a day, so change markers are stable across runs.
+        self.now = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def from_env(cls, project_id: str) -> "FakeEnvironment":
+        """Creates the environment configured by the FAKE_BQ_* environment variables."""
+        return cls(
+            project_id,
+            datasets=int(os.getenv("FAKE_BQ_DATASETS", DEFAULT_FAKE_DATASETS)),
+            tables_per_dataset=int(os.getenv("FAKE_BQ_TABLES_PER_DATASET", DEFAULT_FAKE_TABLES_PER_DATASET)),
+            columns_per_table=int(os.getenv("FAKE_BQ_COLUMNS_PER_TABLE", DEFAULT_FAKE_COLUMNS_PER_TABLE)),
+            regions=[r.strip() for r in os.getenv("FAKE_BQ_REGIONS", "US").split(",") if r.strip()],
+            seed=int(os.getenv("FAKE_BQ_SEED", 0)),
+        )
+
+    def dataset_name(self, index: int) -> str:
+        return f"fake_dataset_{index:05d}"
+
+    def dataset_index(self, name: str) -> Optional[int]:
+        match = re.fullmatch(r"fake_dataset_(\d+)", name)
+        if match and int(match.group(1)) < self.dataset_count:
+            return int(match.group(1))
+        return None
+
+    def dataset_region(self, index: int) -> str:
+        return self.regions[index % len(self.regions)]
+
+    def datasets_in(self, region: str) -> List[int]:
+        return [i for i in range(self.dataset_count) if self.dataset_region(i).lower() == region.lower()]
+
+    def dataset_is_described(self, index: int) -> bool:
+        return random.Random(f"{self.seed}:{index}").random() < 0.5
+
+    def dataset_billing_model(self, index: int) -> str:
+        return "PHYSICAL" if random.Random(f"{self.seed}:{index}:billing").random() < 0.3 else "LOGICAL"
+
+    def table(self, dataset_index: int, table_index: int) -> Dict[str, Any]:
+        """Derives the metadata of one table."""
+        rng = random.Random(f"{self.seed}:{dataset_index}:{table_index}")
+        is_view = rng.random() < 0.1
+        logical_bytes = 0 if is_view else int(10 ** rng.uniform(3, 12))
+        created_days_ago = rng.uniform(30, 1000)
+        table = {
+            "table_schema": self.dataset_name(dataset_index),
+            "table_name": f"table_{table_index:05d}",
+            "table_type": "VIEW" if is_view else "BASE TABLE",
+            "described": rng.random() < 0.6,
+            "described_columns": int(self.columns_per_table * rng.random()),
+            "partitioned": not is_view and rng.random() < 0.3,
+            "clustered": not is_view and rng.random() < 0.2,
+            "total_rows": None if is_view else logical_bytes // 100,
+            "total_logical_bytes": None if is_view else logical_bytes,
+            "total_physical_bytes": None if is_view else int(logical_bytes * rng.uniform(0.3, 1.2)),
+            "creation_time": self.now - timedelta(days=created_days_ago),
+            "last_modified_time": None if is_view else self.now - timedelta(days=rng.uniform(0, created_days_ago)),
+            "queries": None,
+        }
+        if not is_view and rng.random() < 0.4:
+            query_count = rng.randint(1, 500)
+            table["queries"] = {
+                "query_count": query_count,
+                "bytes_processed": logical_bytes * rng.uniform(0.05, 1.0) * query_count,
+                "slot_ms": rng.uniform(10, 10000) * query_count,
+                "full_scans": rng.randint(0, query_count),
+            }
+        # Split the storage into active and long-term bytes, with time travel (part of the
+        # active physical bytes) and fail-safe bytes on top.
+        long_term_share = 0 if is_view else rng.random()
+        physical_bytes = table["total_physical_bytes"] or 0
+        table["active_logical_bytes"] = None if is_view else int(logical_bytes * (1 - long_term_share))
+        table["long_term_logical_bytes"] = None if is_view else logical_bytes - table["active_logical_bytes"]
+        table["long_term_physical_bytes"] = None if is_view else int(physical_bytes * long_term_share)
+        table["active_physical_bytes"] = None if is_view else physical_bytes - table["long_term_physical_bytes"]
+        table["time_travel_physical_bytes"] = None if is_view else int(table["active_physical_bytes"] * rng.uniform(0, 0.5))
+        table["fail_safe_physical_bytes"] = None if is_view else int(physical_bytes * rng.uniform(0, 0.1))
+        return table
+
+    def tables(self, dataset_indexes: List[int]) -> Iterator[Dict[str, Any]]:
+        for dataset_index in dataset_indexes:
+            for table_index in range(self.tables_per_dataset):
+                yield self.table(dataset_index, table_index)
+
+    def table_ddl(self, table: Dict[str, Any]) -> str:
+        is_view = table["table_type"] == "VIEW"
+        columns = []
+        for i in range(self.columns_per_table):
+            column_type = "" if is_view else (" STRING" if i % 2 else " INT64")
+            description = f' OPTIONS(description="Column {i} of {table["table_name"]}")' if i < table["described_columns"] else ""
+            columns.append(f"  col_{i}{column_type}{description}")
+        clauses = []
+        if table["partitioned"]:
+            clauses.append("PARTITION BY DATE(_PARTITIONTIME)")
+        if table["clustered"]:
+            clauses.append("CLUSTER BY col_0")
+        if table["described"]:
+            clauses.append(f'OPTIONS(\n  description="Synthetic table {table["table_name"]}"\n)')
+        kind = "VIEW" if is_view else "TABLE"
+        ddl = f"CREATE {kind} `{self.project_id}.{table['table_schema']}.{table['table_name']}`\n(\n" + ",\n".join(columns) + "\n)"
+        if clauses:
+            ddl += "\n" + "\n".join(clauses)
+        if is_view:
+            ddl += "\nAS SELECT 1 AS col_0"
+        return ddl + ";"
+
+    def dataset_ddl(self, index: int) -> str:
+        options = [f'location="{self.dataset_region(index)}"']
+        if self.dataset_is_described(index):
+            options.append(f'description="Synthetic dataset {index}"')
+        if self.dataset_billing_model(index) == "PHYSICAL":
+            options.append('storage_billing_model="PHYSICAL"')
+        return f"CREATE SCHEMA `{self.project_id}.{self.dataset_name(index)}`\nOPTIONS(\n  " + ",\n  ".join(options) + "\n);"
+
+
+class FakeField:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class FakeRowIterator:
+    """Mimics the parts of google.cloud.bigquery.table.RowIterator the connector uses."""
+    def __init__(self, names: List[str], rows: List[tuple]):
+        self.schema = [FakeField(name) for name in names]
+        self._names = names
+        self._rows = rows
+        self.total_rows = len(rows)
+
+    @property
+    def pages(self) -> Iterator[List[Dict[str, Any]]]:
+        for start in range(0, len(self._rows), FAKE_PAGE_SIZE):
+            yield [dict(zip(self._names, row)) for row in self._rows[start:start + FAKE_PAGE_SIZE]]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for page in self.pages:
+            yield from page
+
+
+class FakeQueryJob:
+    def __init__(self, job_id: str, result: FakeRowIterator, latency: float):
+        self.job_id = job_id
+        self.total_bytes_processed = 0  # INFORMATION_SCHEMA metadata queries are free.
+        self.slot_millis = int(latency * 1000)
+        self.cache_hit = False
+        self._result = result
+        self._latency = latency
+
+    def result(self, timeout: Optional[float] = None) -> FakeRowIterator:
+        if timeout is not None and self._latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Job {self.job_id} did not finish within {timeout} seconds.")
+        if self._latency:
+            time.sleep(self._latency)
+        return self._result
+
+    def cancel(self) -> bool:
+        return True
+
+
+class FakeQueryError(Exception):
+    """Mimics a google.api_core error: an HTTP status code and the error reasons BigQuery reports."""
+    def __init__(self, code: int, reason: str, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.errors = [{"reason": reason, "message": message}]
+
+
+class FakeDatasetListItem:
+    def __init__(self, project_id: str, dataset_id: str):
+        self.dataset_id = dataset_id
+        self.reference = f"{project_id}.{dataset_id}"
+
+
+class FakeDataset(FakeDatasetListItem):
+    def __init__(self, project_id: str, dataset_id: str, location: str):
+        super().__init__(project_id, dataset_id)
+        self.location = location
+
+
+_REGION_VIEW_RE = re.compile(r"`region-([^`]+)`\.INFORMATION_SCHEMA\.(\w+)", re.IGNORECASE)
+_DATASET_VIEW_RE = re.compile(r"`[^`]+`\.`?(\w+)`?\.INFORMATION_SCHEMA\.(\w+)", re.IGNORECASE)
+_PROJECT_VIEW_RE = re.compile(r"`[^`]+`\.INFORMATION_SCHEMA\.(\w+)", re.IGNORECASE)
+
+
+def _filter_value(query: str, column: str) -> Optional[str]:
+    match = re.search(rf"\b{column}\s*=\s*'([^']*)'", query)
+    return match.group(1) if match else None
+
+
+def _selects(query: str, column: str) -> bool:
+    select_list = query.split("FROM", 1)[0]
+    return re.search(rf"\b{column}\b", select_list) is not None
+
+
+class FakeBigQueryClient:
+    """
+    An offline stand-in for bigquery.Client that answers the INFORMATION_SCHEMA
+    queries issued by backend/tools.py from a FakeEnvironment.
+
+    Queries are recognized by the views they read, not parsed as SQL; anything else
+    raises a ValueError. Every query counts as one job and waits FAKE_BQ_LATENCY_MS
+    before returning, to simulate BigQuery's per-job overhead.
+
+    To exercise retries and partial results, a share of FAKE_BQ_ERROR_RATE queries
+    fails with a (retryable) rate-limit error, and queries reading any of the views
+    in FAKE_BQ_FAILING_VIEWS (comma-separated) always fail with access denied.
+    """
+    def __init__(self, project: str, location: str, environment: Optional[FakeEnvironment] = None):
+        self.project = project
+        self.location = location
+        self.environment = environment or FakeEnvironment.from_env(project)
+        self.latency = float(os.getenv("FAKE_BQ_LATENCY_MS", 0)) / 1000
+        self.error_rate = float(os.getenv("FAKE_BQ_ERROR_RATE", 0))
+        self.failing_views = {view.strip().upper() for view in os.getenv("FAKE_BQ_FAILING_VIEWS", "").split(",") if view.strip()}
+
+    def list_datasets(self, project: str = None) -> List[FakeDatasetListItem]:
+        env = self.environment
+        return [FakeDatasetListItem(env.project_id, env.dataset_name(i)) for i in range(env.dataset_count)]
+
+    def get_dataset(self, dataset_ref: str) -> FakeDataset:
+        env = self.environment
+        dataset_id = str(dataset_ref).rsplit(".", 1)[-1]
+        index = env.dataset_index(dataset_id)
+        if index is None:
+            raise FakeQueryError(404, "notFound", f"Not found: Dataset {dataset_ref}")
+        return FakeDataset(env.project_id, dataset_id, env.dataset_region(index))
+
+    def query(self, query: str) -> FakeQueryJob:
+        _count("jobs")
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeQueryError(403, "rateLimitExceeded", "Exceeded rate limits: too many concurrent queries for this project_and_region.")
+        view = self._scope(query)[0]
+        if view in self.failing_views:
+            raise FakeQueryError(403, "accessDenied", f"Access Denied: INFORMATION_SCHEMA.{view}: permission denied.")
+        names, rows = self._run(query)
+        return FakeQueryJob(f"fake_job_{uuid.uuid4().hex}", FakeRowIterator(names, rows), self.latency)
+
+    def _scope(self, query: str) -> Tuple[str, List[int]]:
+        """Returns the first view a query reads and the indexes of the datasets in its scope."""
+        env = self.environment
+        match = _REGION_VIEW_RE.search(query)
+        if match:
+            return match.group(2).upper(), env.datasets_in(match.group(1))
+        match = _DATASET_VIEW_RE.search(query)
+        if match:
+            index = env.dataset_index(match.group(1))
+            if index is None:
+                raise ValueError(f"Not found: Dataset {env.project_id}:{match.group(1)}")
+            return match.group(2).upper(), [index]
+        match = _PROJECT_VIEW_RE.search(query)
+        if match:
+            return match.group(1).upper(), env.datasets_in(self.location)
+        raise ValueError(f"The fake BigQuery backend does not support this query: {query}")
+
+    def _run(self, query: str) -> Tuple[List[str], List[tuple]]:
+        env = self.environment
+        view, dataset_indexes = self._scope(query)
+        schema_filter = _filter_value(query, "schema_name") or _filter_value(query, "table_schema")
+        if schema_filter is not None:
+            dataset_indexes = [i for i in dataset_indexes if env.dataset_name(i) == schema_filter]
+
+        if view == "SCHEMATA":
+            return ["schema_name", "ddl"], [(env.dataset_name(i), env.dataset_ddl(i)) for i in dataset_indexes]
+
+        if view == "SCHEMATA_OPTIONS":
+            rows = []
+            for i in dataset_indexes:
+                if env.dataset_is_described(i):
+                    rows.append((env.dataset_name(i), "description", f'"Synthetic dataset {i}"'))
+                if env.dataset_billing_model(i) == "PHYSICAL":
+                    rows.append((env.dataset_name(i), "storage_billing_model", '"PHYSICAL"'))
+            option_filter = _filter_value(query, "option_name")
+            if option_filter is not None:
+                rows = [row for row in rows if row[1] == option_filter]
+            return ["schema_name", "option_name", "option_value"], rows
+
+        if view == "JOBS":
+            return ["table_schema", "table_name", "query_count", "bytes_processed", "slot_ms", "full_scans"], [
+                (t["table_schema"], t["table_name"], *t["queries"].values())
+                for t in env.tables(dataset_indexes) if t["queries"]
+            ]
+
+        if view == "TABLES" and "max_creation_time" in query:
+            # Change markers: TABLES joined with TABLE_STORAGE, grouped by dataset.
+            rows = []
+            for i in dataset_indexes:
+                tables = list(env.tables([i]))
+                if tables:
+                    modified = [t["last_modified_time"] for t in tables if t["last_modified_time"]]
+                    rows.append((env.dataset_name(i), len(tables), max(t["creation_time"] for t in tables), max(modified) if modified else None))
+            return ["table_schema", "table_count", "max_creation_time", "max_last_modified_time"], rows
+
+        if view == "TABLES":
+            if _selects(query, "ddl"):
+                return ["table_schema", "table_name", "table_type", "ddl"], [
+                    (t["table_schema"], t["table_name"], t["table_type"], env.table_ddl(t)) for t in env.tables(dataset_indexes)
+                ]
+            return ["table_schema", "table_name", "table_type"], [
+                (t["table_schema"], t["table_name"], t["table_type"]) for t in env.tables(dataset_indexes)
+            ]
+
+        if view == "COLUMN_FIELD_PATHS":
+            return ["table_schema", "table_name", "column_count", "described_column_count"], [
+                (t["table_schema"], t["table_name"], env.columns_per_table, t["described_columns"]) for t in env.tables(dataset_indexes)
+            ]
+
+        if view == "TABLE_STORAGE":
+            names = ["table_schema", "table_name", "total_rows", "total_logical_bytes", "total_physical_bytes", *STORAGE_BYTE_COLUMNS]
+            return names + ["storage_last_modified_time"], [
+                tuple(t[name] for name in names) + (t["last_modified_time"],)
+                for t in env.tables(dataset_indexes) if t["table_type"] != "VIEW"
+            ]
+
+        if view == "TABLE_OPTIONS":
+            rows = []
+            for t in env.tables(dataset_indexes):
+                if t["partitioned"]:
+                    rows.append((t["table_schema"], t["table_name"], "require_partition_filter", "true"))
+                if t["clustered"]:
+                    rows.append((t["table_schema"], t["table_name"], "clustering_columns", '["col_0"]'))
+                if t["described"]:
+                    rows.append((t["table_schema"], t["table_name"], "description", f'"Synthetic table {t["table_name"]}"'))
+            return ["table_schema", "table_name", "option_name", "option_value"], rows
+
+        raise ValueError(f"The fake BigQuery backend does not support the {view} view.")
+
+
+def _canned_report(prompt: str) -> str:
+    """A well-formed summary report with one finding per penalized rule."""
+    match = re.search(r"baseline score for this project is (\d+)", prompt)
+    score = int(match.group(1)) if match else 50
+    try:
+        rule_penalties = json.loads(prompt.split("Data: ", 1)[1]).get("rule_penalties", {})
+    except (IndexError, ValueError):
+        rule_penalties = {}
+    penalized = sorted((name for name, points in rule_penalties.items() if points), key=lambda name: -rule_penalties[name])
+    findings = [
+        {"title": f"Rule '{name}' deducted {rule_penalties[name]} points.", "details": "Canned finding from the fake LLM backend.", "importance": "High" if i == 0 else "Medium"}
+        for i, name in enumerate(penalized[:3])
+    ]
+    recommendations = [
+        {"title": f"Address '{name}'.", "details": "Canned recommendation from the fake LLM backend.", "priority": "High" if i == 0 else "Medium"}
+        for i, name in enumerate(penalized[:3])
+    ]
+    return json.dumps({"health_score": score, "key_findings": findings, "recommendations": recommendations})
+
+
+def _updated_report(prompt: str) -> str:
+    """The previous report of an incremental summary prompt, with the new score."""
+    match = re.search(r"baseline score for this project is (\d+)", prompt)
+    previous = prompt.split("Previous report: ", 1)[1].split("\\nChanges: ", 1)[0]
+    try:
+        report = json.loads(previous)
+    except ValueError:
+        return _canned_report(prompt)
+    if match:
+        report["health_score"] = int(match.group(1))
+    return json.dumps(report)
+
+
+async def fake_agent_response(agent_name: str, prompt: str) -> str:
+    """
+    Returns a canned response in the format each agent is instructed to produce,
+    after FAKE_LLM_LATENCY_MS. The prompt size is recorded in `stats`.
+    """
+    _count("llm_calls")
+    _count("prompt_bytes", len(prompt.encode("utf-8")))
+    latency = float(os.getenv("FAKE_LLM_LATENCY_MS", 0)) / 1000
+    if latency:
+        await asyncio.sleep(latency)
+
+    if agent_name == "summary_agent":
+        if "Previous report: " in prompt:
+            return _updated_report(prompt)
+        return _canned_report(prompt)
+    if agent_name == "bigquery_dataset_discoverer":
+        # Imported here since tools imports the connector, which imports this module.
+        from backend.tools import discover_datasets
+        match = re.search(r"project `([^`]+)`", prompt)
+        return json.dumps(await asyncio.to_thread(discover_datasets, match.group(1))) if match else "[]"
+    if "Generate Reading List" in prompt:
+        return json.dumps({"reading_list": [
+            {"url": "https://cloud.google.com/bigquery/docs/best-practices-performance-overview", "summary": "Canned reading list entry from the fake LLM backend."}
+        ]})
+    return "#### Step-by-Step Action Plan\n\n1. Canned action plan from the fake LLM backend.\n"
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Callable, AsyncIterator
+
+# Maximum number of analyses running at the same time; further jobs wait in the queue.
+DEFAULT_MAX_CONCURRENT_JOBS = 4
+
+# Number of finished jobs kept so clients can fetch their results later.
+DEFAULT_MAX_FINISHED_JOBS = 100
+
+
+class AnalysisJob:
+    """
+    A single background analysis. Every event it produces is kept, so any number
+    of clients can (re-)attach to its progress stream at any point.
+    """
+    def __init__(self, key: Tuple, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params
+        self.status = "queued"  # queued -> running -> complete | error
+        self.events: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("complete", "error")
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        """Appends an event and wakes up all followers."""
+        if event.get("event") == "error":
+            self.error = json.loads(event["data"]).get("details")
+        elif event.get("event") == "update":
+            data = json.loads(event["data"])
+            if data.get("status") == "Complete":
+                self.result = data
+        async with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        """Marks the job as finished and wakes up all followers."""
+        async with self._changed:
+            self.status = "error" if self.error or self.result is None else "complete"
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    async def follow(self, start: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Replays the job's events from `start` and then follows new ones until the job finishes.
+
+        Yields:
+            (index, event) tuples. The index can be passed back as `start` (plus one) to resume.
+        """
+        index = start
+        while True:
+            while index < len(self.events):
+                yield index, self.events[index]
+                index += 1
+            if self.done:
+                return
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.events) > index or self.done)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """A JSON-serializable summary of the job, including its result once finished."""
+        return {
+            "job_id": self.id,
+            "project_id": self.params.get("project_id"),
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "events": len(self.events),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs analyses as background jobs on a bounded worker pool.
+
+    Jobs outlive the connection that started them. Submitting a job whose key
+    matches one that is still queued or running returns the existing job instead
+    of starting duplicate BigQuery and LLM work.
+    """
+    def __init__(self, runner: Callable[..., AsyncIterator[Dict[str, Any]]], max_concurrent: int = None, max_finished: int = None):
+        """
+        Args:
+            runner: An async generator function producing the job's SSE events from its params.
+            max_concurrent: (Optional) Jobs running at once. Defaults to MAX_CONCURRENT_JOBS.
+            max_finished: (Optional) Finished jobs kept for later retrieval. Defaults to MAX_FINISHED_JOBS.
+        """
+        self.runner = runner
+        self.max_concurrent = max_concurrent or int(os.getenv("MAX_CONCURRENT_JOBS", DEFAULT_MAX_CONCURRENT_JOBS))
+        self.max_finished = max_finished or int(os.getenv("MAX_FINISHED_JOBS", DEFAULT_MAX_FINISHED_JOBS))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._in_flight: Dict[Tuple, AnalysisJob] = {}
+
+    def submit(self, key: Tuple, **params: Any) -> Tuple[AnalysisJob, bool]:
+        """
+        Submits an analysis, or attaches to an identical one already in flight.
+
+        Args:
+            key: Identifies equivalent requests, e.g. (project_id, collection_mode).
+            **params: Keyword arguments for the runner.
+
+        Returns:
+            A (job, coalesced) tuple; `coalesced` is True if an existing job was returned.
+        """
+        existing = self._in_flight.get(key)
+        if existing is not None and not existing.done:
+            return existing, True
+
+        if self._semaphore is None:
+            # Created lazily so it binds to the server's running event loop.
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        job = AnalysisJob(key, params)
+        self._jobs[job.id] = job
+        self._in_flight[key] = job
+        job._task = asyncio.create_task(self._run(job))
+        return job, False
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        """Returns the job with the given ID, or None if it is unknown or was evicted."""
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: AnalysisJob) -> None:
+        try:
+            async with self._semaphore:
+                job.status = "running"
+                async for event in self.runner(**job.params):
+                    await job.publish(event)
+        except Exception as e:
+            await job.publish({"event": "error", "data": json.dumps({'status': 'Error', 'details': f"An error occurred during analysis: {e}"})})
+        finally:
+            await job.finish()
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+            self._evict_finished()
+
+    def _evict_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
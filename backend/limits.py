@@ -0,0 +1,252 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from typing import Optional, Callable, Any
+
+# Maximum number of BigQuery queries running at the same time across all analyses.
+DEFAULT_MAX_CONCURRENT_QUERIES = 32
+
+# Maximum number of LLM agent runs at the same time across all analyses.
+DEFAULT_MAX_CONCURRENT_LLM_CALLS = 8
+
+# Requests each service may start per second across all analyses (0 disables the limit).
+# Bursts of up to one second's worth of requests are allowed.
+DEFAULT_BQ_QUERIES_PER_SECOND = 50
+DEFAULT_LLM_CALLS_PER_SECOND = 2
+
+# After a rate-limit error, a service's rate is halved, down to this share of its
+# configured rate. Every success then recovers a tenth of the configured rate.
+MIN_RATE_SHARE = 0.1
+RATE_RECOVERY_SHARE = 0.1
+
+# How often a request that failed with a retryable error is retried.
+DEFAULT_MAX_RETRIES = 4
+
+# The backoff before retry n is a random delay between 0 and base * 2**n seconds, capped.
+DEFAULT_RETRY_BASE_SECONDS = 1
+DEFAULT_RETRY_MAX_SECONDS = 30
+
+# How long a single BigQuery query or agent run may take before it is abandoned.
+DEFAULT_BQ_QUERY_TIMEOUT_SECONDS = 300
+DEFAULT_LLM_CALL_TIMEOUT_SECONDS = 300
+
+# HTTP status codes of transient failures.
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Error reasons BigQuery reports for rate-limit and transient backend errors.
+RETRYABLE_REASONS = ("rateLimitExceeded", "jobRateLimitExceeded", "backendError", "internalError")
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "jobRateLimitExceeded")
+
+# The error reason BigQuery reports for exceeded quotas. Most quotas (e.g. daily query
+# bytes) don't recover for hours, so these errors fail fast, unless the message names a
+# per-second or per-minute quota, which is treated like a rate limit.
+QUOTA_REASONS = ("quotaExceeded",)
+
+# Fallback for errors that only describe themselves in their message (e.g. wrapped by the agent runner).
+# Status codes are only matched at the start, where google-api-core and google-genai put them.
+_RATE_LIMIT_MESSAGE_RE = re.compile(r"^\s*429\b|\bRESOURCE_EXHAUSTED\b|[Rr]ate limit")
+_TRANSIENT_MESSAGE_RE = re.compile(r"^\s*50[0234]\b|\bUNAVAILABLE\b|\bbackendError\b")
+_QUOTA_MESSAGE_RE = re.compile(r"quota exceeded|exceeded (?:your (?:current )?)?quota", re.IGNORECASE)
+# E.g. "Exceeded quota for ... per minute" or Gemini's "GenerateRequestsPerMinutePerProjectPerModel".
+_SHORT_QUOTA_MESSAGE_RE = re.compile(r"per[ _-]?(?:second|minute)", re.IGNORECASE)
+
+# Queries run in worker threads, so their limit is a thread semaphore.
+bigquery_query_slots = threading.BoundedSemaphore(
+    max(1, int(os.getenv("BQ_MAX_CONCURRENT_QUERIES", DEFAULT_MAX_CONCURRENT_QUERIES)))
+)
+
+_llm_call_slots: Optional[asyncio.Semaphore] = None
+
+
+def get_llm_call_slots() -> asyncio.Semaphore:
+    """
+    Returns the process-wide semaphore bounding concurrent LLM agent runs.
+    The limit is read from LLM_MAX_CONCURRENT_CALLS.
+    """
+    global _llm_call_slots
+    if _llm_call_slots is None:
+        # Created lazily so it binds to the running event loop.
+        _llm_call_slots = asyncio.Semaphore(max(1, int(os.getenv("LLM_MAX_CONCURRENT_CALLS", DEFAULT_MAX_CONCURRENT_LLM_CALLS))))
+    return _llm_call_slots
+
+
+def _error_reasons(error: BaseException) -> set:
+    """The reasons of a google.api_core error (e.g. "rateLimitExceeded"), if it has any."""
+    return {e.get("reason") for e in getattr(error, "errors", None) or [] if isinstance(e, dict)}
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def _is_quota_exceeded(error: BaseException) -> bool:
+    return bool(_error_reasons(error).intersection(QUOTA_REASONS)) or _QUOTA_MESSAGE_RE.search(str(error)) is not None
+
+
+def _is_long_quota_exceeded(error: BaseException) -> bool:
+    """Whether an error is an exceeded quota that won't recover within a retry's backoff (e.g. a daily quota)."""
+    return _is_quota_exceeded(error) and _SHORT_QUOTA_MESSAGE_RE.search(str(error)) is None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Whether an error means the service is throttling us (HTTP 429, rate limit or per-minute quota exceeded)."""
+    if _is_quota_exceeded(error):
+        return not _is_long_quota_exceeded(error)
+    if _status_code(error) == 429 or _error_reasons(error).intersection(RATE_LIMIT_REASONS):
+        return True
+    return _RATE_LIMIT_MESSAGE_RE.search(str(error)) is not None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed request may succeed if it is simply tried again: rate limits,
+    per-second or per-minute quotas, 5xx responses and dropped connections. Timeouts
+    are not retried, since the same request is likely to time out again, and neither
+    are other exceeded quotas, which last for hours.
+    """
+    if isinstance(error, TimeoutError) or _is_long_quota_exceeded(error):
+        return False
+    if isinstance(error, ConnectionError) or is_rate_limited(error):
+        return True
+    if _status_code(error) in RETRYABLE_STATUS_CODES or _error_reasons(error).intersection(RETRYABLE_REASONS):
+        return True
+    return _TRANSIENT_MESSAGE_RE.search(str(error)) is not None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket whose rate adapts to the service's feedback.
+
+    Tokens refill at `rate` per second up to a burst of one second's worth. Every
+    rate-limit error halves the rate (down to MIN_RATE_SHARE of the configured
+    rate), and every success raises it again by RATE_RECOVERY_SHARE, so the
+    request rate settles just below what the service accepts.
+    """
+    def __init__(self, rate: float):
+        """
+        Args:
+            rate: The configured requests per second. 0 or less disables the limit.
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self._tokens = max(rate, 1)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, going into debt if none is left.
+
+        Returns:
+            How many seconds the caller must wait before starting its request.
+        """
+        if self.max_rate <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(max(self.rate, 1), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def throttle(self) -> None:
+        """Halves the rate after a rate-limit error."""
+        with self._lock:
+            self.rate = max(self.max_rate * MIN_RATE_SHARE, self.rate / 2)
+
+    def recover(self) -> None:
+        """Raises the rate back towards the configured rate after a success."""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_SHARE)
+
+
+class ServiceScheduler:
+    """
+    Paces and retries the requests to one service (BigQuery or Gemini) across all analyses.
+
+    Every attempt first takes a token from the service's TokenBucket. Attempts that
+    fail with a retryable error (see is_retryable) are retried after a jittered
+    exponential backoff, up to `max_retries` times; rate-limit errors also throttle
+    the bucket. `timeout` is the limit callers apply to each attempt.
+    """
+    def __init__(self, name: str, rate: float, timeout: float, max_retries: int, base_delay: float, max_delay: float):
+        self.name = name
+        self.bucket = TokenBucket(rate)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, default_rate: float, default_timeout: float) -> "ServiceScheduler":
+        """Configures a scheduler from <prefix>_REQUESTS_PER_SECOND, <prefix>_TIMEOUT_SECONDS, MAX_RETRIES and RETRY_*_SECONDS."""
+        return cls(
+            name,
+            rate=float(os.getenv(f"{prefix}_REQUESTS_PER_SECOND", default_rate)),
+            timeout=float(os.getenv(f"{prefix}_TIMEOUT_SECONDS", default_timeout)),
+            max_retries=int(os.getenv("MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+            base_delay=float(os.getenv("RETRY_BASE_SECONDS", DEFAULT_RETRY_BASE_SECONDS)),
+            max_delay=float(os.getenv("RETRY_MAX_SECONDS", DEFAULT_RETRY_MAX_SECONDS)),
+        )
+
+    def should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Whether attempt number `attempt` (0 for the first) may be retried after failing with `error`."""
+        return attempt < self.max_retries and is_retryable(error)
+
+    def backoff(self, error: BaseException, attempt: int) -> float:
+        """
+        Returns the delay before retrying attempt number `attempt` (0 for the first),
+        with full jitter, and throttles the service's rate if `error` is a rate limit.
+        """
+        if is_rate_limited(error):
+            self.bucket.throttle()
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        print(f"{self.name} request failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def succeeded(self) -> None:
+        self.bucket.recover()
+
+    def call(self, fn: Callable[[], Any], on_retry: Optional[Callable[[int], None]] = None) -> Any:
+        """
+        Calls `fn` from a worker thread, pacing every attempt and retrying retryable errors.
+
+        Args:
+            fn: The request, called without arguments. It should apply `timeout` itself.
+            on_retry: (Optional) Called with the number of retries so far before each retry.
+
+        Returns:
+            What `fn` returned. The last error is raised once the retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            time.sleep(self.bucket.reserve())
+            try:
+                result = fn()
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    raise
+                time.sleep(self.backoff(e, attempt))
+                attempt += 1
+                if on_retry:
+                    on_retry(attempt)
+                continue
+            self.succeeded()
+            return result
+
+    async def wait_turn(self) -> None:
+        """Waits for a token without blocking the event loop, for requests made from coroutines."""
+        delay = self.bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# Shared by every BigQuery query (BQ_REQUESTS_PER_SECOND, BQ_TIMEOUT_SECONDS) and
+# every agent run (LLM_REQUESTS_PER_SECOND, LLM_TIMEOUT_SECONDS) in the process.
+bigquery_scheduler = ServiceScheduler.from_env("BigQuery", "BQ", DEFAULT_BQ_QUERIES_PER_SECOND, DEFAULT_BQ_QUERY_TIMEOUT_SECONDS)
+llm_scheduler = ServiceScheduler.from_env("Gemini", "LLM", DEFAULT_LLM_CALLS_PER_SECOND, DEFAULT_LLM_CALL_TIMEOUT_SECONDS)
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", ".cache", "llm_responses")
+
+# Total size of cached responses on disk before the least recently used ones are evicted.
+DEFAULT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Cached responses older than this are ignored. Action plans embed live search
+# results, so they shouldn't be reused forever.
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# Once the size bound is exceeded, entries are evicted until the cache is back to this
+# share of it, so a full cache isn't rescanned on every write.
+EVICT_TO_FRACTION = 0.9
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace so prompts that differ only in indentation share a cache entry."""
+    return " ".join(prompt.split())
+
+
+def agent_fingerprint(agent: Any) -> str:
+    """
+    Identifies what an agent answers with: its name, model and instruction text, so
+    editing an agent's instruction or switching its model invalidates its cached responses.
+    """
+    model = agent.model if isinstance(agent.model, str) else getattr(agent.model, "model", repr(agent.model))
+    instruction = agent.instruction if isinstance(agent.instruction, str) else getattr(agent.instruction, "__qualname__", repr(agent.instruction))
+    return f"{agent.name}\0{model}\0{instruction}"
+
+
+class ResponseCache:
+    """
+    A content-addressed, size-bounded on-disk cache of agent responses, keyed by
+    a hash of the agent's name, model and instruction and of the normalized prompt.
+    """
+    def __init__(self, directory: str = None, max_bytes: int = None, ttl_seconds: float = None):
+        """
+        Args:
+            directory: (Optional) Where responses are stored. Defaults to LLM_CACHE_DIR,
+                       then to .cache/llm_responses in the project root.
+            max_bytes: (Optional) The size bound. Defaults to LLM_CACHE_MAX_BYTES.
+            ttl_seconds: (Optional) The lifetime of an entry. Defaults to LLM_CACHE_TTL_SECONDS.
+        """
+        self.directory = directory or os.getenv("LLM_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes or int(os.getenv("LLM_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("LLM_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS))
+        self._lock = threading.Lock()
+        # Total size of the entries on disk, counted on the first write and kept up to
+        # date from then on, so the directory is only scanned when eviction is due.
+        self._total_bytes: Optional[int] = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, agent: Any, prompt: str) -> str:
+        digest = hashlib.sha256(f"{agent_fingerprint(agent)}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, agent: Any, prompt: str) -> Optional[str]:
+        """Returns the cached response for this agent and prompt, or None on a miss."""
+        path = self._path(agent, prompt)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            return None
+        try:
+            # Mark as recently used for eviction purposes.
+            os.utime(path)
+        except OSError:
+            # Evicted or deleted since it was read.
+            return None
+        return entry["response"]
+
+    def put(self, agent: Any, prompt: str, response: str) -> None:
+        """Stores a response, then evicts the least recently used entries if the size bound is exceeded."""
+        path = self._path(agent, prompt)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"agent": agent.name, "created_at": time.time(), "response": response}, f)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            replaced = self._size_of(path)
+            os.replace(tmp_path, path)
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += size - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, agent: Any, prompt: str) -> None:
+        """Removes a cached response, e.g. one that turned out to be unusable."""
+        path = self._path(agent, prompt)
+        with self._lock:
+            size = self._size_of(path)
+            try:
+                os.remove(path)
+            except OSError:
+                return
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    @staticmethod
+    def _size_of(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _scan_total(self) -> int:
+        return sum(size for _, size, _ in self._scan())
+
+    def _scan(self) -> list:
+        """Returns (mtime, size, path) of every entry on disk."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Deleted in the meantime.
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self) -> None:
+        """Evicts the least recently used entries down to EVICT_TO_FRACTION of the bound. Called with the lock held."""
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO_FRACTION
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._total_bytes = total
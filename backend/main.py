@@ -2,28 +2,63 @@ import os
 import asyncio
 import uuid
 import json
-import re
+from contextlib import aclosing
+from functools import partial
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse
 from sse_starlette.sse import EventSourceResponse
 import uvicorn
-from datetime import datetime, timezone, timedelta
 
 from google.cloud import resourcemanager_v3
 from google.adk.agents import Agent
 from google.adk.runners import Runner
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.sessions import InMemorySessionService
 from google.genai.types import Content, Part
-from backend.tools import get_dataset_and_table_details, execute_bigquery_query, perform_google_search, discover_datasets_across_regions
+from backend.tools import execute_bigquery_query, perform_google_search, discover_datasets_across_regions, discover_datasets
+from backend.collector import collect_dataset_details, get_max_parallel_datasets, get_collection_mode, get_column_metadata_source
+from backend.snapshot_store import SnapshotStore, plan_refresh, get_snapshot_ttl, snapshot_variant
+from backend.scoring import ScoreAccumulator
+from backend.context import compact_environment, ContextBuilder
+from backend.workload import collect_workload, apply_workload, get_workload_window_days
+from backend.analysis_store import AnalysisStore
+from backend.trend_store import TrendStore, is_small_change, has_changes
+from backend.jobs import JobManager
+from backend.llm_cache import ResponseCache
+from backend.limits import get_llm_call_slots, llm_scheduler
+from backend.batch import run_batch, get_max_parallel_projects, checkpoint_options
+from backend.metrics import span, record, Span, SpanRecorder, current_recorder, metrics_registry
 from pydantic import BaseModel
+from typing import Optional
 
 # Construct the path to the .env file in the project root and load it
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 if os.path.exists(dotenv_path):
     load_dotenv(dotenv_path=dotenv_path)
 
+# On-disk cache of per-dataset metadata, shared by all analyses.
+snapshot_store = SnapshotStore()
+
+# Finished analyses, referenced by ID from follow-up requests.
+analysis_store = AnalysisStore()
+
+# Append-only history of every analysis, for trends and incremental reports.
+trend_store = TrendStore() if os.getenv("TREND_STORE_ENABLED", "true").lower() in ("1", "true", "yes") else None
+
+# Most runs /api/trends/{project_id} returns at once.
+MAX_TREND_RUNS = 1000
+
+# On-disk cache of agent responses, keyed by agent and prompt.
+response_cache = ResponseCache() if os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes") else None
+
+
+def get_llm_backend() -> str:
+    """Returns the LLM backend from LLM_BACKEND: "gemini" (the default) or "fake"."""
+    return (os.getenv("LLM_BACKEND") or "gemini").lower()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="BigQuery Analyzer API",
@@ -78,6 +113,46 @@ def create_discovery_agent():
         tools=[discover_datasets_across_regions, execute_bigquery_query],
     )
 
+def get_discovery_mode(requested: str = None) -> str:
+    """
+    Resolves how datasets are discovered: "direct" calls the discovery function
+    in-process, "agent" goes through the discovery agent.
+    Falls back to the DISCOVERY_MODE environment variable, then to "direct".
+    """
+    mode = (requested or os.getenv("DISCOVERY_MODE") or "direct").lower()
+    if mode not in ("direct", "agent"):
+        raise ValueError(f"Unknown discovery mode '{mode}'. Expected 'direct' or 'agent'.")
+    return mode
+
+async def discover_datasets_with_agent(project_id: str) -> list:
+    """Discovers datasets through the discovery agent and parses its JSON output."""
+    discovery_agent = create_discovery_agent()
+    discovery_prompt = f"Find all datasets in the project `{project_id}`. Use the discover_datasets_across_regions tool to automatically find datasets across all regions."
+    dataset_list_json_str = await run_agent(discovery_agent, discovery_prompt, use_cache=False)
+
+    try:
+        if dataset_list_json_str.strip().startswith("```json"):
+            dataset_list_json_str = dataset_list_json_str.strip()[7:-4].strip()
+        if not dataset_list_json_str.strip():
+            raise ValueError("The Discovery Agent returned an empty response.")
+        discovered_datasets = json.loads(dataset_list_json_str)
+
+        # Handle both old format (list of dicts with schema_name) and new format (dict with datasets array)
+        if isinstance(discovered_datasets, dict) and "datasets" in discovered_datasets:
+            # New format from discover_datasets_across_regions
+            discovered_datasets = discovered_datasets["datasets"]
+            print(f"Discovered {len(discovered_datasets)} datasets across multiple regions")
+        elif isinstance(discovered_datasets, list):
+            # Old format - ensure each item has schema_name
+            discovered_datasets = [{"schema_name": item.get("schema_name", item)} for item in discovered_datasets]
+        else:
+            raise ValueError("Unexpected dataset discovery format")
+
+    except (json.JSONDecodeError, ValueError) as e:
+        raise Exception(f"Discovery Agent failed to return valid JSON. Raw output: '{dataset_list_json_str}'. Error: {e}")
+
+    return discovered_datasets
+
 def create_summary_agent():
     """Creates the agent responsible for summarizing the full analysis."""
     return Agent(
@@ -85,7 +160,9 @@ def create_summary_agent():
         model="gemini-2.5-flash",
         instruction="""You are a world-class Google Cloud BigQuery expert, specializing in performance tuning and cost optimization.
 You will be given a `baseline_score` that was pre-calculated based on a set of objective rules (like missing descriptions, partitioning, etc.).
-You will also be given a JSON object containing the complete metadata for a Google Cloud project.
+You will also be given a JSON object summarizing the metadata of a Google Cloud project: totals, per-dataset statistics, the points deducted per rule, and the tables with the most issues.
+If the query workload was analyzed, tables also carry `query_count`, `gb_processed`, `slot_hours` and `full_scans` (queries that read the whole table) for the analyzed window, and `hottest_tables` lists the tables that cost the most to query. Prioritize findings on tables that are both expensive to query and poorly optimized.
+Each dataset also carries its storage `billing_model` and its `monthly_cost` in USD (both null if the billing model could not be read), as well as what its storage would cost under logical and physical billing. `billing_model_savings` ranks the datasets whose storage would be cheaper under the other billing model. Report significant savings as findings, and mention that physical billing also charges for time travel and fail-safe storage (`time_travel_gb`), which a shorter time travel window reduces.
 
 Your task is to perform a holistic analysis and generate a final report. Use the `baseline_score` as a strong reference for your final `health_score`.
 You can adjust the score slightly up or down based on your holistic analysis of the data, but you should justify any significant deviation in your "Key Findings".
@@ -126,38 +203,24 @@ You will receive a **Task** and a **Context**.
         tools=[perform_google_search],
     )
 
-def calculate_health_score(all_data: list) -> int:
-    """Calculates a health score based on a set of rules."""
-    score = 100
-    for dataset in all_data:
-        # Deduct for missing dataset description
-        if not dataset.get("has_dataset_description"):
-            score -= 5
-
-        for table in dataset.get("tables", []):
-            # Deduct for missing table description
-            if not table.get("has_table_description"):
-                score -= 2
-            
-            # Deduct for incomplete column descriptions
-            if table.get("column_description_completeness", 0) < 0.5:
-                score -= 4
-
-            # Deduct for large, unpartitioned tables
-            if table.get("billable_gb", 0) > 1 and not table.get("partitioning_info"):
-                score -= 10
-            
-            # Deduct for stale tables
-            last_modified_str = table.get("last_modified")
-            if last_modified_str:
-                last_modified_dt = datetime.fromisoformat(last_modified_str)
-                if datetime.now(timezone.utc) - last_modified_dt > timedelta(days=90):
-                    score -= 3
-
-    return max(0, score) # Ensure score doesn't go below 0
-
-async def run_agent(agent, initial_prompt):
-    """A helper function to run an agent and return its final response."""
+async def _run_agent_once(agent, initial_prompt, streaming, agent_span):
+    """
+    One attempt at an agent run: yields partial text chunks as (True, text) and the
+    final response as (False, text). Waiting for the model's next event gives up with
+    a TimeoutError once the run has taken LLM_TIMEOUT_SECONDS.
+    """
+    if get_llm_backend() == "fake":
+        from backend.fake_backend import fake_agent_response
+        agent_span.set(backend="fake")
+        async with asyncio.timeout(llm_scheduler.timeout):
+            final_response_text = await fake_agent_response(agent.name, initial_prompt)
+        if streaming:
+            for start in range(0, len(final_response_text), 200):
+                yield True, final_response_text[start:start + 200]
+        yield False, final_response_text
+        return
+
+    deadline = asyncio.get_running_loop().time() + llm_scheduler.timeout
     app_name = "bigquery_analyzer_app"
     user_id = "default_user"
     session_id = str(uuid.uuid4())
@@ -172,174 +235,639 @@ async def run_agent(agent, initial_prompt):
 
     final_response_text = ""
     events_async = runner.run_async(
-        user_id=user_id, session_id=session_id, new_message=message_content
+        user_id=user_id, session_id=session_id, new_message=message_content,
+        run_config=RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE),
     )
 
-    async for event in events_async:
-        if event.is_final_response() and event.content and event.content.parts:
-            final_response_text = "".join(part.text or "" for part in event.content.parts)
-            
+    async with aclosing(events_async):
+        while True:
+            # The deadline only covers waiting for the model, not the time our consumer
+            # spends between chunks, so it is applied to each event separately.
+            try:
+                async with asyncio.timeout_at(deadline):
+                    event = await anext(events_async)
+            except StopAsyncIteration:
+                break
+            usage = getattr(event, "usage_metadata", None)
+            if usage is not None:
+                agent_span.set(prompt_tokens=usage.prompt_token_count, response_tokens=usage.candidates_token_count)
+            if event.partial and event.content and event.content.parts:
+                partial_text = "".join(part.text or "" for part in event.content.parts)
+                if partial_text:
+                    yield True, partial_text
+            elif event.is_final_response() and event.content and event.content.parts:
+                final_response_text = "".join(part.text or "" for part in event.content.parts)
+
     if not final_response_text:
         raise Exception("Agent did not produce a final text report.")
+    yield False, final_response_text
+
+async def stream_agent(agent, initial_prompt, use_cache=True, streaming=True):
+    """
+    Runs an agent and yields its output as it is generated.
+
+    Yields (is_partial, text) tuples: with `streaming`, partial text chunks as the model
+    produces them, and always one final (False, full_text) tuple at the end. Responses are
+    served from (and stored in) the response cache unless `use_cache` is False, which
+    callers should pass when the agent reads live data through tools. A cached response
+    is yielded as the final text without partial chunks.
+
+    Runs are paced by the shared LLM scheduler, and a run that fails with a rate-limit
+    or server error is retried with backoff, as long as none of its output has been
+    yielded yet. With LLM_BACKEND=fake, canned responses are returned instead and never cached.
+    """
+    use_cache = use_cache and response_cache is not None and get_llm_backend() != "fake"
+    if use_cache:
+        with span("agent", agent.name) as agent_span:
+            cached_response = await asyncio.to_thread(response_cache.get, agent, initial_prompt)
+            agent_span.set(cache_hit=cached_response is not None)
+        if cached_response is not None:
+            yield False, cached_response
+            return
+
+    # Each run is recorded as a span, with the token counts the model reports.
+    with span("agent", agent.name, streaming=streaming, cache_hit=False) as agent_span:
+        attempt = 0
+        while True:
+            await llm_scheduler.wait_turn()
+            streamed = False
+            try:
+                # Agent runs from all analyses share a global limit (LLM_MAX_CONCURRENT_CALLS).
+                async with get_llm_call_slots():
+                    agent_span.set(queued_ms=agent_span.elapsed_ms())
+                    async with aclosing(_run_agent_once(agent, initial_prompt, streaming, agent_span)) as chunks:
+                        async for is_partial, text in chunks:
+                            if is_partial:
+                                streamed = True
+                                yield True, text
+                            else:
+                                final_response_text = text
+                llm_scheduler.succeeded()
+                break
+            except Exception as e:
+                if streamed or not llm_scheduler.should_retry(e, attempt):
+                    raise
+                delay = llm_scheduler.backoff(e, attempt)
+                attempt += 1
+                agent_span.set(retries=attempt)
+                await asyncio.sleep(delay)
+
+    if use_cache:
+        await asyncio.to_thread(response_cache.put, agent, initial_prompt, final_response_text)
         
-    return final_response_text
+    yield False, final_response_text
 
-class ActionPlanRequest(BaseModel):
-    recommendation: dict
-    analysis_context: list
+async def run_agent(agent, initial_prompt, use_cache=True, on_partial=None):
+    """
+    A helper function to run an agent and return its final response.
+    If `on_partial` is given, the output is streamed and each partial text chunk is
+    passed to it as it arrives. See stream_agent for `use_cache`.
+    """
+    async with aclosing(stream_agent(agent, initial_prompt, use_cache, streaming=on_partial is not None)) as chunks:
+        async for is_partial, text in chunks:
+            if not is_partial:
+                return text
+            on_partial(text)
+
+async def generate_report(baseline_score: int, compact_context: dict, on_partial=None, previous_report: dict = None, diff: dict = None) -> dict:
+    """
+    Runs the summary agent over the compacted metadata and parses its JSON report.
+    Partial output is passed to `on_partial` as it is generated, if given.
+    Given the report of a previous analysis and the diff since then (see TrendStore.diff),
+    the agent only updates that report from the changes instead of analyzing all the metadata.
+    If nothing changed, the previous report is returned as is.
+    """
+    summary_agent = create_summary_agent()
+    if previous_report is not None and diff is not None:
+        if not has_changes(diff):
+            return previous_report
+        # The previous run's ID and time differ on every re-run; leaving them out keeps
+        # the prompt, and so the response cache key, the same for the same changes.
+        changes = {key: value for key, value in diff.items() if key != "previous_run"}
+        summary_prompt = f"The pre-calculated baseline score for this project is {baseline_score}, and was {diff['score']['before']} at the previous analysis. Below are the final summary report of the previous analysis and what changed in the project's metadata since then. Update the report: keep the findings and recommendations that still apply, revise or drop the ones the changes resolve, and add new ones for new issues. Respond in the same JSON format.\\nPrevious report: {json.dumps(previous_report)}\\nChanges: {json.dumps(changes)}"
+    else:
+        summary_prompt = f"The pre-calculated baseline score for this project is {baseline_score}. Analyze the following BigQuery project metadata, using the baseline score as a strong reference, and generate a final summary report. The data lists per-dataset statistics and the tables with the highest rule penalties.\\nData: {json.dumps(compact_context)}"
+
+    final_report_json_str = await run_agent(summary_agent, summary_prompt, on_partial=on_partial)
 
-@app.post("/api/generate_action_plan")
-async def generate_action_plan(request_data: ActionPlanRequest):
-    """Generates a detailed action plan for a specific recommendation."""
     try:
-        agent = create_action_plan_agent()
-        
-        # Construct a detailed prompt for the agent
-        prompt = f"""
+        if final_report_json_str.strip().startswith("```json"):
+            final_report_json_str = final_report_json_str.strip()[7:-4].strip()
+        return json.loads(final_report_json_str)
+    except json.JSONDecodeError as e:
+        if response_cache:
+            await asyncio.to_thread(response_cache.delete, summary_agent, summary_prompt)
+        raise Exception(f"Summary Agent produced invalid JSON. Raw output: {final_report_json_str}. Error: {e}")
+
+async def generate_reading_list(compact_context: dict) -> list:
+    """Runs the action plan agent to build a reading list. Returns an empty list if that fails."""
+    reading_list_agent = create_action_plan_agent() # Re-use the agent
+    reading_list_prompt = f"""
+    Task: Generate Reading List
+    Context: Here is a summary of the analysis of the BigQuery project. Please generate a reading list of 2-3 relevant articles or documentation pages that would be helpful for the user to read.
+    {json.dumps(compact_context)}
+    """
+    try:
+        reading_list_json_str = await run_agent(reading_list_agent, reading_list_prompt)
+    except Exception as e:
+        # If reading list fails, we can proceed without it
+        print(f"Agent failed to generate a reading list: {e}")
+        return []
+    try:
+        if reading_list_json_str.strip().startswith("```json"):
+            reading_list_json_str = reading_list_json_str.strip()[7:-4].strip()
+        return json.loads(reading_list_json_str).get("reading_list", [])
+    except json.JSONDecodeError as e:
+        if response_cache:
+            await asyncio.to_thread(response_cache.delete, reading_list_agent, reading_list_prompt)
+        # If reading list fails, we can proceed without it
+        print(f"Agent produced invalid JSON for reading list. Raw output: {reading_list_json_str}. Error: {e}")
+        return []
+
+class ActionPlanRequest(BaseModel):
+    recommendation: dict
+    # Preferred: the ID of a stored analysis, whose compacted context is reused.
+    analysis_id: Optional[str] = None
+    # Fallback: the full collected metadata, compacted on every request.
+    analysis_context: Optional[list] = None
+
+def resolve_analysis_context(request_data: ActionPlanRequest) -> dict:
+    """Returns the compacted context for an action plan request."""
+    if request_data.analysis_id:
+        analysis = analysis_store.get(request_data.analysis_id)
+        if analysis is None:
+            raise HTTPException(status_code=404, detail="Analysis not found or expired. Please run the analysis again.")
+        return analysis["compact_context"]
+    if request_data.analysis_context is not None:
+        return compact_environment(request_data.analysis_context)
+    raise HTTPException(status_code=400, detail="Either 'analysis_id' or 'analysis_context' is required.")
+
+def build_action_plan_prompt(recommendation: dict, compact_context: dict) -> str:
+    """Builds the action plan agent's prompt for a recommendation."""
+    return f"""
         Task: Generate Action Plan
 
         Here is the recommendation I need an action plan for:
-        Title: {request_data.recommendation.get('title')}
-        Details: {request_data.recommendation.get('details')}
+        Title: {recommendation.get('title')}
+        Details: {recommendation.get('details')}
 
-        Here is the full analysis context of the BigQuery project this recommendation applies to:
-        {json.dumps(request_data.analysis_context, indent=2)}
+        Here is a summary of the analysis of the BigQuery project this recommendation applies to:
+        {json.dumps(compact_context)}
 
         Please generate a step-by-step action plan to address this recommendation. Use your search tool to find the best, most current information.
         """
-        
+
+@app.post("/api/generate_action_plan")
+async def generate_action_plan(request_data: ActionPlanRequest):
+    """Generates a detailed action plan for a specific recommendation."""
+    compact_context = resolve_analysis_context(request_data)
+    try:
+        agent = create_action_plan_agent()
+        prompt = build_action_plan_prompt(request_data.recommendation, compact_context)
         action_plan_text = await run_agent(agent, prompt)
         return {"action_plan": action_plan_text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/analyze")
-async def analyze_environment(request: Request):
+@app.post("/api/generate_action_plan/stream")
+async def stream_action_plan(request_data: ActionPlanRequest):
     """
-    Triggers the BigQuery analysis and streams progress updates back to the client
-    using Server-Sent Events.
+    Streaming variant of /api/generate_action_plan. Sends 'action_plan_chunk' events
+    with partial markdown as it is generated, then one 'action_plan' event with the
+    complete plan (or an 'error' event).
     """
+    compact_context = resolve_analysis_context(request_data)
+
+    async def event_stream():
+        try:
+            agent = create_action_plan_agent()
+            prompt = build_action_plan_prompt(request_data.recommendation, compact_context)
+            async with aclosing(stream_agent(agent, prompt)) as chunks:
+                async for is_partial, text in chunks:
+                    if is_partial:
+                        yield {"event": "action_plan_chunk", "data": json.dumps({'text': text})}
+                    else:
+                        yield {"event": "action_plan", "data": json.dumps({'action_plan': text})}
+        except Exception as e:
+            yield {"event": "error", "data": json.dumps({'status': 'Error', 'details': str(e)})}
+
+    return EventSourceResponse(event_stream())
+
+def parse_analysis_options(request: Request) -> dict:
+    """Reads and validates the analysis options from the query parameters."""
     project_id = request.query_params.get("project_id")
     if not project_id:
         raise HTTPException(status_code=400, detail="Missing 'project_id' query parameter.")
-        
-    async def event_stream():
-        """The generator function that yields progress events."""
-        try:
-            # Initial state
-            yield {"event": "update", "data": json.dumps({'status': 'Starting', 'progress': 0, 'details': 'Initializing...'})}
-            yield {"event": "checkpoint", "data": json.dumps({'text': 'Connecting to Google Cloud...'})}
-            
-            if await request.is_disconnected(): return
-            region = os.getenv("GOOGLE_CLOUD_REGION")
-            if not os.getenv("GEMINI_API_KEY") or not region:
-                raise ValueError("Required environment variables are not set.")
-
-            # Step 1: Discover datasets
-            yield {"event": "update", "data": json.dumps({'status': 'Discovery', 'progress': 10, 'details': 'Discovering datasets...'})}
-            yield {"event": "checkpoint", "data": json.dumps({'text': 'Discovering all datasets in project...'})}
-            discovery_agent = create_discovery_agent()
-            discovery_prompt = f"Find all datasets in the project `{project_id}`. Use the discover_datasets_across_regions tool to automatically find datasets across all regions."
-            dataset_list_json_str = await run_agent(discovery_agent, discovery_prompt)
-            if await request.is_disconnected(): return
-            
-            try:
-                if dataset_list_json_str.strip().startswith("```json"):
-                    dataset_list_json_str = dataset_list_json_str.strip()[7:-4].strip()
-                if not dataset_list_json_str.strip():
-                    raise ValueError("The Discovery Agent returned an empty response.")
-                discovered_datasets = json.loads(dataset_list_json_str)
-                
-                # Handle both old format (list of dicts with schema_name) and new format (dict with datasets array)
-                if isinstance(discovered_datasets, dict) and "datasets" in discovered_datasets:
-                    # New format from discover_datasets_across_regions
-                    discovered_datasets = discovered_datasets["datasets"]
-                    print(f"Discovered {len(discovered_datasets)} datasets across multiple regions")
-                elif isinstance(discovered_datasets, list):
-                    # Old format - ensure each item has schema_name
-                    discovered_datasets = [{"schema_name": item.get("schema_name", item)} for item in discovered_datasets]
-                else:
-                    raise ValueError("Unexpected dataset discovery format")
-                    
-            except (json.JSONDecodeError, ValueError) as e:
-                raise Exception(f"Discovery Agent failed to return valid JSON. Raw output: '{dataset_list_json_str}'. Error: {e}")
-
-            # Step 2: Gather table details
-            yield {"event": "checkpoint", "data": json.dumps({'text': f'Found {len(discovered_datasets)} datasets. Fetching details...'})}
-            full_environment_data = []
-            total_datasets = len(discovered_datasets)
-            for i, dataset_info in enumerate(discovered_datasets):
-                if await request.is_disconnected(): break
-                dataset_name = dataset_info.get("schema_name")
-                if not dataset_name: continue
-                
-                # Use the region from discovery if available, otherwise fall back to env var
+    return {"project_id": project_id, **parse_collection_options(request)}
+
+def parse_collection_options(request: Request) -> dict:
+    """Reads and validates the project-independent analysis options from the query parameters."""
+    try:
+        parallelism = request.query_params.get("parallelism")
+        max_parallel = get_max_parallel_datasets(int(parallelism) if parallelism else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'parallelism' must be an integer.")
+    try:
+        workload_days = request.query_params.get("workload_days")
+        workload_days = get_workload_window_days(int(workload_days) if workload_days else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'workload_days' must be an integer.")
+    try:
+        collection_mode = get_collection_mode(request.query_params.get("collection_mode"))
+        column_source = get_column_metadata_source(request.query_params.get("column_source"))
+        discovery_mode = get_discovery_mode(request.query_params.get("discovery_mode"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "max_parallel": max_parallel,
+        "collection_mode": collection_mode,
+        "column_source": column_source,
+        "workload_days": workload_days,
+        "discovery_mode": discovery_mode,
+        "force_refresh": request.query_params.get("refresh", "").lower() in ("1", "true", "yes"),
+    }
+
+async def run_analysis(project_id: str, max_parallel: int, collection_mode: str, discovery_mode: str, force_refresh: bool, generate_reports: bool = True, column_source: str = "ddl", workload_days: int = 0):
+    """
+    Runs a full analysis of a project and yields its progress as SSE events.
+    This is independent of any client connection; it runs as a background job.
+    With `generate_reports` False, the analysis completes after scoring, without
+    running the report and reading-list agents. With `workload_days` > 0, the query
+    workload of that many days is analyzed too.
+
+    Each stage, BigQuery query and agent run is timed as a span; the spans are
+    emitted as 'metrics' events after every stage (and every collected dataset).
+    """
+    # Spans recorded in this task, and the threads and tasks it starts, belong to this
+    # analysis. Jobs run in their own tasks, so the recorder doesn't leak between them.
+    recorder = SpanRecorder()
+    current_recorder.set(recorder)
+    stage = None
+
+    def metrics_event(final: bool = False) -> dict:
+        data = {'spans': recorder.drain()}
+        if final:
+            data['summary'] = recorder.snapshot()
+        return {"event": "metrics", "data": json.dumps(data, default=str)}
+
+    try:
+        # Initial state
+        yield {"event": "update", "data": json.dumps({'status': 'Starting', 'progress': 0, 'details': 'Initializing...'})}
+        yield {"event": "checkpoint", "data": json.dumps({'text': 'Connecting to Google Cloud...'})}
+
+        region = os.getenv("GOOGLE_CLOUD_REGION")
+        if not region or (generate_reports and get_llm_backend() != "fake" and not os.getenv("GEMINI_API_KEY")):
+            raise ValueError("Required environment variables are not set.")
+
+        # Step 1: Discover datasets
+        yield {"event": "update", "data": json.dumps({'status': 'Discovery', 'progress': 10, 'details': 'Discovering datasets...'})}
+        yield {"event": "checkpoint", "data": json.dumps({'text': 'Discovering all datasets in project...'})}
+        stage = Span("stage", "discovery", mode=discovery_mode)
+        if discovery_mode == "agent":
+            discovered_datasets = await discover_datasets_with_agent(project_id)
+        else:
+            # Call the discovery function directly; no LLM round trip is needed to list datasets.
+            discovery_result = await asyncio.to_thread(discover_datasets, project_id)
+            discovered_datasets = discovery_result["datasets"]
+            print(f"Discovered {len(discovered_datasets)} datasets across {len(discovery_result['regions_checked'])} regions")
+        stage.set(datasets=len(discovered_datasets))
+        record(stage)
+        yield metrics_event()
+
+        # Step 2a: Aggregate the query workload first, so each dataset can be scored as
+        # soon as it is collected and rules can tell which tables are actually used.
+        workload = None
+        if workload_days:
+            yield {"event": "update", "data": json.dumps({'status': 'Analyzing', 'progress': 15, 'details': f'Analyzing query workload of the last {workload_days} days...'})}
+            yield {"event": "checkpoint", "data": json.dumps({'text': f'Analyzing query workload of the last {workload_days} days...'})}
+            stage = Span("stage", "workload", window_days=workload_days)
+            workload = await collect_workload(project_id, discovered_datasets, region, workload_days)
+            record(stage)
+            yield metrics_event()
+
+        # Step 2: Gather table details. Each dataset is scored and condensed as soon as it
+        # arrives and then dropped, so memory is bounded by the datasets in flight rather
+        # than by the size of the whole project.
+        yield {"event": "checkpoint", "data": json.dumps({'text': f'Found {len(discovered_datasets)} datasets. Fetching details...'})}
+        stage = Span("stage", "collection", mode=collection_mode, column_source=column_source)
+        score_accumulator = ScoreAccumulator()
+        context_builder = ContextBuilder()
+        total_datasets = len(discovered_datasets)
+        completed = 0
+        degraded = 0
+        # Each table's metrics and penalties are also appended to the trend store as they arrive.
+        # Runs are only compared with earlier runs made with the same options.
+        run_options = {"collection_mode": collection_mode, "column_source": column_source, "workload_days": workload_days}
+        run_id = await asyncio.to_thread(trend_store.begin_run, project_id, run_options) if trend_store else None
+
+        async def absorb(dataset_details: dict) -> None:
+            if workload is not None:
+                apply_workload([dataset_details], workload)
+            penalty, table_penalties = score_accumulator.add(dataset_details)
+            context_builder.add(dataset_details, penalty, table_penalties)
+            if run_id is not None:
+                await asyncio.to_thread(trend_store.add_dataset, run_id, dataset_details, table_penalties)
+
+        async def skip(dataset_name: str) -> None:
+            if run_id is not None:
+                await asyncio.to_thread(trend_store.skip_dataset, run_id, dataset_name)
+
+        # Reuse snapshots of datasets that haven't changed since they were last collected.
+        # A forced refresh collects every dataset again, without any change-marker query;
+        # its snapshots are stored without markers, so they are only reused within the TTL.
+        variant = snapshot_variant(collection_mode, column_source)
+        if force_refresh:
+            reused, datasets_to_fetch, change_markers = [], [d for d in discovered_datasets if d.get("schema_name")], {}
+        else:
+            reused, datasets_to_fetch, change_markers = await asyncio.to_thread(
+                plan_refresh, snapshot_store, project_id, discovered_datasets, region, get_snapshot_ttl(), variant
+            )
+        if reused:
+            yield {"event": "checkpoint", "data": json.dumps({'text': f'Reusing cached details for {len(reused)} unchanged datasets.'})}
+        for dataset_info in reused:
+            completed += 1
+            dataset_details = await asyncio.to_thread(snapshot_store.load_details, project_id, dataset_info["schema_name"], variant)
+            if dataset_details is not None:
+                await absorb(dataset_details)
+            else:
+                await skip(dataset_info["schema_name"])
+
+        # Datasets are fetched concurrently; progress is reported in completion order.
+        async with aclosing(collect_dataset_details(project_id, datasets_to_fetch, region, max_parallel, collection_mode, column_source)) as results:
+            async for dataset_info, dataset_details in results:
+                completed += 1
+                dataset_name = dataset_info["schema_name"]
                 dataset_region = dataset_info.get("region", region)
-                
-                progress = 20 + int((i / total_datasets) * 40)
-                yield {"event": "update", "data": json.dumps({'status': 'Fetching', 'progress': progress, 'details': f'Fetching details for: {dataset_name} in region {dataset_region}'})}
-                details_json_str = get_dataset_and_table_details(project_id=project_id, dataset_name=dataset_name, region=dataset_region)
-                dataset_details = json.loads(details_json_str)
+                progress = 20 + int((completed / total_datasets) * 40)
+                yield {"event": "update", "data": json.dumps({'status': 'Fetching', 'progress': progress, 'details': f'Fetched details for: {dataset_name} in region {dataset_region} ({completed}/{total_datasets})'})}
+                spans = recorder.drain()
+                if spans:
+                    yield {"event": "metrics", "data": json.dumps({'spans': spans}, default=str)}
                 if isinstance(dataset_details, dict) and "error" in dataset_details:
                     print(f"Skipping dataset {dataset_name} due to error: {dataset_details['error']}")
+                    await skip(dataset_name)
                     continue
-                full_environment_data.append(dataset_details)
-            if await request.is_disconnected(): return
-            
-            yield {"event": "checkpoint", "data": json.dumps({'text': 'All dataset details collected.'})}
-
-            # Step 3: Run Summary Agent
-            yield {"event": "update", "data": json.dumps({'status': 'Analyzing', 'progress': 75, 'details': 'Calculating health score...', 'full_environment_data': full_environment_data})}
-            yield {"event": "checkpoint", "data": json.dumps({'text': 'Calculating baseline health score...'})}
-            baseline_score = calculate_health_score(full_environment_data)
-
-            yield {"event": "update", "data": json.dumps({'status': 'Analyzing', 'progress': 85, 'details': 'Generating final report...'})}
-            yield {"event": "checkpoint", "data": json.dumps({'text': 'Sending data to AI for final analysis...'})}
-            summary_agent = create_summary_agent()
-            summary_prompt = f"The pre-calculated baseline score for this project is {baseline_score}. Analyze the following BigQuery project metadata, using the baseline score as a strong reference, and generate a final summary report.\\nData: {json.dumps(full_environment_data, indent=2)}"
-            
-            final_report_json_str = await run_agent(summary_agent, summary_prompt)
-            
-            try:
-                if final_report_json_str.strip().startswith("```json"):
-                    final_report_json_str = final_report_json_str.strip()[7:-4].strip()
-                final_report_obj = json.loads(final_report_json_str)
-            except json.JSONDecodeError as e:
-                raise Exception(f"Summary Agent produced invalid JSON. Raw output: {final_report_json_str}. Error: {e}")
-            
-            # Step 4: Generate Reading List
-            yield {"event": "update", "data": json.dumps({'status': 'Analyzing', 'progress': 95, 'details': 'Generating reading list...'})}
-            yield {"event": "checkpoint", "data": json.dumps({'text': 'Generating personalized reading list...'})}
-            reading_list_agent = create_action_plan_agent() # Re-use the agent
-            reading_list_prompt = f"""
-            Task: Generate Reading List
-            Context: Here is the full analysis of the BigQuery project. Please generate a reading list of 2-3 relevant articles or documentation pages that would be helpful for the user to read.
-            {json.dumps(full_environment_data, indent=2)}
-            """
-            reading_list_json_str = await run_agent(reading_list_agent, reading_list_prompt)
-            try:
-                if reading_list_json_str.strip().startswith("```json"):
-                    reading_list_json_str = reading_list_json_str.strip()[7:-4].strip()
-                reading_list_obj = json.loads(reading_list_json_str)
-            except json.JSONDecodeError as e:
-                 # If reading list fails, we can proceed without it
-                print(f"Agent produced invalid JSON for reading list. Raw output: {reading_list_json_str}. Error: {e}")
-                reading_list_obj = {"reading_list": []}
-
-            yield {"event": "checkpoint", "data": json.dumps({'text': 'Report generated successfully.'})}
-            yield {"event": "update", "data": json.dumps({
-                'status': 'Complete', 
-                'progress': 100, 
-                'report': final_report_obj,
-                'reading_list': reading_list_obj.get('reading_list', [])
-            })}
+                if dataset_details.get("collection_errors"):
+                    # Scored without the missing fields, and not snapshotted, so the next
+                    # analysis collects the dataset again.
+                    degraded += 1
+                    views = ", ".join(error["view"] for error in dataset_details["collection_errors"])
+                    yield {"event": "checkpoint", "data": json.dumps({'text': f'Collected {dataset_name} without the metadata from: {views}.'})}
+                else:
+                    # Snapshots store the static metadata only, without the workload.
+                    await asyncio.to_thread(
+                        snapshot_store.save, project_id, dataset_name, variant, dataset_region, dataset_details, change_markers.get(dataset_name)
+                    )
+                await absorb(dataset_details)
+        
+        stage.set(datasets=completed, reused=len(reused), degraded=degraded)
+        record(stage)
+        yield {"event": "checkpoint", "data": json.dumps({'text': 'All dataset details collected.'})}
+
+        # Step 3: Run Summary Agent
+        yield {"event": "update", "data": json.dumps({'status': 'Analyzing', 'progress': 75, 'details': 'Calculating health score...'})}
+        yield {"event": "checkpoint", "data": json.dumps({'text': 'Calculating baseline health score...'})}
+        with span("stage", "scoring"):
+            score_breakdown = score_accumulator.score()
+            # Condensed, size-bounded view of the metadata that is sent to the agents.
+            compact_context = context_builder.build(score_breakdown)
+        yield metrics_event()
+        baseline_score = score_breakdown["score"]
+        yield {"event": "score", "data": json.dumps({**score_breakdown, 'totals': compact_context["totals"]})}
+
+        # Record the run and compare it with the project's previous analysis, if any.
+        diff = None
+        previous_run = None
+        if run_id is not None:
+            with span("stage", "trends"):
+                await asyncio.to_thread(trend_store.finish_run, run_id, score_breakdown, compact_context["totals"])
+                previous_run = await asyncio.to_thread(trend_store.previous_run, project_id, run_id)
+                if previous_run is not None:
+                    diff = await asyncio.to_thread(trend_store.diff, previous_run["run_id"], run_id)
+            if diff is not None:
+                yield {"event": "trend", "data": json.dumps({'diff': diff})}
+                yield {"event": "checkpoint", "data": json.dumps({'text': (
+                    f"Score {diff['score']['before']} -> {diff['score']['after']} since the previous analysis: "
+                    f"{diff['tables_added']} tables added, {diff['tables_removed']} removed, {diff['tables_changed']} changed."
+                )})}
+
+        # Keep the results server-side so follow-up requests can refer to them by ID.
+        analysis_id = analysis_store.put({
+            "project_id": project_id,
+            "compact_context": compact_context,
+            "score_breakdown": score_breakdown,
+            "diff": diff,
+        })
+        yield {"event": "session", "data": json.dumps({'analysis_id': analysis_id})}
+
+        if not generate_reports:
+            yield metrics_event(final=True)
+            yield {"event": "update", "data": json.dumps({'status': 'Complete', 'progress': 100, 'analysis_id': analysis_id, 'report': None, 'reading_list': []})}
+            return
+
+        yield {"event": "update", "data": json.dumps({'status': 'Analyzing', 'progress': 85, 'details': 'Generating final report and reading list...'})}
+        yield {"event": "checkpoint", "data": json.dumps({'text': 'Sending data to AI for final analysis...'})}
+
+        # If little changed since the previous analysis, its report is only updated from the
+        # diff, which keeps the summary prompt small for routine re-runs.
+        previous_report = None
+        if diff is not None and is_small_change(diff) and os.getenv("INCREMENTAL_REPORTS_ENABLED", "true").lower() in ("1", "true", "yes"):
+            previous_report = await asyncio.to_thread(trend_store.load_report, previous_run["run_id"])
+            if previous_report is not None and not has_changes(diff):
+                yield {"event": "checkpoint", "data": json.dumps({'text': 'No changes since the previous analysis; reusing its report.'})}
+            elif previous_report is not None:
+                yield {"event": "checkpoint", "data": json.dumps({'text': 'Few changes since the previous analysis; updating its report.'})}
+
+        # Step 4: The report and the reading list only depend on the collected data,
+        # so both agents run concurrently and each result is streamed as soon as it's ready.
+        # Partial report output is streamed as 'report_chunk' events while it is generated.
+        stage = Span("stage", "reports")
+        report_chunks = asyncio.Queue()
+        tasks = {
+            asyncio.create_task(generate_report(
+                baseline_score, compact_context, on_partial=report_chunks.put_nowait, previous_report=previous_report, diff=diff,
+            )): "report",
+            asyncio.create_task(generate_reading_list(compact_context)): "reading_list",
+        }
+        results = {}
+        pending = set(tasks)
+        try:
+            while pending:
+                next_chunk = asyncio.create_task(report_chunks.get())
+                done, pending = await asyncio.wait(pending | {next_chunk}, return_when=asyncio.FIRST_COMPLETED)
+                if next_chunk.done():
+                    yield {"event": "report_chunk", "data": json.dumps({'text': next_chunk.result()})}
+                else:
+                    next_chunk.cancel()
+                    pending.discard(next_chunk)
+                done.discard(next_chunk)
+                for task in done:
+                    name = tasks[task]
+                    results[name] = task.result()
+                    if name == "report":
+                        while not report_chunks.empty():
+                            yield {"event": "report_chunk", "data": json.dumps({'text': report_chunks.get_nowait()})}
+                        analysis_store.update(analysis_id, report=results[name])
+                        if run_id is not None:
+                            await asyncio.to_thread(trend_store.save_report, run_id, results[name])
+                    checkpoint_text = 'Final report generated.' if name == "report" else 'Reading list generated.'
+                    yield {"event": "checkpoint", "data": json.dumps({'text': checkpoint_text})}
+                    yield {"event": name, "data": json.dumps({name: results[name]})}
+        finally:
+            for task in pending:
+                task.cancel()
+        record(stage)
+        yield metrics_event(final=True)
+
+        yield {"event": "update", "data": json.dumps({
+            'status': 'Complete', 
+            'progress': 100, 
+            'analysis_id': analysis_id,
+            'report': results["report"],
+            'reading_list': results["reading_list"]
+        })}
 
-        except Exception as e:
-            error_message = f"An error occurred during analysis: {e}"
-            yield {"event": "error", "data": json.dumps({'status': 'Error', 'details': error_message})}
+    except Exception as e:
+        if stage is not None and stage.latency_ms is None:
+            # The stage that failed.
+            stage.error = f"{type(e).__name__}: {e}"
+            record(stage)
+        yield metrics_event(final=True)
+        error_message = f"An error occurred during analysis: {e}"
+        yield {"event": "error", "data": json.dumps({'status': 'Error', 'details': error_message})}
+
+
+def submit_analysis(request: Request):
+    """Submits an analysis job for the request's options, coalescing with an identical one in flight."""
+    options = parse_analysis_options(request)
+    # A forced refresh is still satisfied by an analysis that is already running.
+    key = (options["project_id"], options["collection_mode"], options["column_source"], options["workload_days"], options["discovery_mode"])
+    return job_manager.submit(key, **options)
+
+async def stream_job_events(request: Request, job, start: int = 0):
+    """Streams a job's events (replaying from `start`) until it finishes or the client disconnects."""
+    async for index, event in job.follow(start):
+        if await request.is_disconnected(): return
+        yield {**event, "id": str(index)}
+
+def get_resume_index(request: Request) -> int:
+    """Returns the index of the first event a re-attaching client hasn't seen yet."""
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        return int(last_event_id) + 1 if last_event_id else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'last_event_id' must be an integer.")
+
+@app.get("/api/analyze")
+async def analyze_environment(request: Request):
+    """
+    Triggers the BigQuery analysis and streams progress updates back to the client
+    using Server-Sent Events. The analysis runs as a background job, so it keeps
+    running if the client disconnects; the first event carries the job ID for
+    re-attaching through /api/jobs/{job_id}/events.
+    """
+    job, coalesced = submit_analysis(request)
+
+    async def event_stream():
+        yield {"event": "job", "data": json.dumps({'job_id': job.id, 'coalesced': coalesced})}
+        async for event in stream_job_events(request, job):
+            yield event
 
     return EventSourceResponse(event_stream())
 
+@app.post("/api/jobs")
+async def create_job(request: Request):
+    """Submits an analysis as a background job. Accepts the same query parameters as /api/analyze."""
+    job, coalesced = submit_analysis(request)
+    return {**job.to_dict(), "coalesced": coalesced}
+
+def get_job_or_404(job_id: str, manager: JobManager = None):
+    job = (manager or job_manager).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Returns a job's status, and its result once it has finished."""
+    return get_job_or_404(job_id).to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(job_id: str, request: Request):
+    """
+    (Re-)attaches to a job's progress stream. Events already produced are replayed,
+    starting after the Last-Event-ID header or `last_event_id` query parameter if given.
+    """
+    job = get_job_or_404(job_id)
+    return EventSourceResponse(stream_job_events(request, job, get_resume_index(request)))
+
+@app.post("/api/batches")
+async def create_batch(request: Request):
+    """
+    Starts a batch scan of every project under an organization or folder, as a background job.
+    Query parameters: `parent` ("organizations/<id>" or "folders/<id>"), optionally
+    `parallel_projects`, `reports=false` to skip the AI reports, `restart=true` to discard
+    checkpoints, and the same collection options as /api/analyze.
+    """
+    parent = request.query_params.get("parent")
+    if not parent:
+        raise HTTPException(status_code=400, detail="Missing 'parent' query parameter.")
+    try:
+        parallel_projects = request.query_params.get("parallel_projects")
+        max_parallel_projects = get_max_parallel_projects(int(parallel_projects) if parallel_projects else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'parallel_projects' must be an integer.")
+    analysis_options = parse_collection_options(request)
+    analysis_options["generate_reports"] = request.query_params.get("reports", "true").lower() in ("1", "true", "yes")
+    restart = request.query_params.get("restart", "").lower() in ("1", "true", "yes")
+    job, coalesced = batch_manager.submit(
+        (parent,),
+        parent=parent,
+        analysis_options=analysis_options,
+        max_parallel_projects=max_parallel_projects,
+        restart=restart,
+    )
+    # The batch in flight can't discard its own checkpoints, nor write them with other options.
+    if coalesced and (restart or checkpoint_options(job.params["analysis_options"]) != checkpoint_options(analysis_options)):
+        raise HTTPException(status_code=409, detail=f"Batch {job.id} for {parent} is still running with other analysis options; wait for it to finish.")
+    return {**job.to_dict(), "coalesced": coalesced}
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Returns a batch's status, and its fleet report once it has finished."""
+    return get_job_or_404(batch_id, batch_manager).to_dict()
+
+@app.get("/api/batches/{batch_id}/events")
+async def get_batch_events(batch_id: str, request: Request):
+    """Streams a batch's progress, with the same replay semantics as /api/jobs/{job_id}/events."""
+    job = get_job_or_404(batch_id, batch_manager)
+    return EventSourceResponse(stream_job_events(request, job, get_resume_index(request)))
+
+@app.get("/api/metrics")
+async def get_metrics(request: Request):
+    """
+    Returns span aggregates (count, errors, latency, bytes processed, slot-ms, cache hits
+    and tokens) per stage and target since the server started. Pass `format=prometheus`
+    for the Prometheus text format.
+    """
+    if request.query_params.get("format") == "prometheus":
+        return PlainTextResponse(metrics_registry.prometheus(), media_type="text/plain; version=0.0.4")
+    return {"stages": metrics_registry.snapshot()}
+
+@app.get("/api/trends/{project_id}")
+async def get_trends(project_id: str, limit: int = Query(30, ge=1, le=MAX_TREND_RUNS)):
+    """
+    Returns the score, totals and per-rule penalties of the project's latest finished
+    analyses, oldest first. `limit` sets how many (default 30, at most MAX_TREND_RUNS).
+    """
+    if trend_store is None:
+        raise HTTPException(status_code=404, detail="The trend store is disabled.")
+    return {"project_id": project_id, "runs": await asyncio.to_thread(trend_store.history, project_id, limit)}
+
+# Background analyses and batch scans; created after run_analysis is defined.
+job_manager = JobManager(run_analysis)
+batch_manager = JobManager(partial(run_batch, run_analysis), max_concurrent=int(os.getenv("MAX_CONCURRENT_BATCHES", 1)))
+
 def start():
     """Starts the Uvicorn server."""
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
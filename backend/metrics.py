@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterator
+
+# The OpenTelemetry export is optional: install the "otel" extra and set METRICS_OTEL_ENABLED=true.
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# Upper bounds (in seconds) of the latency histogram buckets in the Prometheus output.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Numeric span attributes that are summed per stage.
+SUMMED_ATTRIBUTES = ("bytes_processed", "slot_ms", "prompt_tokens", "response_tokens", "retries")
+
+
+class Span:
+    """
+    One timed unit of work, e.g. a BigQuery query or an agent run.
+
+    `name` is the stage (e.g. "bigquery.query") and `target` what it worked on
+    (e.g. the INFORMATION_SCHEMA view or the agent), so spans can be aggregated
+    per stage and target.
+    """
+    def __init__(self, name: str, target: Optional[str] = None, **attributes: Any):
+        self.name = name
+        self.target = target
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.started_at = time.time()
+        self.latency_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    def set(self, **attributes: Any) -> None:
+        """Adds attributes, ignoring None values."""
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "target": self.target,
+            "started_at": self.started_at,
+            "latency_ms": self.latency_ms,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class MetricsRegistry:
+    """Aggregates spans per (stage, target): counts, errors, latency and summed attributes."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+
+    def observe(self, span: Span) -> None:
+        with self._lock:
+            stage = self._stages.get((span.name, span.target))
+            if stage is None:
+                stage = self._stages[(span.name, span.target)] = {
+                    "count": 0, "errors": 0, "cache_hits": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0,
+                    "buckets": [0] * len(LATENCY_BUCKETS), **{key: 0 for key in SUMMED_ATTRIBUTES},
+                }
+            stage["count"] += 1
+            stage["errors"] += span.error is not None
+            stage["cache_hits"] += bool(span.attributes.get("cache_hit"))
+            stage["latency_ms_total"] += span.latency_ms
+            stage["latency_ms_max"] = max(stage["latency_ms_max"], span.latency_ms)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if span.latency_ms / 1000 <= bound:
+                    stage["buckets"][i] += 1
+            for key in SUMMED_ATTRIBUTES:
+                stage[key] += span.attributes.get(key) or 0
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Returns the aggregates as a JSON-serializable list, one entry per stage and target,
+        slowest stage (by total latency) first.
+        """
+        with self._lock:
+            stages = [
+                {
+                    "name": name,
+                    "target": target,
+                    **{key: value for key, value in stage.items() if key != "buckets"},
+                    "latency_ms_total": round(stage["latency_ms_total"], 1),
+                    "latency_ms_avg": round(stage["latency_ms_total"] / stage["count"], 1),
+                    "latency_ms_max": round(stage["latency_ms_max"], 1),
+                }
+                for (name, target), stage in self._stages.items()
+            ]
+        return sorted(stages, key=lambda stage: stage["latency_ms_total"], reverse=True)
+
+    def prometheus(self) -> str:
+        """Renders the aggregates in the Prometheus text exposition format."""
+        lines = [
+            "# HELP bq_analyzer_span_latency_seconds Latency of analysis stages, BigQuery queries and agent runs.",
+            "# TYPE bq_analyzer_span_latency_seconds histogram",
+        ]
+        counters = []
+        with self._lock:
+            for (name, target), stage in sorted(self._stages.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+                labels = f'span="{name}",target="{target or ""}"'
+                for bound, count in zip(LATENCY_BUCKETS, stage["buckets"]):
+                    lines.append(f'bq_analyzer_span_latency_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'bq_analyzer_span_latency_seconds_bucket{{{labels},le="+Inf"}} {stage["count"]}')
+                lines.append(f"bq_analyzer_span_latency_seconds_sum{{{labels}}} {stage['latency_ms_total'] / 1000:.6f}")
+                lines.append(f"bq_analyzer_span_latency_seconds_count{{{labels}}} {stage['count']}")
+                for key in ("errors", "cache_hits") + SUMMED_ATTRIBUTES:
+                    counters.append((key, labels, stage[key]))
+        for key in ("errors", "cache_hits") + SUMMED_ATTRIBUTES:
+            lines.append(f"# TYPE bq_analyzer_{key}_total counter")
+            lines.extend(f"bq_analyzer_{key}_total{{{labels}}} {value}" for name, labels, value in counters if name == key)
+        return "\n".join(lines) + "\n"
+
+
+class SpanRecorder(MetricsRegistry):
+    """The spans of one analysis: aggregated like the registry, and buffered until drained into SSE events."""
+    def __init__(self):
+        super().__init__()
+        self._pending: List[Dict[str, Any]] = []
+
+    def observe(self, span: Span) -> None:
+        super().observe(span)
+        with self._lock:
+            self._pending.append(span.to_dict())
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Returns the spans recorded since the last call."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+
+# Process-wide aggregates, served by /api/metrics.
+metrics_registry = MetricsRegistry()
+
+# The recorder of the analysis running in the current task (and the threads it starts).
+current_recorder: contextvars.ContextVar[Optional[SpanRecorder]] = contextvars.ContextVar("current_recorder", default=None)
+
+
+def _otel_enabled() -> bool:
+    return otel_trace is not None and os.getenv("METRICS_OTEL_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+def _export_otel(span: Span) -> None:
+    """Exports a finished span through the globally configured OpenTelemetry tracer provider."""
+    tracer = otel_trace.get_tracer("bq-health-analyzer")
+    attributes = {key: value for key, value in span.attributes.items() if isinstance(value, (str, bool, int, float))}
+    if span.target:
+        attributes["target"] = span.target
+    started_ns = int(span.started_at * 1e9)
+    otel_span = tracer.start_span(span.name, start_time=started_ns, attributes=attributes)
+    if span.error:
+        otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+    otel_span.end(end_time=started_ns + int(span.latency_ms * 1e6))
+
+
+@contextmanager
+def span(name: str, target: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Times the enclosed block as a span. Attributes can be added through the yielded
+    Span. On exit, the span is recorded in the process-wide registry, in the current
+    analysis' recorder (if any), and exported to OpenTelemetry if enabled. Exceptions
+    are recorded as the span's error and re-raised.
+    """
+    current = Span(name, target, **attributes)
+    try:
+        yield current
+    except GeneratorExit:
+        # The consumer of a generator stopped early; that's not a failure of the span.
+        raise
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record(current)
+
+
+def record(current: Span) -> None:
+    """
+    Finishes a span and records it. The `span` context manager calls this on exit;
+    call it directly for spans that can't be a `with` block, e.g. pipeline stages
+    that yield events in between.
+    """
+    current.latency_ms = current.elapsed_ms()
+    metrics_registry.observe(current)
+    recorder = current_recorder.get()
+    if recorder is not None:
+        recorder.observe(current)
+    if _otel_enabled():
+        _export_otel(current)
+
+
+def in_current_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wraps `fn` so that every call runs in a copy of the caller's context. Thread pools
+    don't propagate context variables, so this keeps spans recorded in worker threads
+    attributed to the analysis that started them.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
@@ -0,0 +1,342 @@
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from itertools import compress
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+# Tables not modified for longer than this are considered stale.
+STALE_AFTER = timedelta(days=90)
+
+# Unpartitioned tables with more billable storage than this (in GB) are penalized.
+LARGE_TABLE_GB = 1
+
+# Tables with a lower share of described columns are penalized.
+MIN_COLUMN_COMPLETENESS = 0.5
+
+# Partitioned or clustered tables scanned in full at least this often in the workload
+# window are penalized, since their queries don't benefit from pruning.
+MIN_FULL_SCANS = 5
+
+# Unpartitioned tables from which queries processed more than this (in GB) in the
+# workload window are penalized.
+HOT_TABLE_GB_PROCESSED = 100
+
+
+class ScoringRule:
+    """
+    A single health-scoring rule.
+
+    A rule applies either to each dataset or to each table, declares the metadata
+    fields it reads, and deducts `penalty` points every time its predicate matches.
+    The predicate is called once per batch as predicate(context, *columns), with one
+    list of values per field, and returns one boolean per entry. `context` holds
+    run-wide values such as the staleness cutoff.
+    """
+    def __init__(self, name: str, level: str, fields: List[str], penalty: int, predicate: Callable[..., List[bool]], description: str = ""):
+        if level not in ("dataset", "table"):
+            raise ValueError(f"Rule '{name}' has unknown level '{level}'. Expected 'dataset' or 'table'.")
+        self.name = name
+        self.level = level
+        self.fields = list(fields)
+        self.penalty = penalty
+        self.predicate = predicate
+        self.description = description
+
+
+# All registered rules, by name. Rules are evaluated in registration order.
+RULES: Dict[str, ScoringRule] = {}
+
+# Fields computed from the raw metadata rather than read as-is. Any other field
+# name is read with entry.get(field).
+DERIVED_FIELDS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "last_modified_at": lambda table: datetime.fromisoformat(table["last_modified"]) if table.get("last_modified") else None,
+    "is_partitioned": lambda table: bool(table.get("partitioning_info")),
+}
+
+# The collected field each derived field is computed from.
+DERIVED_FIELD_SOURCES: Dict[str, str] = {
+    "last_modified_at": "last_modified",
+    "is_partitioned": "partitioning_info",
+}
+
+
+def register_rule(name: str, level: str, fields: List[str], penalty: int, description: str = ""):
+    """
+    Decorator that registers a column-wise predicate as a scoring rule.
+
+    Args:
+        name: The unique rule name. Registering an existing name replaces that rule.
+        level: "dataset" or "table".
+        fields: The metadata fields passed to the predicate as columns, in order.
+        penalty: The points deducted per match.
+        description: A short human-readable explanation of the rule.
+    """
+    def decorator(predicate: Callable[..., List[bool]]) -> Callable[..., List[bool]]:
+        RULES[name] = ScoringRule(name, level, fields, penalty, predicate, description)
+        return predicate
+    return decorator
+
+
+@register_rule("missing_dataset_description", "dataset", ["has_dataset_description"], 5,
+               "The dataset has no description.")
+def _missing_dataset_description(context, has_dataset_description):
+    return [not described for described in has_dataset_description]
+
+
+@register_rule("missing_table_description", "table", ["has_table_description"], 2,
+               "The table has no description.")
+def _missing_table_description(context, has_table_description):
+    return [not described for described in has_table_description]
+
+
+@register_rule("incomplete_column_descriptions", "table", ["column_description_completeness"], 4,
+               "Fewer than half of the table's columns are described.")
+def _incomplete_column_descriptions(context, completeness):
+    return [(share or 0) < MIN_COLUMN_COMPLETENESS for share in completeness]
+
+
+@register_rule("large_unpartitioned_table", "table", ["billable_gb", "is_partitioned"], 10,
+               "The table stores more than 1 GB and is not partitioned.")
+def _large_unpartitioned_table(context, billable_gb, is_partitioned):
+    return [(gb or 0) > LARGE_TABLE_GB and not partitioned for gb, partitioned in zip(billable_gb, is_partitioned)]
+
+
+@register_rule("stale_table", "table", ["last_modified_at"], 3,
+               "The table has not been modified in over 90 days.")
+def _stale_table(context, last_modified_at):
+    stale_before = context["stale_before"]
+    return [modified is not None and modified < stale_before for modified in last_modified_at]
+
+
+@register_rule("missed_partition_pruning", "table", ["is_partitioned", "full_scans"], 5,
+               "The table is partitioned, but queries regularly scan all of it.")
+def _missed_partition_pruning(context, is_partitioned, full_scans):
+    return [partitioned and (scans or 0) >= MIN_FULL_SCANS for partitioned, scans in zip(is_partitioned, full_scans)]
+
+
+@register_rule("missed_cluster_pruning", "table", ["clustering_info", "full_scans"], 3,
+               "The table is clustered, but queries regularly scan all of it.")
+def _missed_cluster_pruning(context, clustering_info, full_scans):
+    return [bool(clustering) and (scans or 0) >= MIN_FULL_SCANS for clustering, scans in zip(clustering_info, full_scans)]
+
+
+@register_rule("heavily_scanned_unpartitioned_table", "table", ["billable_gb", "is_partitioned", "gb_processed"], 10,
+               "The table stores more than 1 GB, is not partitioned, and queries processed over 100 GB from it.")
+def _heavily_scanned_unpartitioned_table(context, billable_gb, is_partitioned, gb_processed):
+    return [
+        (gb or 0) > LARGE_TABLE_GB and not partitioned and (processed or 0) > HOT_TABLE_GB_PROCESSED
+        for gb, partitioned, processed in zip(billable_gb, is_partitioned, gb_processed)
+    ]
+
+
+def _extract_column(entries: List[Dict[str, Any]], field: str) -> list:
+    """Returns one field of every entry, in order."""
+    derive = DERIVED_FIELDS.get(field)
+    return list(map(derive, entries)) if derive else [entry.get(field) for entry in entries]
+
+
+def _degraded_datasets(all_data: List[Dict[str, Any]], rule: ScoringRule) -> set:
+    """
+    Returns the indexes of the datasets collected without a field the rule reads
+    (see "collection_errors"). The rule can't be judged there, so it never matches.
+    """
+    sources = {DERIVED_FIELD_SOURCES.get(field, field) for field in rule.fields}
+    return {
+        i for i, dataset in enumerate(all_data)
+        if any(sources.intersection(error.get("fields", ())) for error in dataset.get("collection_errors", ()))
+    }
+
+
+class ScoringEngine:
+    """
+    Evaluates the registered rules over collected metadata.
+
+    Each rule's matches are cached per dataset, so re-scoring with different
+    weights (or after adding a rule) never re-walks the metadata for rules that
+    were already evaluated.
+    """
+    def __init__(self, all_data: List[Dict[str, Any]], rules: Optional[Dict[str, ScoringRule]] = None, now: Optional[datetime] = None):
+        """
+        Args:
+            all_data: The collected dataset details (output of get_dataset_and_table_details).
+            rules: (Optional) The rules to evaluate. Defaults to all registered rules.
+            now: (Optional) The reference time for staleness. Defaults to the current UTC time.
+        """
+        self.rules = dict(rules if rules is not None else RULES)
+        self.context = {"stale_before": (now or datetime.now(timezone.utc)) - STALE_AFTER}
+        self.load(all_data)
+
+    def load(self, all_data: List[Dict[str, Any]]) -> None:
+        """
+        Replaces the metadata being scored, keeping the rules and context.
+
+        Args:
+            all_data: The collected dataset details to evaluate from now on.
+        """
+        self.all_data = all_data
+        self._tables: Optional[List[Dict[str, Any]]] = None
+        self._table_columns: Dict[str, list] = {}
+        self._table_dataset_index: Optional[List[int]] = None
+        # Rule name -> (rule, Counter of matches by dataset index, boolean mask over rows).
+        self._hits: Dict[str, Any] = {}
+
+    def _load_table_columns(self, fields: List[str]) -> None:
+        """Extracts the given table fields for every table, one column at a time."""
+        if self._tables is None:
+            self._tables = [table for dataset in self.all_data for table in dataset.get("tables", [])]
+            self._table_dataset_index = [i for i, dataset in enumerate(self.all_data) for _ in dataset.get("tables", [])]
+        for field in fields:
+            if field not in self._table_columns:
+                self._table_columns[field] = _extract_column(self._tables, field)
+
+    def evaluate(self) -> Dict[str, Counter]:
+        """
+        Evaluates every rule that isn't cached yet.
+
+        Returns:
+            A dict mapping rule names to a Counter of matches by dataset index.
+        """
+        pending = [rule for rule in self.rules.values() if self._hits.get(rule.name, (None,))[0] is not rule]
+        table_fields = list(dict.fromkeys(f for rule in pending if rule.level == "table" for f in rule.fields))
+        if table_fields:
+            self._load_table_columns(table_fields)
+
+        for rule in pending:
+            if rule.level == "dataset":
+                columns = [_extract_column(self.all_data, f) for f in rule.fields]
+                indexes = range(len(self.all_data))
+            else:
+                columns = [self._table_columns[f] for f in rule.fields]
+                indexes = self._table_dataset_index
+            mask = rule.predicate(self.context, *columns)
+            degraded = _degraded_datasets(self.all_data, rule)
+            if degraded:
+                mask = [hit and index not in degraded for hit, index in zip(mask, indexes)]
+            self._hits[rule.name] = (rule, Counter(compress(indexes, mask)), mask)
+
+        return {name: self._hits[name][1] for name in self.rules}
+
+    def table_penalties(self, weights: Optional[Dict[str, int]] = None) -> List[Dict[str, int]]:
+        """
+        Breaks the table-level deductions down per table.
+
+        Args:
+            weights: (Optional) Penalty overrides by rule name.
+
+        Returns:
+            One dict per table, mapping matched rule names to their penalty. Tables are in
+            the order they appear in `all_data` (dataset by dataset).
+        """
+        weights = weights or {}
+        self.evaluate()
+        self._load_table_columns([])
+        penalties: List[Dict[str, int]] = [{} for _ in self._table_dataset_index]
+        for name in self.rules:
+            rule, _, mask = self._hits[name]
+            if rule.level != "table":
+                continue
+            penalty = weights.get(name, rule.penalty)
+            for i in compress(range(len(mask)), mask):
+                penalties[i][name] = penalty
+        return penalties
+
+    def score(self, weights: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Calculates the health score from the (cached) rule matches.
+
+        Args:
+            weights: (Optional) Penalty overrides by rule name. Rules not listed use their own penalty.
+
+        Returns:
+            A dict with "score" (0-100), "rule_penalties" (total points deducted per rule) and
+            "dataset_penalties" (points deducted per dataset and rule, only for datasets with
+            any deduction).
+        """
+        weights = weights or {}
+        hits = self.evaluate()
+        rule_penalties = {}
+        dataset_penalties: Dict[str, Dict[str, int]] = {}
+        for name, counts in hits.items():
+            penalty = weights.get(name, self.rules[name].penalty)
+            rule_penalties[name] = penalty * sum(counts.values())
+            for dataset_index, count in counts.items():
+                dataset_name = self.all_data[dataset_index].get("schema_name", str(dataset_index))
+                dataset_penalties.setdefault(dataset_name, {})[name] = penalty * count
+
+        return {
+            "score": max(0, 100 - sum(rule_penalties.values())), # Ensure score doesn't go below 0
+            "rule_penalties": rule_penalties,
+            "dataset_penalties": dataset_penalties,
+        }
+
+
+def score_environment(all_data: List[Dict[str, Any]], now: Optional[datetime] = None, weights: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Calculates the health score of an environment together with a breakdown of
+    where the deducted points come from. See ScoringEngine.score.
+    """
+    return ScoringEngine(all_data, now=now).score(weights)
+
+
+def calculate_health_score(all_data: list) -> int:
+    """Calculates a health score based on a set of rules."""
+    return score_environment(all_data)["score"]
+
+
+class ScoreAccumulator:
+    """
+    Scores datasets one at a time, keeping only per-rule match counts.
+
+    Unlike ScoringEngine, which holds every dataset's metadata, a dataset can be
+    discarded as soon as it has been added, so memory does not grow with the size
+    of the environment. The final score is identical to scoring all datasets at once.
+    """
+    def __init__(self, rules: Optional[Dict[str, ScoringRule]] = None, now: Optional[datetime] = None):
+        """
+        Args:
+            rules: (Optional) The rules to evaluate. Defaults to all registered rules.
+            now: (Optional) The reference time for staleness. Defaults to the current UTC time.
+        """
+        self.rules = dict(rules if rules is not None else RULES)
+        self.now = now or datetime.now(timezone.utc)
+        # One engine, re-loaded with each dataset, so the rules and context are set up once.
+        self._engine = ScoringEngine([], self.rules, self.now)
+        self._rule_matches: Counter = Counter()
+        # Dataset name -> Counter of matches by rule, only for datasets with any match.
+        self._dataset_matches: Dict[str, Counter] = {}
+
+    def add(self, dataset: Dict[str, Any]) -> Tuple[int, List[Dict[str, int]]]:
+        """
+        Evaluates every rule on one dataset and adds its matches to the totals.
+
+        Args:
+            dataset: The collected details of one dataset.
+
+        Returns:
+            The points deducted for this dataset, and its table penalties (as returned
+            by ScoringEngine.table_penalties).
+        """
+        engine = self._engine
+        engine.load([dataset])
+        matches = Counter({name: counts[0] for name, counts in engine.evaluate().items() if counts[0]})
+        if matches:
+            self._rule_matches.update(matches)
+            dataset_name = dataset.get("schema_name", str(len(self._dataset_matches)))
+            self._dataset_matches.setdefault(dataset_name, Counter()).update(matches)
+        penalty = sum(self.rules[name].penalty * count for name, count in matches.items())
+        return penalty, engine.table_penalties()
+
+    def score(self, weights: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Calculates the health score of all datasets added so far. See ScoringEngine.score."""
+        weights = weights or {}
+        rule_penalties = {
+            name: weights.get(name, rule.penalty) * self._rule_matches[name] for name, rule in self.rules.items()
+        }
+        dataset_penalties = {
+            dataset_name: {name: weights.get(name, self.rules[name].penalty) * count for name, count in matches.items()}
+            for dataset_name, matches in self._dataset_matches.items()
+        }
+        return {
+            "score": max(0, 100 - sum(rule_penalties.values())),
+            "rule_penalties": rule_penalties,
+            "dataset_penalties": dataset_penalties,
+        }
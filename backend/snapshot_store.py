@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+from backend.tools import get_region_change_markers
+from backend.metrics import in_current_context
+
+# Snapshots younger than this many seconds are reused without checking BigQuery.
+DEFAULT_SNAPSHOT_TTL_SECONDS = 3600
+
+# Bumped whenever the collected details gain fields, so older snapshots are ignored
+# (even within the TTL) and collected again.
+SNAPSHOT_FORMAT_VERSION = 2
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "..", ".cache", "metadata_snapshots.sqlite")
+
+
+class SnapshotStore:
+    """
+    An on-disk SQLite store of per-dataset metadata snapshots, i.e. the output
+    of get_dataset_and_table_details together with the change marker that was
+    current when it was collected.
+
+    Snapshots are kept per collection variant (see snapshot_variant), since the
+    collection mode and column source determine what the details contain.
+    """
+    def __init__(self, path: str = None):
+        """
+        Opens (and if needed creates) the snapshot database.
+
+        Args:
+            path: The SQLite file to use. If None, defaults to BQ_SNAPSHOT_PATH,
+                  then to .cache/metadata_snapshots.sqlite in the project root.
+        """
+        self.path = path or os.getenv("BQ_SNAPSHOT_PATH") or DEFAULT_SNAPSHOT_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(dataset_snapshots)")]
+            if columns and "variant" not in columns:
+                # Snapshots from before they were keyed by variant. They are only a cache,
+                # so they are dropped and collected again.
+                conn.execute("DROP TABLE dataset_snapshots")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dataset_snapshots (
+                    project_id TEXT NOT NULL,
+                    dataset_name TEXT NOT NULL,
+                    variant TEXT NOT NULL,
+                    format_version INTEGER NOT NULL,
+                    region TEXT,
+                    details TEXT NOT NULL,
+                    marker TEXT,
+                    checked_at REAL NOT NULL,
+                    PRIMARY KEY (project_id, dataset_name, variant)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation keeps the store usable from any thread.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # Commits on success, rolls back on error.
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, project_id: str, dataset_names: List[str], variant: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Loads the change markers of the stored snapshots for the given datasets.
+        The details themselves are read one dataset at a time with load_details.
+
+        Returns:
+            A dict mapping dataset names to {"marker", "checked_at"}. Datasets without
+            a snapshot of this variant and of the current SNAPSHOT_FORMAT_VERSION are omitted.
+        """
+        wanted = set(dataset_names)
+        snapshots = {}
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT dataset_name, marker, checked_at FROM dataset_snapshots WHERE project_id = ? AND variant = ? AND format_version = ?",
+                (project_id, variant, SNAPSHOT_FORMAT_VERSION),
+            ).fetchall()
+            for dataset_name, marker, checked_at in rows:
+                if dataset_name in wanted:
+                    snapshots[dataset_name] = {
+                        "marker": json.loads(marker) if marker else None,
+                        "checked_at": checked_at,
+                    }
+        return snapshots
+
+    def load_details(self, project_id: str, dataset_name: str, variant: str) -> Optional[Dict[str, Any]]:
+        """Loads the stored details of one dataset, or None if it has no current snapshot of this variant."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT details FROM dataset_snapshots WHERE project_id = ? AND dataset_name = ? AND variant = ? AND format_version = ?",
+                (project_id, dataset_name, variant, SNAPSHOT_FORMAT_VERSION),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, project_id: str, dataset_name: str, variant: str, region: str, details: Dict[str, Any], marker: Optional[List[Any]]) -> None:
+        """Stores (or replaces) the snapshot of one dataset."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO dataset_snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (project_id, dataset_name, variant, SNAPSHOT_FORMAT_VERSION, region, json.dumps(details, default=str),
+                 json.dumps(marker) if marker is not None else None, time.time()),
+            )
+
+    def touch(self, project_id: str, dataset_names: List[str], variant: str) -> None:
+        """Marks snapshots as confirmed current, restarting their TTL."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "UPDATE dataset_snapshots SET checked_at = ? WHERE project_id = ? AND dataset_name = ? AND variant = ?",
+                [(now, project_id, name, variant) for name in dataset_names],
+            )
+
+
+def snapshot_variant(collection_mode: str, column_source: str) -> str:
+    """Names the collection variant snapshots are kept under, e.g. "dataset/ddl"."""
+    return f"{collection_mode}/{column_source}"
+
+
+def get_snapshot_ttl() -> float:
+    """Returns the snapshot TTL in seconds from BQ_SNAPSHOT_TTL_SECONDS."""
+    return float(os.getenv("BQ_SNAPSHOT_TTL_SECONDS", DEFAULT_SNAPSHOT_TTL_SECONDS))
+
+
+def plan_refresh(
+    store: SnapshotStore,
+    project_id: str,
+    datasets: List[Dict[str, Any]],
+    default_region: str,
+    ttl_seconds: float,
+    variant: str,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, List[Any]]]:
+    """
+    Decides which datasets can be served from snapshots and which must be collected again.
+
+    Only snapshots of the given variant and of the current SNAPSHOT_FORMAT_VERSION are
+    considered. Those younger than the TTL are reused as-is. For older ones, one change-marker
+    query is run per region; a dataset is reused if its table count, latest creation time
+    and latest modification time are unchanged, and re-fetched otherwise. Note that
+    changes that don't touch storage or creation time (e.g. an edited description) are
+    only picked up once a newer table modification or creation is seen.
+
+    Args:
+        store: The snapshot store.
+        project_id: The GCP project ID.
+        datasets: The discovered datasets, each a dict with "schema_name" and optionally "region".
+        default_region: The region used for datasets without a discovered region.
+        ttl_seconds: The snapshot TTL in seconds.
+        variant: The collection variant (see snapshot_variant).
+
+    Returns:
+        A (reused, to_fetch, markers) tuple: the dataset infos that can be served from
+        snapshots (see SnapshotStore.load_details), the dataset infos that need collecting,
+        and the current change markers by dataset name (to be stored alongside newly
+        collected details).
+    """
+    datasets = [d for d in datasets if d.get("schema_name")]
+    snapshots = store.load(project_id, [d["schema_name"] for d in datasets], variant)
+    now = time.time()
+
+    reused = []
+    unchecked = []
+    for dataset_info in datasets:
+        snapshot = snapshots.get(dataset_info["schema_name"])
+        if snapshot and now - snapshot["checked_at"] < ttl_seconds:
+            reused.append(dataset_info)
+        else:
+            unchecked.append(dataset_info)
+    if not unchecked:
+        return reused, [], {}
+
+    regions = list(dict.fromkeys(d.get("region", default_region) for d in unchecked))
+
+    def region_markers(region: str) -> Optional[Dict[str, List[Any]]]:
+        try:
+            return get_region_change_markers(project_id, region)
+        except Exception as e:
+            # Without markers every dataset in the region is treated as changed.
+            print(f"Could not compute change markers for region {region}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        markers_by_region = dict(zip(regions, executor.map(in_current_context(region_markers), regions)))
+
+    markers: Dict[str, List[Any]] = {}
+    for dataset_info in unchecked:
+        region_result = markers_by_region[dataset_info.get("region", default_region)]
+        if region_result is not None:
+            # Datasets without tables don't appear in the marker query at all.
+            markers[dataset_info["schema_name"]] = region_result.get(dataset_info["schema_name"], [0, None, None])
+
+    to_fetch = []
+    unchanged = []
+    for dataset_info in unchecked:
+        dataset_name = dataset_info["schema_name"]
+        snapshot = snapshots.get(dataset_name)
+        marker = markers.get(dataset_name)
+        if snapshot and marker is not None and snapshot["marker"] == marker:
+            reused.append(dataset_info)
+            unchanged.append(dataset_name)
+        else:
+            to_fetch.append(dataset_info)
+    if unchanged:
+        store.touch(project_id, unchanged, variant)
+
+    return reused, to_fetch, markers
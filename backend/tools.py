@@ -1,10 +1,207 @@
+import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any, List
 from backend.bigquery_connector import BigQueryConnector
+from backend.ddl_parser import parse_ddl
+from backend.cost_model import STORAGE_BYTE_COLUMNS, storage_cost_columns, billing_model_from_ddl, normalize_billing_model
+from backend.metrics import in_current_context
 import re
 
 
-def get_dataset_and_table_details(project_id: str, dataset_name: str, region: str) -> str:
+# Where column descriptions are read from: "ddl" parses each table's DDL in Python,
+# "column_field_paths" counts them in SQL so no DDL is transferred at all.
+COLUMN_METADATA_SOURCES = ("ddl", "column_field_paths")
+
+# The description option in a dataset's DDL, wherever it appears in the option list.
+_DATASET_DESCRIPTION_RE = re.compile(r"\bdescription\s*=", re.IGNORECASE)
+
+# The metadata fields each INFORMATION_SCHEMA view provides. If a view can't be read,
+# a dataset is still collected, just without these fields (see collection_errors).
+VIEW_FIELDS = {
+    "SCHEMATA": ["has_dataset_description", "storage_billing_model"],
+    "SCHEMATA_OPTIONS": ["has_dataset_description", "storage_billing_model"],
+    "COLUMN_FIELD_PATHS": ["column_description_completeness"],
+    "TABLE_STORAGE": ["rows", "logical_gb", "billable_gb", "last_modified", "monthly_cost_logical", "monthly_cost_physical", "time_travel_gb", "fail_safe_gb"],
+    "TABLE_OPTIONS": ["partitioning_info", "clustering_info", "has_table_description"],
+}
+
+
+def _query_view(connector: BigQueryConnector, view: str, query: str, collection_errors: List[Dict[str, Any]], use_ddl: bool = False) -> Optional[Dict[str, list]]:
+    """
+    Runs the query reading one optional view. If it still fails after the connector's
+    retries, the failure is added to `collection_errors` together with the fields it
+    leaves unknown, and None is returned so the caller can carry on without them.
+    """
+    try:
+        return connector.execute_query_columns(query)
+    except Exception as e:
+        print(f"Could not read {view}, continuing without its fields: {e}")
+        fields = VIEW_FIELDS[view]
+        if use_ddl:
+            # Table descriptions are known from the DDL already.
+            fields = [field for field in fields if field != "has_table_description"]
+        collection_errors.append({"view": view, "fields": fields, "error": str(e)})
+        return None
+
+
+def _build_table_entry(table_name: str, table_type: str, ddl: Optional[str]) -> Dict[str, Any]:
+    """
+    Builds the base metadata entry for a table from its INFORMATION_SCHEMA.TABLES row.
+
+    Args:
+        table_name: The name of the table.
+        table_type: The table type (e.g. BASE TABLE, VIEW).
+        ddl: The DDL statement of the table, or None if descriptions are collected
+             from COLUMN_FIELD_PATHS and TABLE_OPTIONS instead.
+
+    Returns:
+        A dict with the table's name, type, DDL and description completeness.
+    """
+    if ddl is None:
+        # Filled in by _apply_column_columns and _apply_option_columns.
+        return {
+            "table_name": table_name,
+            "table_type": table_type,
+            "has_table_description": False,
+            "column_description_completeness": 0,
+        }
+
+    # Walk the DDL once for the table description and the description of every
+    # column, including nested STRUCT fields.
+    parsed = parse_ddl(ddl)
+
+    return {
+        "table_name": table_name,
+        "table_type": table_type,
+        "ddl": ddl,
+        "has_table_description": parsed.has_table_description,
+        "column_description_completeness": parsed.column_description_completeness
+    }
+
+
+def _bytes_to_gb(values: List[Optional[int]]) -> List[float]:
+    return [round(v / (1024**3), 2) if v else 0 for v in values]
+
+
+def _build_table_entries(columns: Dict[str, list], use_ddl: bool) -> Dict[str, Dict[str, Any]]:
+    """Builds the table entries, keyed by table name, from INFORMATION_SCHEMA.TABLES columns."""
+    names = columns["table_name"]
+    ddls = columns["ddl"] if use_ddl else [None] * len(names)
+    return {
+        name: _build_table_entry(name, table_type, ddl)
+        for name, table_type, ddl in zip(names, columns["table_type"], ddls)
+    }
+
+
+# TABLE_STORAGE columns read for every table, besides its name (and dataset).
+_STORAGE_COLUMNS = ", ".join(("total_rows", "total_logical_bytes", "total_physical_bytes", "storage_last_modified_time") + STORAGE_BYTE_COLUMNS)
+
+
+def _apply_storage_columns(tables_map: Dict[str, Dict[str, Any]], columns: Dict[str, list]) -> None:
+    """
+    Merges INFORMATION_SCHEMA.TABLE_STORAGE columns into the table entries, including
+    when the table's data was last modified and its monthly storage cost under both
+    billing models.
+    """
+    logical_gb = _bytes_to_gb(columns["total_logical_bytes"])
+    billable_gb = _bytes_to_gb(columns["total_physical_bytes"])
+    costs = storage_cost_columns(columns)
+    for name, rows, logical, billable, last_modified, cost_logical, cost_physical, time_travel, fail_safe in zip(
+        columns["table_name"], columns["total_rows"], logical_gb, billable_gb, columns["storage_last_modified_time"],
+        costs["monthly_cost_logical"], costs["monthly_cost_physical"], costs["time_travel_gb"], costs["fail_safe_gb"],
+    ):
+        table = tables_map.get(name)
+        if table is not None:
+            table["rows"] = rows
+            table["logical_gb"] = logical
+            table["billable_gb"] = billable
+            # Convert timestamp to string if it exists
+            table["last_modified"] = last_modified.isoformat() if last_modified else None
+            table["monthly_cost_logical"] = cost_logical
+            table["monthly_cost_physical"] = cost_physical
+            table["time_travel_gb"] = time_travel
+            table["fail_safe_gb"] = fail_safe
+
+
+def _apply_option_columns(tables_map: Dict[str, Dict[str, Any]], columns: Dict[str, list]) -> None:
+    """Merges partitioning and clustering options from INFORMATION_SCHEMA.TABLE_OPTIONS into the table entries."""
+    for name, option_name, option_value in zip(columns["table_name"], columns["option_name"], columns["option_value"]):
+        table = tables_map.get(name)
+        if table is None:
+            continue
+        if "partition" in option_name:
+            table["partitioning_info"] = option_value
+        if "clustering" in option_name:
+            table["clustering_info"] = option_value
+        if option_name == "description" and option_value not in (None, '""', "''"):
+            table["has_table_description"] = True
+
+
+def _column_coverage_query(source: str, group_by: str) -> str:
+    """
+    Builds the query that counts (nested) columns and described columns per table
+    from INFORMATION_SCHEMA.COLUMN_FIELD_PATHS, which has one row per field path.
+    """
+    return f"""
+        SELECT {group_by}, COUNT(*) AS column_count,
+               COUNTIF(description IS NOT NULL AND description != '') AS described_column_count
+        FROM {source}.COLUMN_FIELD_PATHS
+        GROUP BY {group_by}
+    """
+
+
+def _apply_column_columns(tables_map: Dict[str, Dict[str, Any]], columns: Dict[str, list]) -> None:
+    """Merges the per-table column description counts into the table entries."""
+    for name, column_count, described in zip(columns["table_name"], columns["column_count"], columns["described_column_count"]):
+        if column_count and name in tables_map:
+            tables_map[name]["column_description_completeness"] = round(described / column_count, 2)
+
+
+def _assemble_dataset_details(dataset_name: str, dataset_ddl: Optional[str], tables_map: Dict[str, Dict[str, Any]], has_dataset_description: Optional[bool] = None, collection_errors: Optional[List[Dict[str, Any]]] = None, storage_billing_model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Builds the final details structure for a dataset. Without a DDL, the dataset
+    description flag and storage billing model option must be passed as
+    `has_dataset_description` and `storage_billing_model`. Views that could not be
+    read are listed under "collection_errors".
+    """
+    if dataset_ddl is None:
+        details = {
+            "schema_name": dataset_name,
+            "has_dataset_description": bool(has_dataset_description),
+            "storage_billing_model": normalize_billing_model(storage_billing_model),
+            "tables": list(tables_map.values()),
+        }
+    else:
+        details = {
+            "schema_name": dataset_name,
+            "ddl": dataset_ddl,
+            "has_dataset_description": _DATASET_DESCRIPTION_RE.search(dataset_ddl) is not None,
+            "storage_billing_model": billing_model_from_ddl(dataset_ddl),
+            "tables": list(tables_map.values()) # Convert map back to list
+        }
+    if collection_errors:
+        details["collection_errors"] = collection_errors
+    return details
+
+
+def _split_by_schema(columns: Dict[str, list], dataset_names: set) -> Dict[str, Dict[str, list]]:
+    """
+    Splits region-wide INFORMATION_SCHEMA columns by their table_schema, keeping only
+    the requested datasets. Each dataset gets its own columns, gathered by row index.
+    """
+    indexes: Dict[str, List[int]] = {name: [] for name in dataset_names}
+    for i, schema in enumerate(columns["table_schema"]):
+        schema_indexes = indexes.get(schema)
+        if schema_indexes is not None:
+            schema_indexes.append(i)
+    return {
+        name: {column: [values[i] for i in schema_indexes] for column, values in columns.items()}
+        for name, schema_indexes in indexes.items()
+    }
+
+
+def get_dataset_and_table_details(project_id: str, dataset_name: str, region: str, column_source: str = "ddl") -> str:
     """
     Retrieves comprehensive details for a single BigQuery dataset, including
     its DDL, and detailed information for all its tables (storage, partitioning, etc.).
@@ -13,6 +210,8 @@ def get_dataset_and_table_details(project_id: str, dataset_name: str, region: st
         project_id: The GCP project ID.
         dataset_name: The name of the dataset.
         region: The GCP region where the dataset resides.
+        column_source: (Optional) "ddl" to parse descriptions from the DDL, or
+                       "column_field_paths" to count them in SQL without fetching any DDL.
 
     Returns:
         A JSON string containing the structured details for the dataset.
@@ -21,87 +220,54 @@ def get_dataset_and_table_details(project_id: str, dataset_name: str, region: st
         connector = BigQueryConnector(project_id=project_id, region=region)
         print(f"--- Fetching comprehensive details for dataset: {dataset_name} in region {region} ---")
 
-        # 1. Get Dataset DDL - This is a region-scoped view
-        dataset_ddl_query = f"SELECT ddl FROM `{project_id}`.`region-{region}`.INFORMATION_SCHEMA.SCHEMATA WHERE schema_name = '{dataset_name}'"
-        dataset_ddl_result = connector.execute_query(dataset_ddl_query)
-        dataset_ddl = dataset_ddl_result[0].get("ddl") if dataset_ddl_result else ""
-        has_dataset_description = "OPTIONS(description=" in dataset_ddl
+        use_ddl = column_source == "ddl"
+        # Only the TABLES view is required. Any other view that can't be read (after
+        # retries) leaves just its fields unknown instead of failing the whole dataset.
+        collection_errors: List[Dict[str, Any]] = []
+
+        # 1. Get Dataset DDL (or just its description option) - This is a region-scoped view
+        if use_ddl:
+            dataset_ddl_query = f"SELECT ddl FROM `{project_id}`.`region-{region}`.INFORMATION_SCHEMA.SCHEMATA WHERE schema_name = '{dataset_name}'"
+            dataset_ddl_result = _query_view(connector, "SCHEMATA", dataset_ddl_query, collection_errors)
+            dataset_ddl = dataset_ddl_result["ddl"][0] if dataset_ddl_result and dataset_ddl_result["ddl"] else ""
+            has_dataset_description = None
+        else:
+            dataset_options_query = f"SELECT option_name, option_value FROM `{project_id}`.`region-{region}`.INFORMATION_SCHEMA.SCHEMATA_OPTIONS WHERE schema_name = '{dataset_name}' AND option_name IN ('description', 'storage_billing_model')"
+            dataset_ddl = None
+            dataset_options_result = _query_view(connector, "SCHEMATA_OPTIONS", dataset_options_query, collection_errors)
+            dataset_options = dict(zip(dataset_options_result["option_name"], dataset_options_result["option_value"])) if dataset_options_result else {}
+            has_dataset_description = "description" in dataset_options
 
         # 2. Get base table info (name, type, ddl) - This is dataset-scoped
-        tables_query = f"SELECT table_name, table_type, ddl FROM `{project_id}`.{dataset_name}.INFORMATION_SCHEMA.TABLES"
-        tables_results = connector.execute_query(tables_query)
-        
+        ddl_column = ", ddl" if use_ddl else ""
+        tables_query = f"SELECT table_name, table_type{ddl_column} FROM `{project_id}`.{dataset_name}.INFORMATION_SCHEMA.TABLES"
         # Use a dictionary for quick lookups
-        tables_map: Dict[str, Dict[str, Any]] = {}
-        if tables_results:
-            for t in tables_results:
-                table_name = t["table_name"]
-                ddl = t["ddl"]
-                
-                # Check for table description
-                has_table_description = "OPTIONS(description=" in ddl
-
-                # Calculate column description completeness
-                columns_match = re.findall(r"^\s*`?(\w+)`?\s+\w+", ddl, re.MULTILINE)
-                described_columns_match = re.findall(r"OPTIONS\(description=", ddl, re.IGNORECASE)
-                
-                # The first described column is the table itself, so we subtract it
-                total_columns = len(columns_match)
-                described_columns_count = max(0, len(described_columns_match) - (1 if has_table_description else 0))
-
-                column_completeness = 0
-                if total_columns > 0:
-                    column_completeness = round(described_columns_count / total_columns, 2)
-
-                tables_map[table_name] = {
-                    "table_name": table_name, 
-                    "table_type": t["table_type"], 
-                    "ddl": ddl,
-                    "has_table_description": has_table_description,
-                    "column_description_completeness": column_completeness
-                }
-
-
-        # 3. Get table storage info - This is region-scoped
-        storage_query = f"SELECT table_name, total_rows, total_logical_bytes, total_physical_bytes FROM `{project_id}`.`region-{region}`.INFORMATION_SCHEMA.TABLE_STORAGE WHERE table_schema = '{dataset_name}'"
-        storage_results = connector.execute_query(storage_query)
-        if storage_results:
-            for row in storage_results:
-                if row["table_name"] in tables_map:
-                    tables_map[row["table_name"]].update({
-                        "rows": row["total_rows"],
-                        "logical_gb": round(row["total_logical_bytes"] / (1024**3), 2) if row.get("total_logical_bytes") else 0,
-                        "billable_gb": round(row["total_physical_bytes"] / (1024**3), 2) if row.get("total_physical_bytes") else 0,
-                    })
-
-        # 4. Get last modified time from partitions - This is dataset-scoped
-        partitions_query = f"SELECT table_name, MAX(last_modified_time) as last_modified_time FROM `{project_id}`.{dataset_name}.INFORMATION_SCHEMA.PARTITIONS GROUP BY table_name"
-        partitions_results = connector.execute_query(partitions_query)
-        if partitions_results:
-            for row in partitions_results:
-                 if row["table_name"] in tables_map:
-                    # Convert timestamp to string if it exists
-                    last_modified = row["last_modified_time"]
-                    tables_map[row["table_name"]]["last_modified"] = last_modified.isoformat() if last_modified else None
-
-        # 5. Get table options (partitioning, clustering) - This is dataset-scoped
+        tables_map = _build_table_entries(connector.execute_query_columns(tables_query), use_ddl)
+
+        view_queries = []
+        # 2b. Without DDL, count described columns server-side - This is dataset-scoped
+        if not use_ddl:
+            columns_query = _column_coverage_query(f"`{project_id}`.{dataset_name}.INFORMATION_SCHEMA", "table_name")
+            view_queries.append(("COLUMN_FIELD_PATHS", columns_query, _apply_column_columns))
+
+        # 3. Get table storage info and last modified time - This is region-scoped
+        storage_query = f"SELECT table_name, {_STORAGE_COLUMNS} FROM `{project_id}`.`region-{region}`.INFORMATION_SCHEMA.TABLE_STORAGE WHERE table_schema = '{dataset_name}'"
+        view_queries.append(("TABLE_STORAGE", storage_query, _apply_storage_columns))
+
+        # 4. Get table options (partitioning, clustering) - This is dataset-scoped
         options_query = f"SELECT table_name, option_name, option_value FROM `{project_id}`.{dataset_name}.INFORMATION_SCHEMA.TABLE_OPTIONS"
-        options_results = connector.execute_query(options_query)
-        if options_results:
-            for row in options_results:
-                if row["table_name"] in tables_map:
-                    if "partition" in row["option_name"]:
-                         tables_map[row["table_name"]]["partitioning_info"] = row["option_value"]
-                    if "clustering" in row["option_name"]:
-                         tables_map[row["table_name"]]["clustering_info"] = row["option_value"]
+        view_queries.append(("TABLE_OPTIONS", options_query, _apply_option_columns))
+
+        for view, query, apply_columns in view_queries:
+            columns = _query_view(connector, view, query, collection_errors, use_ddl)
+            if columns is not None:
+                apply_columns(tables_map, columns)
 
         # Final Assembly
-        dataset_details = {
-            "schema_name": dataset_name,
-            "ddl": dataset_ddl,
-            "has_dataset_description": has_dataset_description,
-            "tables": list(tables_map.values()) # Convert map back to list
-        }
+        dataset_details = _assemble_dataset_details(
+            dataset_name, dataset_ddl, tables_map, has_dataset_description, collection_errors,
+            storage_billing_model=None if use_ddl else dataset_options.get("storage_billing_model"),
+        )
         
         return json.dumps(dataset_details, default=str) # Use default=str for datetime fallback
 
@@ -112,6 +278,188 @@ def get_dataset_and_table_details(project_id: str, dataset_name: str, region: st
         return json.dumps({"error": error_message})
 
 
+def get_region_dataset_details(project_id: str, region: str, dataset_names: List[str], column_source: str = "ddl") -> str:
+    """
+    Retrieves the same details as get_dataset_and_table_details for many datasets
+    in one region at once.
+
+    Instead of four queries per dataset, this runs one region-scoped query per
+    INFORMATION_SCHEMA view and splits the result columns by table_schema in Python,
+    so the number of BigQuery jobs no longer grows with the number of datasets.
+
+    Args:
+        project_id: The GCP project ID.
+        region: The GCP region where the datasets reside.
+        dataset_names: The names of the datasets to collect.
+        column_source: (Optional) "ddl" or "column_field_paths", as for get_dataset_and_table_details.
+
+    Returns:
+        A JSON string mapping each dataset name to its structured details,
+        or a JSON object with an "error" key if the region could not be read.
+    """
+    try:
+        connector = BigQueryConnector(project_id=project_id, region=region)
+        print(f"--- Fetching details for {len(dataset_names)} datasets in region {region} ---")
+        wanted = set(dataset_names)
+        region_prefix = f"`{project_id}`.`region-{region}`.INFORMATION_SCHEMA"
+
+        use_ddl = column_source == "ddl"
+        # As for a single dataset, only the TABLES view is required; a failure of any
+        # other view is recorded against every dataset in the region.
+        collection_errors: List[Dict[str, Any]] = []
+
+        if use_ddl:
+            schemata = _query_view(connector, "SCHEMATA", f"SELECT schema_name, ddl FROM {region_prefix}.SCHEMATA", collection_errors)
+            dataset_ddls = {name: ddl or "" for name, ddl in zip(schemata["schema_name"], schemata["ddl"])} if schemata else {}
+            described_datasets = set()
+            billing_models = {}
+        else:
+            dataset_ddls = {}
+            dataset_options = _query_view(
+                connector, "SCHEMATA_OPTIONS",
+                f"SELECT schema_name, option_name, option_value FROM {region_prefix}.SCHEMATA_OPTIONS WHERE option_name IN ('description', 'storage_billing_model')",
+                collection_errors,
+            ) or {"schema_name": [], "option_name": [], "option_value": []}
+            described_datasets = set()
+            billing_models = {}
+            for name, option_name, option_value in zip(dataset_options["schema_name"], dataset_options["option_name"], dataset_options["option_value"]):
+                if option_name == "description":
+                    described_datasets.add(name)
+                else:
+                    billing_models[name] = option_value
+
+        ddl_column = ", ddl" if use_ddl else ""
+        tables_by_schema = _split_by_schema(connector.execute_query_columns(
+            f"SELECT table_schema, table_name, table_type{ddl_column} FROM {region_prefix}.TABLES"
+        ), wanted)
+
+        view_queries = []
+        if not use_ddl:
+            view_queries.append(("COLUMN_FIELD_PATHS", _column_coverage_query(region_prefix, "table_schema, table_name"), _apply_column_columns))
+        view_queries.append((
+            "TABLE_STORAGE",
+            f"SELECT table_schema, table_name, {_STORAGE_COLUMNS} FROM {region_prefix}.TABLE_STORAGE",
+            _apply_storage_columns,
+        ))
+        view_queries.append((
+            "TABLE_OPTIONS",
+            f"SELECT table_schema, table_name, option_name, option_value FROM {region_prefix}.TABLE_OPTIONS",
+            _apply_option_columns,
+        ))
+        # Each readable view's columns, split by dataset, with the function that applies them.
+        view_columns = []
+        for view, query, apply_columns in view_queries:
+            columns = _query_view(connector, view, query, collection_errors, use_ddl)
+            if columns is not None:
+                view_columns.append((apply_columns, _split_by_schema(columns, wanted)))
+
+        all_details = {}
+        for dataset_name in dataset_names:
+            tables_map = _build_table_entries(tables_by_schema[dataset_name], use_ddl)
+            for apply_columns, columns_by_schema in view_columns:
+                apply_columns(tables_map, columns_by_schema[dataset_name])
+            all_details[dataset_name] = _assemble_dataset_details(
+                dataset_name, dataset_ddls.get(dataset_name, "") if use_ddl else None, tables_map, dataset_name in described_datasets,
+                list(collection_errors), storage_billing_model=billing_models.get(dataset_name),
+            )
+
+        return json.dumps(all_details, default=str) # Use default=str for datetime fallback
+
+    except Exception as e:
+        error_message = f"An error occurred while analyzing region `{region}`: {e}"
+        print(error_message)
+        return json.dumps({"error": error_message})
+
+
+def get_region_change_markers(project_id: str, region: str) -> Dict[str, List[Any]]:
+    """
+    Computes a cheap change marker for every dataset in a region: its table count,
+    latest table creation time and latest storage modification time.
+
+    A dataset whose marker is unchanged since its metadata was collected can be
+    reused from a snapshot instead of being collected again.
+
+    Args:
+        project_id: The GCP project ID.
+        region: The GCP region to inspect.
+
+    Returns:
+        A dict mapping dataset names to [table_count, max_creation_time, max_last_modified_time],
+        with timestamps as ISO strings.
+    """
+    connector = BigQueryConnector(project_id=project_id, region=region)
+    region_prefix = f"`{project_id}`.`region-{region}`.INFORMATION_SCHEMA"
+    query = f"""
+        SELECT t.table_schema, COUNT(*) AS table_count,
+               MAX(t.creation_time) AS max_creation_time,
+               MAX(s.storage_last_modified_time) AS max_last_modified_time
+        FROM {region_prefix}.TABLES t
+        LEFT JOIN {region_prefix}.TABLE_STORAGE s USING (table_schema, table_name)
+        GROUP BY t.table_schema
+    """
+    columns = connector.execute_query_columns(query)
+    return {
+        schema: [
+            table_count,
+            max_creation_time.isoformat() if max_creation_time else None,
+            max_last_modified_time.isoformat() if max_last_modified_time else None,
+        ]
+        for schema, table_count, max_creation_time, max_last_modified_time in zip(
+            columns["table_schema"], columns["table_count"], columns["max_creation_time"], columns["max_last_modified_time"]
+        )
+    }
+
+
+def get_region_workload(project_id: str, region: str, window_days: int, full_scan_ratio: float) -> List[Dict[str, Any]]:
+    """
+    Aggregates the query workload on every table in a region from INFORMATION_SCHEMA.JOBS.
+
+    All aggregation happens server-side: one row per table comes back, no matter how
+    many jobs ran. A job's bytes and slot time are split evenly across the tables it
+    references. A job that references a single table counts as a full scan of it if it
+    processed at least `full_scan_ratio` times the table's logical size, i.e. neither
+    partition nor cluster pruning (nor column selection) reduced what it read. Jobs
+    that reference several tables never count: JOBS doesn't say how many bytes were
+    read from each, so a small table joined with a large one would look fully scanned.
+
+    Args:
+        project_id: The GCP project ID.
+        region: The GCP region whose jobs are aggregated.
+        window_days: How many days of job history to include.
+        full_scan_ratio: The share of a table's logical bytes a job must process to count as a full scan.
+
+    Returns:
+        A list of rows with table_schema, table_name, query_count, bytes_processed,
+        slot_ms and full_scans.
+    """
+    connector = BigQueryConnector(project_id=project_id, region=region)
+    region_prefix = f"`{project_id}`.`region-{region}`.INFORMATION_SCHEMA"
+    query = f"""
+        WITH job_tables AS (
+            SELECT j.job_id, j.total_bytes_processed, j.total_slot_ms,
+                   ref.dataset_id AS table_schema, ref.table_id AS table_name,
+                   ARRAY_LENGTH(j.referenced_tables) AS referenced_table_count
+            FROM {region_prefix}.JOBS AS j, UNNEST(j.referenced_tables) AS ref
+            WHERE j.creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {int(window_days)} DAY)
+              AND j.job_type = 'QUERY'
+              AND j.state = 'DONE'
+              AND j.error_result IS NULL
+              AND IFNULL(j.statement_type, '') != 'SCRIPT'
+              AND ref.project_id = '{project_id}'
+        )
+        SELECT jt.table_schema, jt.table_name,
+               COUNT(DISTINCT jt.job_id) AS query_count,
+               SUM(IFNULL(jt.total_bytes_processed, 0) / jt.referenced_table_count) AS bytes_processed,
+               SUM(IFNULL(jt.total_slot_ms, 0) / jt.referenced_table_count) AS slot_ms,
+               COUNTIF(jt.referenced_table_count = 1 AND s.total_logical_bytes > 0
+                       AND jt.total_bytes_processed >= {float(full_scan_ratio)} * s.total_logical_bytes) AS full_scans
+        FROM job_tables jt
+        LEFT JOIN {region_prefix}.TABLE_STORAGE s USING (table_schema, table_name)
+        GROUP BY jt.table_schema, jt.table_name
+    """
+    return connector.execute_query(query)
+
+
 # The old functions are kept for now to avoid breaking changes, but are now deprecated.
 # They will be removed once the refactoring is complete.
 
@@ -198,7 +546,7 @@ def execute_bigquery_query(query: str, region: Optional[str] = None) -> str:
         # Create connector with the extracted project_id and region
         connector = BigQueryConnector(project_id=project_id, region=region)
         results = connector.execute_query(query)
-        return json.dumps([dict(row) for row in results])
+        return json.dumps(results, default=str)
     except Exception as e:
         return f'{{"error": "An error occurred: {e}"}}'
 
@@ -217,60 +565,133 @@ def perform_google_search(query: str) -> str:
     # capabilities when it sees this tool signature.
     pass 
 
-def discover_datasets_across_regions(project_id: str) -> str:
+# Regions probed when the project's dataset locations can't be listed.
+FALLBACK_DISCOVERY_REGIONS = [
+    "US",           # US multi-region
+    "EU",           # European multi-region
+    "asia-northeast1",  # Asia region
+    "us-central1",  # US Central
+    "us-east1",     # US East
+    "europe-west1", # Europe West
+    "asia-southeast1"  # Asia Southeast
+]
+
+
+# How many datasets have their location looked up at a time during discovery. Each
+# region found this way is probed for all of its datasets with one SCHEMATA query,
+# so only datasets in regions no probe has covered yet are looked up.
+DISCOVERY_LOCATION_LOOKUPS = 8
+
+
+def _list_dataset_names(project_id: str) -> Optional[List[str]]:
     """
-    Automatically discovers datasets across multiple regions in a BigQuery project.
-    This function tries common regions and multi-regions to find all datasets.
-    
+    Lists the project's datasets with the dataset-list API.
+
+    Returns:
+        The dataset names, or None if listing failed.
+    """
+    try:
+        # The list API is global, so any region works for the connector here.
+        connector = BigQueryConnector(project_id=project_id, region=os.getenv("GOOGLE_CLOUD_REGION") or "US")
+        return connector.list_dataset_ids()
+    except Exception as e:
+        print(f"Could not list datasets for project {project_id}: {e}")
+        return None
+
+
+def _dataset_location(project_id: str, dataset_name: str) -> Optional[str]:
+    """Returns a dataset's location, or None if it can't be read."""
+    try:
+        connector = BigQueryConnector(project_id=project_id, region=os.getenv("GOOGLE_CLOUD_REGION") or "US")
+        return connector.get_dataset_location(dataset_name)
+    except Exception as e:
+        print(f"Could not read the location of dataset {dataset_name}: {e}")
+        return None
+
+
+def _probe_region(project_id: str, region: str) -> Optional[List[str]]:
+    """Returns the dataset names visible in a region's SCHEMATA view, or None if the region can't be queried."""
+    try:
+        connector = BigQueryConnector(project_id=project_id, region=region)
+        query = f"SELECT schema_name FROM `{project_id}`.INFORMATION_SCHEMA.SCHEMATA"
+        return [row["schema_name"] for row in connector.execute_query(query) if row.get("schema_name")]
+    except Exception as e:
+        print(f"Could not query region {region}: {e}")
+        return None
+
+
+def discover_datasets(project_id: str) -> Dict[str, Any]:
+    """
+    Discovers all datasets in a BigQuery project and the region of each one.
+    The regions are taken from the project's actual dataset locations: each newly
+    seen region is listed with one SCHEMATA query, concurrently with the others, so
+    only a few datasets per region have their location looked up.
+
     Args:
         project_id: The GCP project ID.
-        
+
     Returns:
-        A JSON string containing all discovered datasets with their regions.
+        A dict with "datasets" (a list of {"schema_name", "region"} objects),
+        "total_datasets", "regions_checked" and "datasets_per_region".
     """
-    # Common regions and multi-regions to try
-    regions_to_try = [
-        "US",           # US multi-region
-        "EU",           # European multi-region
-        "asia-northeast1",  # Asia region
-        "us-central1",  # US Central
-        "us-east1",     # US East
-        "europe-west1", # Europe West
-        "asia-southeast1"  # Asia Southeast
-    ]
-    
-    all_datasets = []
+    datasets_by_name: Dict[str, Dict[str, str]] = {}
     discovered_regions = {}
-    
-    for region in regions_to_try:
-        try:
-            connector = BigQueryConnector(project_id=project_id, region=region)
-            query = f"SELECT schema_name FROM `{project_id}`.INFORMATION_SCHEMA.SCHEMATA"
-            results = connector.execute_query(query)
-            
-            if results:
-                for row in results:
-                    dataset_name = row.get("schema_name")
-                    if dataset_name and not any(d["schema_name"] == dataset_name for d in all_datasets):
-                        all_datasets.append({
-                            "schema_name": dataset_name,
-                            "region": region
-                        })
-                discovered_regions[region] = len(results)
-                print(f"Found {len(results)} datasets in region {region}")
-            
-        except Exception as e:
-            print(f"Could not query region {region}: {e}")
-            continue
-    
+
+    def probe(regions: List[str]) -> None:
+        with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+            probe_results = list(executor.map(in_current_context(lambda region: _probe_region(project_id, region)), regions))
+        for region, dataset_names in zip(regions, probe_results):
+            if not dataset_names:
+                continue
+            for dataset_name in dataset_names:
+                datasets_by_name.setdefault(dataset_name, {"schema_name": dataset_name, "region": region})
+            discovered_regions[region] = len(dataset_names)
+            print(f"Found {len(dataset_names)} datasets in region {region}")
+
+    listed_names = _list_dataset_names(project_id)
+    if listed_names is None:
+        probe(FALLBACK_DISCOVERY_REGIONS)
+        listed_names = []
+
+    probed_regions = set()
+    unlocated = sorted(listed_names)
+    while unlocated:
+        # Look up the locations of a few datasets no probe has reported yet, then probe
+        # the new regions among them concurrently.
+        lookups, unlocated = unlocated[:DISCOVERY_LOCATION_LOOKUPS], unlocated[DISCOVERY_LOCATION_LOOKUPS:]
+        with ThreadPoolExecutor(max_workers=len(lookups)) as executor:
+            locations = list(executor.map(in_current_context(lambda name: _dataset_location(project_id, name)), lookups))
+        new_regions = [region for region in dict.fromkeys(locations) if region and region not in probed_regions]
+        if new_regions:
+            probed_regions.update(new_regions)
+            probe(new_regions)
+        # Datasets in a region whose probe failed are still known from their lookup.
+        for dataset_name, region in zip(lookups, locations):
+            if region:
+                datasets_by_name.setdefault(dataset_name, {"schema_name": dataset_name, "region": region})
+        unlocated = [name for name in unlocated if name not in datasets_by_name]
+
     # Sort datasets by name for consistency
-    all_datasets.sort(key=lambda x: x["schema_name"])
+    all_datasets = sorted(datasets_by_name.values(), key=lambda x: x["schema_name"])
     
-    result = {
+    return {
         "datasets": all_datasets,
         "total_datasets": len(all_datasets),
         "regions_checked": list(discovered_regions.keys()),
         "datasets_per_region": discovered_regions
     }
+
+
+def discover_datasets_across_regions(project_id: str) -> str:
+    """
+    Automatically discovers datasets across multiple regions in a BigQuery project.
+    The regions are taken from the project's actual dataset locations, and each
+    region is queried concurrently (see discover_datasets).
     
-    return json.dumps(result) 
\ No newline at end of file
+    Args:
+        project_id: The GCP project ID.
+        
+    Returns:
+        A JSON string containing all discovered datasets with their regions.
+    """
+    return json.dumps(discover_datasets(project_id))
@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator
+
+DEFAULT_TREND_PATH = os.path.join(os.path.dirname(__file__), "..", ".cache", "trends.sqlite")
+
+# A re-run counts as a small change (and gets an incremental report) if its score moved
+# by at most this many points and at most this share of its tables changed.
+DEFAULT_SMALL_SCORE_CHANGE = 5
+DEFAULT_SMALL_CHANGED_TABLES_SHARE = 0.05
+
+# Number of tables listed per kind of change in a diff (added, removed, changed, grown).
+DEFAULT_DIFF_TABLE_LIMIT = 20
+
+# The columns of a run, as read by _run_from_row.
+_RUN_COLUMNS = "run_id, finished_at, score, totals, options"
+
+# Totals compared between runs.
+DIFF_TOTALS = ("datasets", "tables", "views", "logical_gb", "billable_gb", "monthly_storage_cost", "partitioned_tables", "tables_with_issues")
+
+
+class TrendStore:
+    """
+    An append-only, on-disk SQLite time series of analyses: one row per run with its
+    score and totals, plus the per-rule penalties and per-table metrics of that run.
+
+    Past runs are never modified. A run is only used for trends and diffs once it has
+    been finished, so analyses that fail halfway leave no trace in them.
+    """
+    def __init__(self, path: str = None):
+        """
+        Opens (and if needed creates) the trend database.
+
+        Args:
+            path: The SQLite file to use. If None, defaults to TREND_STORE_PATH,
+                  then to .cache/trends.sqlite in the project root.
+        """
+        self.path = path or os.getenv("TREND_STORE_PATH") or DEFAULT_TREND_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(runs)")]
+            if columns and "options" not in columns:
+                # Runs from before their options were recorded keep NULL options, so they
+                # are only ever compared with each other.
+                conn.execute("ALTER TABLE runs ADD COLUMN options TEXT")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    project_id TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    score INTEGER,
+                    totals TEXT,
+                    options TEXT
+                );
+                CREATE INDEX IF NOT EXISTS runs_by_project ON runs (project_id, finished_at);
+                CREATE TABLE IF NOT EXISTS rule_scores (
+                    run_id INTEGER NOT NULL,
+                    rule_name TEXT NOT NULL,
+                    penalty INTEGER NOT NULL,
+                    PRIMARY KEY (run_id, rule_name)
+                );
+                CREATE TABLE IF NOT EXISTS table_metrics (
+                    run_id INTEGER NOT NULL,
+                    dataset_name TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    row_count INTEGER,
+                    logical_gb REAL,
+                    billable_gb REAL,
+                    penalty INTEGER NOT NULL,
+                    rules TEXT NOT NULL,
+                    PRIMARY KEY (run_id, dataset_name, table_name)
+                );
+                CREATE TABLE IF NOT EXISTS skipped_datasets (
+                    run_id INTEGER NOT NULL,
+                    dataset_name TEXT NOT NULL,
+                    PRIMARY KEY (run_id, dataset_name)
+                );
+                CREATE TABLE IF NOT EXISTS run_reports (
+                    run_id INTEGER PRIMARY KEY,
+                    report TEXT NOT NULL
+                );
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation keeps the store usable from any thread.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # Commits on success, rolls back on error.
+                yield conn
+        finally:
+            conn.close()
+
+    def begin_run(self, project_id: str, options: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Starts recording a run and returns its ID.
+
+        Args:
+            project_id: The analyzed project.
+            options: (Optional) The analysis options that change what is collected or
+                     scored, e.g. the collection mode. Runs are only diffed against runs
+                     with the same options.
+        """
+        with self._lock, self._connect() as conn:
+            return conn.execute(
+                "INSERT INTO runs (project_id, started_at, options) VALUES (?, ?, ?)",
+                (project_id, time.time(), json.dumps(options, sort_keys=True) if options is not None else None),
+            ).lastrowid
+
+    def add_dataset(self, run_id: int, dataset: Dict[str, Any], table_penalties: List[Dict[str, int]]) -> None:
+        """
+        Records the metrics of one dataset's tables.
+
+        Args:
+            run_id: The run, from begin_run.
+            dataset: The collected details of the dataset.
+            table_penalties: The matched rules and penalties of each of its tables, in order.
+        """
+        dataset_name = dataset.get("schema_name")
+        rows = [
+            (run_id, dataset_name, table.get("table_name"), table.get("rows"), table.get("logical_gb"), table.get("billable_gb"),
+             sum(matched.values()), json.dumps(sorted(matched)))
+            for table, matched in zip(dataset.get("tables", []), table_penalties)
+        ]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO table_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def skip_dataset(self, run_id: int, dataset_name: str) -> None:
+        """Records that a dataset could not be collected, so diffs don't report its tables as removed."""
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO skipped_datasets VALUES (?, ?)", (run_id, dataset_name))
+
+    def finish_run(self, run_id: int, breakdown: Dict[str, Any], totals: Dict[str, Any]) -> None:
+        """
+        Completes a run with its score breakdown (see ScoringEngine.score) and totals.
+        Only finished runs show up in history and diffs.
+        """
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO rule_scores VALUES (?, ?, ?)",
+                [(run_id, name, penalty) for name, penalty in breakdown["rule_penalties"].items()],
+            )
+            conn.execute(
+                "UPDATE runs SET finished_at = ?, score = ?, totals = ? WHERE run_id = ?",
+                (time.time(), breakdown["score"], json.dumps(totals), run_id),
+            )
+
+    def save_report(self, run_id: int, report: Dict[str, Any]) -> None:
+        """Stores the summary report generated for a run."""
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO run_reports VALUES (?, ?)", (run_id, json.dumps(report)))
+
+    def load_report(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """Returns the summary report of a run, or None if none was generated."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT report FROM run_reports WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def previous_run(self, project_id: str, run_id: int) -> Optional[Dict[str, Any]]:
+        """Returns the latest finished run of the project before `run_id` with the same options, or None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {_RUN_COLUMNS} FROM runs "
+                "WHERE project_id = ? AND run_id < ? AND finished_at IS NOT NULL "
+                "AND options IS (SELECT options FROM runs WHERE run_id = ?) ORDER BY run_id DESC LIMIT 1",
+                (project_id, run_id, run_id),
+            ).fetchone()
+        return _run_from_row(row) if row else None
+
+    def history(self, project_id: str, limit: int = 30) -> List[Dict[str, Any]]:
+        """
+        Returns the project's latest finished runs, oldest first.
+
+        Returns:
+            A list of {"run_id", "finished_at", "score", "totals", "options", "rule_penalties"} dicts.
+        """
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {_RUN_COLUMNS} FROM runs "
+                "WHERE project_id = ? AND finished_at IS NOT NULL ORDER BY run_id DESC LIMIT ?",
+                (project_id, limit),
+            ).fetchall()
+            runs = [_run_from_row(row) for row in reversed(rows)]
+            for run in runs:
+                run["rule_penalties"] = dict(conn.execute(
+                    "SELECT rule_name, penalty FROM rule_scores WHERE run_id = ?", (run["run_id"],)
+                ).fetchall())
+        return runs
+
+    def diff(self, previous_run_id: int, run_id: int, limit: int = DEFAULT_DIFF_TABLE_LIMIT) -> Dict[str, Any]:
+        """
+        Computes what changed between two finished runs. The table comparison runs in SQL,
+        so only the counts and the `limit` most significant tables of each kind are loaded.
+        Tables of datasets that were skipped in either run are not compared.
+
+        Args:
+            previous_run_id: The earlier run.
+            run_id: The later run.
+            limit: (Optional) How many tables to list per kind of change.
+
+        Returns:
+            A JSON-serializable dict with the score, rule penalty and totals changes, the
+            number of tables added, removed and changed (penalty or matched rules), and
+            the most significant of those tables plus the tables whose storage grew most.
+        """
+        with self._lock, self._connect() as conn:
+            runs = {
+                row[0]: _run_from_row(row) for row in conn.execute(
+                    f"SELECT {_RUN_COLUMNS} FROM runs WHERE run_id IN (?, ?)", (previous_run_id, run_id)
+                )
+            }
+            before, after = runs[previous_run_id], runs[run_id]
+            rules_before = dict(conn.execute("SELECT rule_name, penalty FROM rule_scores WHERE run_id = ?", (previous_run_id,)).fetchall())
+            rules_after = dict(conn.execute("SELECT rule_name, penalty FROM rule_scores WHERE run_id = ?", (run_id,)).fetchall())
+
+            compared = "dataset_name NOT IN (SELECT dataset_name FROM skipped_datasets WHERE run_id IN (:before, :after))"
+            params = {"before": previous_run_id, "after": run_id, "limit": limit}
+
+            def only_in(this: str, other: str) -> str:
+                return f"""
+                    FROM table_metrics t
+                    WHERE t.run_id = :{this} AND t.{compared}
+                      AND NOT EXISTS (SELECT 1 FROM table_metrics o WHERE o.run_id = :{other}
+                                      AND o.dataset_name = t.dataset_name AND o.table_name = t.table_name)
+                """
+            added_from = only_in("after", "before")
+            removed_from = only_in("before", "after")
+            both_from = f"""
+                FROM table_metrics a JOIN table_metrics b
+                  ON b.run_id = :before AND b.dataset_name = a.dataset_name AND b.table_name = a.table_name
+                WHERE a.run_id = :after AND a.{compared}
+            """
+            changed_where = "AND (a.penalty != b.penalty OR a.rules != b.rules)"
+
+            added_count = conn.execute(f"SELECT COUNT(*) {added_from}", params).fetchone()[0]
+            removed_count = conn.execute(f"SELECT COUNT(*) {removed_from}", params).fetchone()[0]
+            changed_count = conn.execute(f"SELECT COUNT(*) {both_from} {changed_where}", params).fetchone()[0]
+            table_columns = "t.dataset_name, t.table_name, t.billable_gb, t.penalty, t.rules"
+            added = conn.execute(f"SELECT {table_columns} {added_from} ORDER BY t.penalty DESC, t.billable_gb DESC LIMIT :limit", params).fetchall()
+            removed = conn.execute(f"SELECT {table_columns} {removed_from} ORDER BY t.penalty DESC, t.billable_gb DESC LIMIT :limit", params).fetchall()
+            changed = conn.execute(
+                f"SELECT a.dataset_name, a.table_name, b.penalty, a.penalty, b.rules, a.rules {both_from} {changed_where} "
+                "ORDER BY ABS(a.penalty - b.penalty) DESC, a.dataset_name, a.table_name LIMIT :limit", params,
+            ).fetchall()
+            grown = conn.execute(
+                f"SELECT a.dataset_name, a.table_name, b.billable_gb, a.billable_gb {both_from} "
+                "AND IFNULL(a.billable_gb, 0) != IFNULL(b.billable_gb, 0) "
+                "ORDER BY IFNULL(a.billable_gb, 0) - IFNULL(b.billable_gb, 0) DESC LIMIT :limit", params,
+            ).fetchall()
+
+        def table_entry(row) -> Dict[str, Any]:
+            dataset_name, table_name, billable_gb, penalty, rules = row
+            return {"dataset": dataset_name, "table_name": table_name, "billable_gb": billable_gb, "penalty": penalty, "rules": json.loads(rules)}
+
+        changed_tables = []
+        for dataset_name, table_name, penalty_before, penalty_after, rules_before_json, rules_after_json in changed:
+            matched_before, matched_after = set(json.loads(rules_before_json)), set(json.loads(rules_after_json))
+            changed_tables.append({
+                "dataset": dataset_name,
+                "table_name": table_name,
+                "penalty_before": penalty_before,
+                "penalty_after": penalty_after,
+                "new_rules": sorted(matched_after - matched_before),
+                "resolved_rules": sorted(matched_before - matched_after),
+            })
+
+        return {
+            "previous_run": {"run_id": previous_run_id, "finished_at": before["finished_at"], "score": before["score"]},
+            "score": _change(before["score"], after["score"]),
+            "rule_penalties": {
+                name: _change(rules_before.get(name, 0), rules_after.get(name, 0))
+                for name in sorted(set(rules_before) | set(rules_after))
+                if rules_before.get(name, 0) != rules_after.get(name, 0)
+            },
+            "totals": {
+                field: _change(before["totals"].get(field, 0), after["totals"].get(field, 0))
+                for field in DIFF_TOTALS
+                if before["totals"].get(field, 0) != after["totals"].get(field, 0)
+            },
+            "table_count": after["totals"].get("tables", 0),
+            "tables_added": added_count,
+            "tables_removed": removed_count,
+            "tables_changed": changed_count,
+            "added_tables": [table_entry(row) for row in added],
+            "removed_tables": [table_entry(row) for row in removed],
+            "changed_tables": changed_tables,
+            "storage_changes": [
+                {"dataset": dataset_name, "table_name": table_name, **_change(gb_before or 0, gb_after or 0)}
+                for dataset_name, table_name, gb_before, gb_after in grown
+            ],
+        }
+
+
+def _run_from_row(row: tuple) -> Dict[str, Any]:
+    run_id, finished_at, score, totals, options = row
+    return {
+        "run_id": run_id,
+        "finished_at": finished_at,
+        "score": score,
+        "totals": json.loads(totals) if totals else {},
+        "options": json.loads(options) if options else None,
+    }
+
+
+def _change(before: float, after: float) -> Dict[str, float]:
+    return {"before": before, "after": after, "change": round(after - before, 2)}
+
+
+def has_changes(diff: Dict[str, Any]) -> bool:
+    """Whether anything that a report is based on changed between the two runs of a diff."""
+    return any(
+        diff[key]
+        for key in ("rule_penalties", "totals", "tables_added", "tables_removed", "tables_changed", "storage_changes")
+    ) or diff["score"]["change"] != 0
+
+
+def is_small_change(diff: Dict[str, Any]) -> bool:
+    """
+    Whether a diff is small enough for an incremental report: the score moved by at most
+    TREND_SMALL_SCORE_CHANGE points and at most TREND_SMALL_CHANGED_TABLES_SHARE of the
+    tables were added, removed or changed.
+    """
+    max_score_change = float(os.getenv("TREND_SMALL_SCORE_CHANGE", DEFAULT_SMALL_SCORE_CHANGE))
+    max_changed_share = float(os.getenv("TREND_SMALL_CHANGED_TABLES_SHARE", DEFAULT_SMALL_CHANGED_TABLES_SHARE))
+    changed_tables = diff["tables_added"] + diff["tables_removed"] + diff["tables_changed"]
+    return abs(diff["score"]["change"]) <= max_score_change and changed_tables <= max_changed_share * max(1, diff["table_count"])
@@ -0,0 +1,95 @@
+import os
+import asyncio
+from typing import Optional, Dict, Any, List
+from backend.tools import get_region_workload
+
+# Days of INFORMATION_SCHEMA.JOBS history analyzed. 0 disables the workload stage, which
+# is opt-in: reading JOBS needs extra permissions and scans the project's job history.
+DEFAULT_WORKLOAD_WINDOW_DAYS = 0
+
+# A single-table job that processed at least this share of the table's logical bytes counts as a full scan.
+DEFAULT_FULL_SCAN_RATIO = 0.9
+
+# Workload fields merged into each table entry.
+WORKLOAD_FIELDS = ("query_count", "gb_processed", "slot_hours", "full_scans")
+
+
+def get_workload_window_days(requested: Optional[int] = None) -> int:
+    """
+    Resolves how many days of job history are analyzed.
+
+    Args:
+        requested: (Optional) A window requested by the caller. If None, falls back to
+                   the BQ_WORKLOAD_WINDOW_DAYS environment variable.
+
+    Returns:
+        A non-negative number of days; 0 means the workload stage is skipped.
+    """
+    if requested is None:
+        requested = int(os.getenv("BQ_WORKLOAD_WINDOW_DAYS", DEFAULT_WORKLOAD_WINDOW_DAYS))
+    return max(0, requested)
+
+
+async def collect_workload(project_id: str, datasets: List[Dict[str, Any]], default_region: str, window_days: int) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Aggregates the query workload of the datasets' regions concurrently.
+
+    Reading INFORMATION_SCHEMA.JOBS needs permission to list all jobs in the project.
+    A region that can't be read is logged and skipped, so its datasets keep static
+    metadata only.
+
+    Args:
+        project_id: The GCP project ID.
+        datasets: The discovered datasets, each a dict with "schema_name" and optionally "region".
+        default_region: The region used for datasets without a discovered region.
+        window_days: How many days of job history to include.
+
+    Returns:
+        A dict mapping dataset names to {table name: workload stats}. Every dataset in a
+        region that was read is included, even if none of its tables were queried.
+    """
+    full_scan_ratio = float(os.getenv("BQ_FULL_SCAN_RATIO", DEFAULT_FULL_SCAN_RATIO))
+    datasets_by_region: Dict[str, List[str]] = {}
+    for dataset_info in datasets:
+        if dataset_info.get("schema_name"):
+            datasets_by_region.setdefault(dataset_info.get("region", default_region), []).append(dataset_info["schema_name"])
+    regions = sorted(datasets_by_region)
+
+    async def fetch(region: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            return await asyncio.to_thread(get_region_workload, project_id, region, window_days, full_scan_ratio)
+        except Exception as e:
+            print(f"Skipping workload analysis for region {region}: {e}")
+            return None
+
+    workload: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for region, rows in zip(regions, await asyncio.gather(*(fetch(r) for r in regions))):
+        if rows is None:
+            continue
+        for dataset_name in datasets_by_region[region]:
+            workload[dataset_name] = {}
+        for row in rows:
+            if row["table_schema"] not in workload:
+                continue  # A dataset that wasn't collected.
+            workload[row["table_schema"]][row["table_name"]] = {
+                "query_count": row["query_count"],
+                "gb_processed": round((row.get("bytes_processed") or 0) / (1024**3), 2),
+                "slot_hours": round((row.get("slot_ms") or 0) / 3_600_000, 2),
+                "full_scans": row["full_scans"],
+            }
+    return workload
+
+
+def apply_workload(all_data: List[Dict[str, Any]], workload: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+    """
+    Merges workload stats (output of collect_workload) into the collected table entries.
+    Tables that weren't queried in the window get zero counts; tables in datasets whose
+    workload is unknown get no workload fields at all.
+    """
+    idle = {field: 0 for field in WORKLOAD_FIELDS}
+    for dataset in all_data:
+        dataset_workload = workload.get(dataset.get("schema_name"))
+        if dataset_workload is None:
+            continue
+        for table in dataset.get("tables", []):
+            table.update(dataset_workload.get(table.get("table_name"), idle))
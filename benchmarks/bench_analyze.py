@@ -0,0 +1,107 @@
+"""
+End-to-end benchmark of a full analysis (the pipeline behind /api/analyze) against
+the offline fake BigQuery and LLM backends, at increasing project sizes.
+
+It drives run_analysis directly rather than the HTTP endpoint, so request parsing,
+the job queue and SSE framing are not included in the timings.
+
+For each size it reports wall time, the number of BigQuery jobs, the peak Python
+memory (traced with tracemalloc, which also slows the run down; pass --no-memory
+for undisturbed timings) and the bytes of prompt text sent to the agents.
+
+Run from the project root:
+
+    python -m benchmarks.bench_analyze
+    python -m benchmarks.bench_analyze --sizes 1000 --collection-mode bulk --latency-ms 300
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+# Tables per size are spread over this many datasets.
+DATASETS_PER_SIZE = {10: 1, 1000: 10, 100000: 100}
+
+
+def configure_environment(cache_dir: str, latency_ms: float, columns: int) -> None:
+    """Points the backend at the fake backends and throwaway caches. Must run before backend.main is imported."""
+    os.environ.update({
+        "BQ_BACKEND": "fake",
+        "LLM_BACKEND": "fake",
+        "GOOGLE_CLOUD_REGION": "US",
+        "FAKE_BQ_REGIONS": "US",
+        "FAKE_BQ_LATENCY_MS": str(latency_ms),
+        "FAKE_BQ_COLUMNS_PER_TABLE": str(columns),
+        "LLM_CACHE_ENABLED": "false",
+        "BQ_SNAPSHOT_PATH": os.path.join(cache_dir, "metadata_snapshots.sqlite"),
+        "TREND_STORE_PATH": os.path.join(cache_dir, "trends.sqlite"),
+    })
+
+
+async def run_once(run_analysis, project_id: str, args) -> dict:
+    """Runs one analysis to completion and returns its final score event and event count."""
+    events = 0
+    score = None
+    async for event in run_analysis(
+        project_id,
+        max_parallel=args.parallelism,
+        collection_mode=args.collection_mode,
+        discovery_mode="direct",
+        force_refresh=True,
+        generate_reports=not args.no_reports,
+        column_source=args.column_source,
+        workload_days=args.workload_days,
+    ):
+        events += 1
+        if event["event"] == "error":
+            raise RuntimeError(json.loads(event["data"])["details"])
+        if event["event"] == "score":
+            score = json.loads(event["data"])["score"]
+    return {"events": events, "score": score}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a full analysis against the offline fake backends.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=sorted(DATASETS_PER_SIZE), help="Total table counts to benchmark.")
+    parser.add_argument("--collection-mode", default="dataset", choices=("dataset", "bulk"))
+    parser.add_argument("--column-source", default="ddl", choices=("ddl", "column_field_paths"))
+    parser.add_argument("--parallelism", type=int, default=8, help="Datasets (or regions) fetched at the same time.")
+    parser.add_argument("--workload-days", type=int, default=30, help="Days of (synthetic) job history; 0 skips the workload stage.")
+    parser.add_argument("--columns", type=int, default=20, help="Columns per synthetic table.")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Simulated latency of every BigQuery job.")
+    parser.add_argument("--no-reports", action="store_true", help="Stop after scoring, without the (fake) agents.")
+    parser.add_argument("--no-memory", action="store_true", help="Don't trace memory allocations.")
+    args = parser.parse_args()
+
+    configure_environment(tempfile.mkdtemp(prefix="bench_analyze_"), args.latency_ms, args.columns)
+    # Imported after configuring, since the stores and caches are created on import.
+    from backend import fake_backend
+    from backend.main import run_analysis
+
+    print(f"{'tables':>8} {'datasets':>9} {'wall (s)':>10} {'jobs':>6} {'peak MB':>9} {'prompt KB':>10} {'score':>6}")
+    for size in args.sizes:
+        datasets = DATASETS_PER_SIZE.get(size, max(1, size // 1000))
+        os.environ["FAKE_BQ_DATASETS"] = str(datasets)
+        os.environ["FAKE_BQ_TABLES_PER_DATASET"] = str(max(1, size // datasets))
+        fake_backend.reset_stats()
+        if not args.no_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        # A distinct project per size, so no pooled client reuses another size's environment.
+        result = asyncio.run(run_once(run_analysis, f"bench-project-{size}", args))
+        wall = time.perf_counter() - started
+        peak_mb = "-"
+        if not args.no_memory:
+            peak_mb = f"{tracemalloc.get_traced_memory()[1] / 1024**2:.1f}"
+            tracemalloc.stop()
+        print(
+            f"{size:>8} {datasets:>9} {wall:>10.2f} {fake_backend.stats['jobs']:>6} {peak_mb:>9} "
+            f"{fake_backend.stats['prompt_bytes'] / 1024:>10.1f} {result['score']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the DDL description-coverage parser against the previous
+regex-based estimate, on synthetic tables of increasing width: "plain" tables with
+scalar columns only, and "nested" tables where every fifth column is a STRUCT.
+
+The parser is slower than the regex at every width: on one core it takes about
+2.5-3 times as long on plain tables and about 4 times as long on nested ones
+(e.g. 10.2 vs 3.7 ms for 5000 plain columns, 4.1 vs 1.0 ms for 1000 nested ones).
+That is the price of counting nested fields and skipping strings, comments and
+constraints correctly; the regex gets both results wrong on nested tables.
+
+Run from the project root:
+
+    python -m benchmarks.bench_ddl_parser
+"""
+import re
+import timeit
+
+from backend.ddl_parser import parse_ddl
+
+WIDTHS = (10, 100, 1000, 5000)
+
+
+def regex_completeness(ddl: str):
+    """The previous estimate, as it was implemented in tools.py."""
+    has_table_description = "OPTIONS(description=" in ddl
+    columns_match = re.findall(r"^\s*`?(\w+)`?\s+\w+", ddl, re.MULTILINE)
+    described_columns_match = re.findall(r"OPTIONS\(description=", ddl, re.IGNORECASE)
+    total_columns = len(columns_match)
+    described_columns_count = max(0, len(described_columns_match) - (1 if has_table_description else 0))
+    completeness = round(described_columns_count / total_columns, 2) if total_columns else 0
+    return has_table_description, completeness
+
+
+def make_ddl(width: int, nested: bool = True) -> str:
+    """A table with `width` top-level columns; if `nested`, every fifth is a described STRUCT with nested fields."""
+    columns = []
+    for i in range(width):
+        if nested and i % 5 == 0:
+            columns.append(
+                f'  s{i} STRUCT<a INT64 OPTIONS(description="nested a"), b ARRAY<STRUCT<c STRING, d NUMERIC(10, 2)>>> '
+                f'OPTIONS(description="struct {i}, with (parens)")'
+            )
+        elif i % 2:
+            columns.append(f'  c{i} STRING OPTIONS(description="column {i}")')
+        else:
+            columns.append(f"  c{i} INT64 NOT NULL")
+    return (
+        "CREATE TABLE `project.dataset.wide_table`\n(\n" + ",\n".join(columns) + "\n)\n"
+        "PARTITION BY DATE(_PARTITIONTIME)\nOPTIONS(\n  description=\"A wide table\",\n  labels=[(\"team\", \"data\")]\n);"
+    )
+
+
+def main():
+    print(f"{'layout':>8} {'columns':>8} {'regex (ms)':>12} {'parser (ms)':>12} {'regex result':>22} {'parser result':>22}")
+    for nested in (False, True):
+        for width in WIDTHS:
+            ddl = make_ddl(width, nested)
+            runs = max(3, 20000 // width)
+            regex_ms = min(timeit.repeat(lambda: regex_completeness(ddl), number=runs, repeat=3)) / runs * 1000
+            parser_ms = min(timeit.repeat(lambda: parse_ddl(ddl), number=runs, repeat=3)) / runs * 1000
+            parsed = parse_ddl(ddl)
+            regex_result = regex_completeness(ddl)
+            print(
+                f"{'nested' if nested else 'plain':>8} {width:>8} {regex_ms:>12.3f} {parser_ms:>12.3f} "
+                f"{str(regex_result):>22} {str((parsed.has_table_description, parsed.column_description_completeness)):>22}"
+            )
+
+
+if __name__ == "__main__":
+    main()